@@ -0,0 +1,823 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from api.backend_pool import (
+    DEFAULT_HEALTH_INTERVAL,
+    DEFAULT_HEALTH_PATH,
+    DEFAULT_ROUTING,
+    Backend,
+    BackendPool,
+)
+from api.GenerationCache import GenerationCache
+from api.resilience import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+    DEFAULT_RETRIES,
+    BackendUnavailableError,
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyBudget,
+    backoff_delay,
+)
+from metrics.registry import REGISTRY, Registry, flatten
+from metrics.sampled_log import DEFAULT_SAMPLE_RATE, SampledLogger
+
+_LOGGER = logging.getLogger(__name__)
+
+HEADERS = {"Accept": "application/json", "Encoding": "UTF-8"}
+STREAM_HEADERS = {"Accept": "text/event-stream"}
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_WARM_UP_CONNECTIONS = 4
+DEFAULT_PAGE_SIZE = 100
+# stops paging through context of chat api which ignores offset
+DEFAULT_MAX_PAGES = 1000
+DEFAULT_TIMEOUT = 60 * 3
+
+# Per endpoint timeouts in seconds, only generation is allowed to take long.
+DEFAULT_TIMEOUTS = {
+    "create_user": 10,
+    "get_user": 30,
+    "get_context_page": 30,
+    "add_message": DEFAULT_TIMEOUT,
+    "remove_user": 30,
+    "clear_history": 30,
+    "update_possible_context_id": 10,
+    "update_user_choice": 10,
+    "update_user_custom_choice": 10,
+    "register_answer": 10,
+}
+
+# Endpoints safe to send twice, only they are retried.
+IDEMPOTENT_ENDPOINTS = frozenset(
+    {"get_user", "get_context_page", "remove_user", "clear_history", "update_possible_context_id"}
+)
+# Reads which may be hedged by second request when first one is slower than usual.
+HEDGED_ENDPOINTS = frozenset({"get_user", "get_context_page"})
+
+
+def create_client(pool_size: int = DEFAULT_POOL_SIZE) -> httpx.AsyncClient:
+    """Create http client for chatbot API keeping up to pool_size connections alive.
+
+    Args:
+        pool_size: max number of open connections
+    """
+    return httpx.AsyncClient(
+        headers=HEADERS,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+    )
+
+
+@dataclass
+class GenerationChoiceResponse:
+    messages: list
+    answer_id: str
+
+    def __init__(self, messages, answer_id):
+        super().__init__()
+        self.messages = messages
+        self.answer_id = answer_id
+
+
+@dataclass
+class GenerationChunk:
+    """Part of generated answer, text is appended to answer with given index."""
+
+    index: int
+    text: str
+
+
+class ChatApiError(Exception):
+    """Chat api rejected request, answer status is not 2xx."""
+
+    def __init__(self, endpoint: str, status_code: int):
+        """
+        Args:
+            endpoint: name of endpoint
+            status_code: http status of answer
+        """
+        super().__init__(f"{endpoint} answered with status {status_code}")
+        self.endpoint = endpoint
+        self.status_code = status_code
+
+
+class UserNotFoundError(ChatApiError):
+    """Chat api does not know user."""
+
+
+def check_answer(endpoint: str, answer: httpx.Response) -> httpx.Response:
+    """Return successful answer of chat api.
+
+    Args:
+        endpoint: name of endpoint
+        answer: answer of chat api
+
+    Raises:
+        ChatApiError: answer status is not 2xx
+    """
+    if not answer.is_success:
+        raise ChatApiError(endpoint, answer.status_code)
+    return answer
+
+
+class AsyncChatBotAPI:
+    """Asyncio chatbot API client sharing one keep-alive connection pool between calls.
+
+    Every endpoint has its own circuit breaker and latency budget. Transport errors, timeouts and
+    5xx answers count as failures, idempotent endpoints are retried with jittered backoff and
+    BackendUnavailableError is raised when request finally fails or circuit is open.
+    Several replicas of chatbot API may be given, requests are routed between them by BackendPool.
+    """
+
+    # every resilience and routing setting is configurable from app.py environment
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        api_path: str | Sequence[str],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeouts: dict | None = None,
+        generation_cache: GenerationCache | None = None,
+        retries: int = DEFAULT_RETRIES,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        hedge: bool = False,
+        metrics: Registry | None = None,
+        log_sample_rate: float = DEFAULT_SAMPLE_RATE,
+        routing: str = DEFAULT_ROUTING,
+        health_interval: float = DEFAULT_HEALTH_INTERVAL,
+        health_path: str = DEFAULT_HEALTH_PATH,
+        client: httpx.AsyncClient | None = None,
+    ):
+        """
+        Args:
+            api_path: base url of chatbot API or base urls of its replicas
+            pool_size: max number of open connections to chatbot API
+            timeouts: per endpoint timeouts overriding DEFAULT_TIMEOUTS, upper bound of budgets
+            generation_cache: cache of generated answers, None disables caching
+            retries: max number of retries of idempotent requests
+            failure_threshold: consecutive failures opening endpoint circuit
+            reset_timeout: seconds endpoint circuit stays open
+            hedge: send second read request when first one is slower than p95
+            metrics: registry recording chat_api_request_* metrics, default one if None
+            log_sample_rate: share of generations logged
+            routing: how requests are routed between replicas: hash, least_outstanding or latency
+            health_interval: seconds between health checks of replicas, 0 disables them
+            health_path: path requested by health checks
+            client: http client shared with other bots, it is not closed by aclose, pool_size
+                should match its limits
+        """
+        urls = [api_path] if isinstance(api_path, str) else list(api_path)
+        self.api_path = urls[0]
+        self.backends = BackendPool(
+            urls, routing=routing, health_interval=health_interval, health_path=health_path
+        )
+        self.pool_size = pool_size
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.generation_cache = generation_cache
+        self.retries = retries
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.budgets: dict[str, LatencyBudget] = {}
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.metrics.add_collector("chat_api", self.collect_metrics)
+        self._log = SampledLogger(_LOGGER, log_sample_rate)
+        self._shared_client = client
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Lazily created http client, so it is bound to the loop which uses it first."""
+        if self._shared_client is not None:
+            return self._shared_client
+        if self._client is None or self._client.is_closed:
+            self._client = create_client(self.pool_size)
+        return self._client
+
+    async def warm_up(self, connections: int = DEFAULT_WARM_UP_CONNECTIONS):
+        """Open connections to every replica before first user request needs them.
+
+        Args:
+            connections: number of connections opened to every replica, capped by pool size
+        """
+        connections = min(connections, self.pool_size // len(self.backends))
+        if connections <= 0:
+            return
+        started = time.monotonic()
+        healthy = await asyncio.gather(
+            *(
+                self.backends.check(self.client, backend)
+                for backend in self.backends.backends
+                for _ in range(connections)
+            )
+        )
+        _LOGGER.info(
+            "Opened %s of %s connections to chatbot API in %.3fs",
+            sum(healthy),
+            len(healthy),
+            time.monotonic() - started,
+        )
+
+    async def aclose(self):
+        """Stop health checks and close all pooled connections."""
+        await self.backends.stop_health_checks()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        """Return circuit breaker of endpoint.
+
+        Args:
+            endpoint: name of endpoint
+        """
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self.breakers[endpoint] = breaker
+        return breaker
+
+    def budget(self, endpoint: str) -> LatencyBudget:
+        """Return latency budget of endpoint.
+
+        Args:
+            endpoint: name of endpoint
+        """
+        budget = self.budgets.get(endpoint)
+        if budget is None:
+            budget = LatencyBudget(self.timeouts.get(endpoint, DEFAULT_TIMEOUT))
+            self.budgets[endpoint] = budget
+        return budget
+
+    async def _request(
+        self, endpoint: str, method: str, path: str, user_id: str | None = None, **kwargs
+    ) -> httpx.Response:
+        """Send request to chatbot API within endpoint latency budget.
+
+        Args:
+            endpoint: name of endpoint, key of timeouts
+            method: http method
+            path: path relative to api_path
+            user_id: id of user request belongs to, routing key of replicas
+            **kwargs: arguments of httpx request
+        """
+        with self.metrics.track("chat_api_request", endpoint=endpoint):
+            return await self._request_with_retries(endpoint, method, path, user_id, **kwargs)
+
+    async def _request_with_retries(
+        self, endpoint: str, method: str, path: str, user_id: str | None, **kwargs
+    ) -> httpx.Response:
+        """Send request retrying idempotent endpoints while circuit is closed."""
+        breaker = self.breaker(endpoint)
+        attempts = 1 + (self.retries if endpoint in IDEMPOTENT_ENDPOINTS else 0)
+        error: Exception | None = None
+        for attempt in range(attempts):
+            if attempt:
+                self.metrics.inc("chat_api_retries_total", endpoint=endpoint)
+                await asyncio.sleep(backoff_delay(attempt - 1))
+            if not breaker.allow():
+                self.metrics.inc("chat_api_circuit_rejected_total", endpoint=endpoint)
+                raise CircuitOpenError(endpoint) from error
+            try:
+                if self.hedge and endpoint in HEDGED_ENDPOINTS:
+                    answer = await self._send_hedged(endpoint, method, path, user_id, **kwargs)
+                else:
+                    answer = await self._send(endpoint, method, path, user_id, **kwargs)
+                if answer.status_code >= 500:
+                    answer.raise_for_status()
+            except httpx.HTTPError as http_error:
+                error = http_error
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+                return answer
+            breaker.record_failure()
+        raise BackendUnavailableError(endpoint) from error
+
+    def _select_backend(self, endpoint: str, user_id: str | None) -> Backend:
+        """Return replica for request, health checks are started with first request."""
+        self.backends.start_health_checks(self.client)
+        return self.backends.select(endpoint, user_id)
+
+    async def _send(
+        self, endpoint: str, method: str, path: str, user_id: str | None, **kwargs
+    ) -> httpx.Response:
+        """Send one request observing its latency in endpoint budget."""
+        budget = self.budget(endpoint)
+        timeout = budget.timeout()
+        backend = self._select_backend(endpoint, user_id)
+        start = time.monotonic()
+        with self.backends.track(backend):
+            try:
+                answer = await self.client.request(
+                    method, f"{backend.url}{path}", timeout=timeout, **kwargs
+                )
+            except httpx.HTTPError as error:
+                if isinstance(error, httpx.TimeoutException):
+                    budget.observe(timeout)
+                self.backends.record_failure(backend)
+                raise
+        if answer.status_code < 500:
+            latency = time.monotonic() - start
+            budget.observe(latency)
+            backend.observe(endpoint, latency)
+        else:
+            self.backends.record_failure(backend)
+        return answer
+
+    async def _send_hedged(
+        self, endpoint: str, method: str, path: str, user_id: str | None, **kwargs
+    ) -> httpx.Response:
+        """Send request and second one if first is not answered within p95 latency.
+
+        Return first successful answer, the other request is cancelled. Second request is routed
+        by latency, so with several replicas it usually goes to another one.
+        """
+        delay = self.budget(endpoint).p95()
+        if delay is None:
+            return await self._send(endpoint, method, path, user_id, **kwargs)
+
+        tasks = {asyncio.create_task(self._send(endpoint, method, path, user_id, **kwargs))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.metrics.inc("chat_api_hedged_total", endpoint=endpoint)
+                tasks.add(asyncio.create_task(self._send(endpoint, method, path, None, **kwargs)))
+            return await self._first_answer(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _first_answer(tasks: set[asyncio.Task]) -> httpx.Response:
+        """Return first successful answer of requests, failure of the first one if all fail."""
+        pending = tasks
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    return task.result()
+            if not pending:
+                return next(iter(done)).result()
+
+    def collect_metrics(self):
+        """Yield circuit breaker, latency budget, replica and generation cache samples."""
+        for endpoint, breaker in self.breakers.items():
+            labels = {"endpoint": endpoint}
+            yield "chat_api_circuit_open", labels, int(breaker.state != breaker.CLOSED)
+            yield "chat_api_timeout_seconds", labels, self.budget(endpoint).timeout()
+        if len(self.backends) > 1:
+            yield from self.backends.collect_metrics()
+        if self.generation_cache is not None:
+            yield from flatten("generation_cache", self.generation_cache.metrics())
+
+    async def create_user(self, telegram_user_id: str, username: str, chat_id: str):
+        """Create new user
+        Args:
+            telegram_user_id: user id
+            username: telegram username
+            chat_id: unique chat id
+
+        Raises:
+            ChatApiError: chat api rejected user
+        """
+        answer = await self._request(
+            "create_user",
+            "POST",
+            "/users",
+            user_id=telegram_user_id,
+            json={"username": username, "user_id": telegram_user_id, "chat_id": chat_id},
+        )
+        if answer.status_code == 409:
+            # user exists, e.g. registry of created users was lost
+            return json.dumps(answer.json(), ensure_ascii=False)
+        user = check_answer("create_user", answer).json()
+        if self.generation_cache is not None:
+            if isinstance(user, dict) and user.get("context") == []:
+                self.generation_cache.reset_context(telegram_user_id)
+        return json.dumps(user, ensure_ascii=False)
+
+    async def get_user(self, telegram_user_id: str) -> Any:
+        """Return user entity :param telegram_user_id:
+
+        :ctx update:
+        """
+        answer = await self._request(
+            "get_user", "GET", f"/users/{telegram_user_id}", user_id=telegram_user_id
+        )
+        if answer.status_code == 404:
+            raise UserNotFoundError("get_user", answer.status_code)
+        return check_answer("get_user", answer).json()
+
+    async def get_context_page(
+        self, telegram_user_id: str, offset: int, limit: int = DEFAULT_PAGE_SIZE
+    ) -> list | None:
+        """Return page of user context messages, None if chat api does not support pages.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            offset: index of first message
+            limit: max number of messages
+
+        Raises:
+            UserNotFoundError: user is not known to chat api
+            ChatApiError: chat api rejected request
+        """
+        answer = await self._request(
+            "get_context_page",
+            "GET",
+            f"/users/{telegram_user_id}/context",
+            user_id=telegram_user_id,
+            params={"offset": offset, "limit": limit},
+        )
+        if answer.status_code == 404:
+            raise UserNotFoundError("get_context_page", answer.status_code)
+        if answer.status_code == 405:
+            return None
+        return check_answer("get_context_page", answer).json()["context"]
+
+    async def iter_context(
+        self,
+        telegram_user_id: str,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_pages: int = DEFAULT_MAX_PAGES,
+    ) -> AsyncIterator[dict]:
+        """Yield user context messages fetching them page by page.
+
+        Falls back to whole user entity if chat api does not support pages. Paging stops at page
+        equal to previous one, as chat api ignoring offset returns the same page again, and after
+        max_pages pages.
+        Args:
+            telegram_user_id: id of user in telegram
+            page_size: number of messages fetched at once
+            max_pages: max number of fetched pages
+
+        Raises:
+            UserNotFoundError: user is not known to chat api
+        """
+        offset = 0
+        previous = None
+        for _ in range(max_pages):
+            page = await self.get_context_page(telegram_user_id, offset, page_size)
+            if page is None:
+                if not offset:
+                    for message in (await self.get_user(telegram_user_id))["context"]:
+                        yield message
+                return
+            if page == previous:
+                _LOGGER.warning("Chat api ignores offset of context pages, history is cut")
+                return
+            for message in page:
+                yield message
+            if len(page) < page_size:
+                return
+            offset += len(page)
+            previous = page
+        _LOGGER.warning("Context of user has more than %s pages, history is cut", max_pages)
+
+    async def add_message(self, telegram_user_id: str, text: str):
+        """Send to chat api request to generate answer based on conversation.
+
+        With generation cache answers for the same prompt in the same conversation state are
+        reused and only registered in user context.
+        Args:
+            telegram_user_id: id of user in telegram
+            text: user message
+        """
+        if self.generation_cache is None:
+            return await self._generate(telegram_user_id, text)
+
+        key = self.generation_cache.key(telegram_user_id, text)
+        if key is None:
+            self.generation_cache.bypassed += 1
+            return await self._generate(telegram_user_id, text)
+
+        response = await self.generation_cache.get_or_generate(
+            key,
+            generate=lambda: self._generate(telegram_user_id, text),
+            register=lambda messages: self.register_answer(telegram_user_id, text, messages),
+        )
+        if response is not None:
+            self.generation_cache.extend_context(telegram_user_id, "user", text)
+        return response
+
+    async def _generate(self, telegram_user_id: str, text: str):
+        """Generate answers by LLM, return None if chat api is not available.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            text: user message
+
+        Raises:
+            ChatApiError: chat api rejected request
+        """
+        try:
+            answer = await self._request(
+                "add_message",
+                "PATCH",
+                f"/users/{telegram_user_id}/context/generate",
+                user_id=telegram_user_id,
+                json={
+                    "text": text,
+                },
+            )
+        except BackendUnavailableError:
+            return None
+        response = GenerationChoiceResponse(**check_answer("add_message", answer).json())
+        self._log.info(
+            "generation",
+            user=telegram_user_id,
+            answer_id=response.answer_id,
+            variants=len(response.messages),
+            chars=sum(len(message) for message in response.messages),
+        )
+        return response
+
+    async def register_answer(
+        self, telegram_user_id: str, text: str, messages: list[str]
+    ) -> GenerationChoiceResponse | None:
+        """Add user message and already generated answers to user context.
+
+        Return None if chat api does not support registering answers or is not available, answers
+        are generated again then.
+        Args:
+            telegram_user_id: id of user in telegram
+            text: user message
+            messages: generated answers
+
+        Raises:
+            ChatApiError: chat api rejected request
+        """
+        try:
+            answer = await self._request(
+                "register_answer",
+                "POST",
+                f"/users/{telegram_user_id}/context/answers",
+                user_id=telegram_user_id,
+                json={"text": text, "messages": messages},
+            )
+        except BackendUnavailableError:
+            return None
+        if answer.status_code == 405:
+            return None
+        check_answer("register_answer", answer)
+        if not answer.content:
+            # answers are stored without id, they are shown but choice of user is not sent
+            return GenerationChoiceResponse(messages=messages, answer_id=None)
+        return GenerationChoiceResponse(**answer.json())
+
+    async def stream_message(
+        self, telegram_user_id: str, text: str
+    ) -> AsyncIterator[GenerationChunk | GenerationChoiceResponse]:
+        """Send to chat api request to generate answer and read it as server-sent events.
+
+        Yields GenerationChunk for every generated piece of text and GenerationChoiceResponse with
+        whole answers when generation is done. Generation failed if stream ends without it.
+        Cached answers are yielded at once.
+        Args:
+            telegram_user_id: id of user in telegram
+            text: user message
+        """
+        key = None
+        if self.generation_cache is not None:
+            key = self.generation_cache.key(telegram_user_id, text)
+            messages = self.generation_cache.get(key) if key is not None else None
+            if messages is not None:
+                response = await self.register_answer(telegram_user_id, text, messages)
+                if response is not None:
+                    self.generation_cache.hits += 1
+                    self.generation_cache.extend_context(telegram_user_id, "user", text)
+                    yield response
+                    return
+
+        generated = False
+        with self.metrics.track("chat_api_request", endpoint="stream_message"):
+            async for item in self._stream(telegram_user_id, text):
+                if isinstance(item, GenerationChoiceResponse):
+                    generated = True
+                    self._update_cache(key, telegram_user_id, text, item.messages)
+                yield item
+        if not generated:
+            self.metrics.inc("chat_api_request_errors_total", endpoint="stream_message")
+
+    def _update_cache(self, key: tuple | None, telegram_user_id: str, text: str, messages):
+        """Store streamed answers in generation cache."""
+        if self.generation_cache is None:
+            return
+        if key is not None:
+            self.generation_cache.misses += 1
+            self.generation_cache.put(key, messages)
+        else:
+            self.generation_cache.bypassed += 1
+        self.generation_cache.extend_context(telegram_user_id, "user", text)
+
+    async def _stream(
+        self, telegram_user_id: str, text: str
+    ) -> AsyncIterator[GenerationChunk | GenerationChoiceResponse]:
+        """Generate answers by LLM reading them as server-sent events.
+
+        Stream ends without answers if chat api is not available. Generation shares circuit
+        breaker with add_message, timeout applies to every read so budget is not used.
+        Args:
+            telegram_user_id: id of user in telegram
+            text: user message
+        """
+        breaker = self.breaker("add_message")
+        if not breaker.allow():
+            return
+        backend = self._select_backend("stream_message", telegram_user_id)
+
+        def record_failure():
+            breaker.record_failure()
+            self.backends.record_failure(backend)
+
+        def record_success():
+            breaker.record_success()
+            backend.observe("stream_message", time.monotonic() - start)
+
+        start = time.monotonic()
+        generated = False
+        try:
+            with self.backends.track(backend):
+                async with self.client.stream(
+                    "PATCH",
+                    f"{backend.url}/users/{telegram_user_id}/context/generate",
+                    headers=STREAM_HEADERS,
+                    timeout=self.timeouts.get("add_message", DEFAULT_TIMEOUT),
+                    json={"text": text, "stream": True},
+                ) as answer:
+                    async for item in self._read_stream(answer):
+                        if isinstance(item, GenerationChoiceResponse):
+                            # recorded before yield, consumer usually stops reading after it
+                            generated = True
+                            record_success()
+                        yield item
+        except httpx.HTTPError:
+            record_failure()
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            breaker.release()
+            raise
+        if generated:
+            return
+        if answer.status_code != 200 and answer.status_code < 500:
+            # request is rejected, chat api itself is available
+            breaker.record_success()
+        else:
+            record_failure()
+
+    @staticmethod
+    async def _read_stream(
+        answer: httpx.Response,
+    ) -> AsyncIterator[GenerationChunk | GenerationChoiceResponse]:
+        """Yield generated chunks and whole answers read from generation response.
+
+        Stream ends without answers if generation failed or was rejected. Chat api ignoring
+        stream flag answers with JSON body, its answers are yielded at once.
+        Args:
+            answer: response of chat api
+        """
+        if answer.status_code != 200:
+            return
+        if answer.headers.get("content-type", "").startswith("application/json"):
+            await answer.aread()
+            yield GenerationChoiceResponse(**answer.json())
+            return
+        event = "message"
+        async for line in answer.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:") :].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:") :])
+                if event == "done":
+                    yield GenerationChoiceResponse(**data)
+                    return
+                if event == "error":
+                    return
+                yield GenerationChunk(**data)
+            elif not line:
+                event = "message"
+
+    async def remove_user(self, telegram_user_id: str):
+        """
+        Remove user from database by telegram id
+        Args:
+            telegram_user_id: id of user in telegram
+
+        Raises:
+            ChatApiError: chat api rejected request
+        """
+        answer = await self._request(
+            "remove_user", "DELETE", f"/dialog/{telegram_user_id}", user_id=telegram_user_id
+        )
+        if self.generation_cache is not None:
+            self.generation_cache.forget_context(telegram_user_id)
+        return json.dumps(check_answer("remove_user", answer).json(), ensure_ascii=False)
+
+    async def clear_history(self, telegram_user_id: str):
+        """Clear user message history.
+
+        Args:
+            telegram_user_id: id of user in telegram
+
+        Raises:
+            ChatApiError: chat api rejected request
+        """
+        answer = await self._request(
+            "clear_history",
+            "DELETE",
+            f"/users/{telegram_user_id}/context",
+            user_id=telegram_user_id,
+        )
+        if self.generation_cache is not None:
+            if answer.status_code == 200:
+                self.generation_cache.reset_context(telegram_user_id)
+            else:
+                self.generation_cache.forget_context(telegram_user_id)
+        return json.dumps(check_answer("clear_history", answer).json(), ensure_ascii=False)
+
+    async def update_possible_context_id(
+        self, telegram_user_id: str, answer_id: str, possible_contexts_ids: list[str]
+    ):
+        """Update possible context id in message.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            possible_contexts_ids: possible message id that user will choose
+            answer_id: database id on answer
+
+        Raises:
+            ChatApiError: chat api rejected request
+        """
+        answer = await self._request(
+            "update_possible_context_id",
+            "POST",
+            f"/users/{telegram_user_id}/context/{answer_id}/possible_contexts_ids",
+            user_id=telegram_user_id,
+            json={"possible_contexts_ids": possible_contexts_ids},
+        )
+        answer = check_answer("update_possible_context_id", answer)
+        return json.dumps(answer.json(), ensure_ascii=False)
+
+    async def update_user_choice(self, telegram_user_id: str, answer_id: str, message_id: str):
+        """Update possible context id in message.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            message_id: message id to update
+            answer_id: id of answer
+
+        Raises:
+            ChatApiError: chat api rejected choice
+        """
+        answer = await self._request(
+            "update_user_choice",
+            "POST",
+            f"/users/{telegram_user_id}/context/{answer_id}/user_choice",
+            user_id=telegram_user_id,
+            json={"message_id": message_id},
+        )
+        text = check_answer("update_user_choice", answer).json()["text"]
+        if self.generation_cache is not None:
+            self.generation_cache.extend_context(telegram_user_id, "choice", text)
+        return text
+
+    async def update_user_custom_choice(
+        self, telegram_user_id: str, message_id: str, custom_text: str
+    ):
+        """Update possible context id in message.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            message_id: id of message you want to improve
+            custom_text: replace bad message with your text
+
+        Raises:
+            ChatApiError: chat api rejected custom answer
+        """
+        answer = await self._request(
+            "update_user_custom_choice",
+            "POST",
+            f"/users/{telegram_user_id}/context/messages/custom_answer",
+            user_id=telegram_user_id,
+            json={"message_id": message_id, "custom_text": custom_text},
+        )
+        check_answer("update_user_custom_choice", answer)
+        if self.generation_cache is not None:
+            self.generation_cache.extend_context(
+                telegram_user_id, "custom", str(message_id), custom_text
+            )
+        return json.dumps(answer.json(), ensure_ascii=False)
@@ -1,29 +1,82 @@
-import json
-from dataclasses import dataclass
-from typing import Any
-
-import requests
-
-HEADERS = {"Accept": "application/json", "Encoding": "UTF-8"}
+from __future__ import annotations
 
+import asyncio
+import threading
+from collections.abc import Sequence
+from typing import Any
 
-@dataclass
-class GenerationChoiceResponse:
-    messages: list
-    answer_id: str
-
-    def __init__(self, messages, answer_id):
-        super().__init__()
-        self.messages = messages
-        self.answer_id = answer_id
+from api.AsyncChatBotAPI import (
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_POOL_SIZE,
+    HEADERS,
+    AsyncChatBotAPI,
+    GenerationChoiceResponse,
+)
+from api.backend_pool import (
+    DEFAULT_HEALTH_INTERVAL,
+    DEFAULT_HEALTH_PATH,
+    DEFAULT_ROUTING,
+)
+from api.GenerationCache import GenerationCache
+from api.resilience import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+    DEFAULT_RETRIES,
+)
+
+# HEADERS and GenerationChoiceResponse were defined here before asyncio client, old imports work
+__all__ = ["HEADERS", "ChatBotAPI", "GenerationChoiceResponse"]
 
 
 class ChatBotAPI:
-    """Class using to interact with chatbot API."""
-
-    def __init__(self, api_path: str):
+    """Class using to interact with chatbot API.
+
+    Synchronous wrapper around AsyncChatBotAPI, requests are executed on a background event loop
+    so connection pool is kept alive between calls.
+    """
+
+    # arguments mirror AsyncChatBotAPI
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        api_path: str | Sequence[str],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeouts: dict | None = None,
+        generation_cache: GenerationCache | None = None,
+        retries: int = DEFAULT_RETRIES,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        hedge: bool = False,
+        routing: str = DEFAULT_ROUTING,
+        health_interval: float = DEFAULT_HEALTH_INTERVAL,
+        health_path: str = DEFAULT_HEALTH_PATH,
+    ):
         self.api_path = api_path
-        self.timeout = 60 * 3
+        self.async_api = AsyncChatBotAPI(
+            api_path,
+            pool_size=pool_size,
+            timeouts=timeouts,
+            generation_cache=generation_cache,
+            retries=retries,
+            failure_threshold=failure_threshold,
+            reset_timeout=reset_timeout,
+            hedge=hedge,
+            routing=routing,
+            health_interval=health_interval,
+            health_path=health_path,
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def _run(self, coro) -> Any:
+        """Run coroutine on background loop and wait for result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        """Close connection pool and stop background loop."""
+        self._run(self.async_api.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
 
     def create_user(self, telegram_user_id: str, username: str, chat_id: str):
         """Create new user
@@ -32,45 +85,39 @@ class ChatBotAPI:
             username: telegram username
             chat_id: unique chat id
         """
-        path = f"{self.api_path}/users"
-        answer = requests.post(
-            path,
-            json={"username": username, "user_id": telegram_user_id, "chat_id": chat_id},
-            headers=HEADERS,
-            timeout=self.timeout,
+        return self._run(
+            self.async_api.create_user(
+                telegram_user_id=telegram_user_id, username=username, chat_id=chat_id
+            )
         )
-        return json.dumps(answer.json(), ensure_ascii=False)
 
     def get_user(self, telegram_user_id: str) -> Any:
         """Return user entity :param telegram_user_id:
 
         :ctx update:
         """
-        path = f"{self.api_path}/users/{telegram_user_id}"
-        answer = requests.get(path, headers=HEADERS, timeout=self.timeout)
-        return answer.json()
+        return self._run(self.async_api.get_user(telegram_user_id))
+
+    def get_context_page(
+        self, telegram_user_id: str, offset: int, limit: int = DEFAULT_PAGE_SIZE
+    ) -> list | None:
+        """Return page of user context messages, None if chat api does not support pages.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            offset: index of first message
+            limit: max number of messages
+        """
+        return self._run(self.async_api.get_context_page(telegram_user_id, offset, limit))
 
     def add_message(self, telegram_user_id: str, text: str):
-        """Clear history command handler.
+        """Send to chat api request to generate answer based on conversation.
 
-        Send to chat api request to generate answer based on conversation
         Args:
             telegram_user_id: id of user in telegram
             text: user message
         """
-        path = f"{self.api_path}/users/{telegram_user_id}/context/generate"
-        answer = requests.patch(
-            path,
-            headers=HEADERS,
-            timeout=self.timeout,
-            json={
-                "text": text,
-            },
-        )
-        if answer.status_code == 500:
-            return None
-        print(answer.json())
-        return GenerationChoiceResponse(**answer.json())
+        return self._run(self.async_api.add_message(telegram_user_id, text))
 
     def remove_user(self, telegram_user_id: str):
         """
@@ -78,9 +125,7 @@ class ChatBotAPI:
         Args:
             telegram_user_id: id of user in telegram
         """
-        path = f"{self.api_path}/dialog/{telegram_user_id}"
-        answer = requests.delete(path, headers=HEADERS, timeout=self.timeout)
-        return json.dumps(answer.json(), ensure_ascii=False)
+        return self._run(self.async_api.remove_user(telegram_user_id))
 
     def clear_history(self, telegram_user_id: str):
         """Clear user message history.
@@ -88,9 +133,7 @@ class ChatBotAPI:
         Args:
             telegram_user_id: id of user in telegram
         """
-        path = f"{self.api_path}/users/{telegram_user_id}/context"
-        answer = requests.delete(path, headers=HEADERS, timeout=self.timeout)
-        return json.dumps(answer.json(), ensure_ascii=False)
+        return self._run(self.async_api.clear_history(telegram_user_id))
 
     def update_possible_context_id(
         self, telegram_user_id: str, answer_id: str, possible_contexts_ids: list[str]
@@ -102,17 +145,11 @@ class ChatBotAPI:
             possible_contexts_ids: possible message id that user will choose
             answer_id: database id on answer
         """
-
-        path = (
-            f"{self.api_path}/users/{telegram_user_id}/context/{answer_id}/possible_contexts_ids"
-        )
-        answer = requests.post(
-            path,
-            json={"possible_contexts_ids": possible_contexts_ids},
-            headers=HEADERS,
-            timeout=self.timeout,
+        return self._run(
+            self.async_api.update_possible_context_id(
+                telegram_user_id, answer_id, possible_contexts_ids=possible_contexts_ids
+            )
         )
-        return json.dumps(answer.json(), ensure_ascii=False)
 
     def update_user_choice(self, telegram_user_id: str, answer_id: str, message_id: str):
         """Update possible context id in message.
@@ -122,12 +159,11 @@ class ChatBotAPI:
             message_id: message id to update
             answer_id: id of answer
         """
-
-        path = f"{self.api_path}/users/{telegram_user_id}/context/{answer_id}/user_choice"
-        answer = requests.post(
-            path, json={"message_id": message_id}, headers=HEADERS, timeout=self.timeout
-        ).json()
-        return answer["text"]
+        return self._run(
+            self.async_api.update_user_choice(
+                telegram_user_id=telegram_user_id, answer_id=answer_id, message_id=message_id
+            )
+        )
 
     def update_user_custom_choice(self, telegram_user_id: str, message_id: str, custom_text: str):
         """Update possible context id in message.
@@ -137,12 +173,8 @@ class ChatBotAPI:
             message_id: id of message you want to improve
             custom_text: replace bad message with your text
         """
-
-        path = f"{self.api_path}/users/{telegram_user_id}/context/messages/custom_answer"
-        answer = requests.post(
-            path,
-            json={"message_id": message_id, "custom_text": custom_text},
-            headers=HEADERS,
-            timeout=self.timeout,
+        return self._run(
+            self.async_api.update_user_custom_choice(
+                telegram_user_id=telegram_user_id, message_id=message_id, custom_text=custom_text
+            )
         )
-        return json.dumps(answer.json(), ensure_ascii=False)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 60 * 60
+DEFAULT_CONTEXTS_SIZE = 100_000
+
+# fingerprint of empty conversation, right after user is created or history is cleared
+EMPTY_CONTEXT = hashlib.sha1(b"").hexdigest()
+
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " .,!?;:…\"'«»()"
+
+
+def normalize_prompt(text: str) -> str:
+    """Return prompt in form equal for messages differing only in case, spaces and punctuation.
+
+    Args:
+        text: user message
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _SPACES.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+class GenerationCache:
+    """Cache of generated answers keyed on normalized prompt and conversation fingerprint.
+
+    Conversation fingerprint is a hash chain of everything known to change user context: prompts,
+    chosen and custom answers. Users with unknown context (e.g. after bot restart) are not cached
+    until their history is cleared. Identical requests generated at the same time share one
+    backend call.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        ttl: float = DEFAULT_CACHE_TTL,
+        max_contexts: int = DEFAULT_CONTEXTS_SIZE,
+    ):
+        """
+        Args:
+            max_size: max number of cached answers
+            ttl: seconds answer stays in cache
+            max_contexts: max number of users whose conversation fingerprint is remembered
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_contexts = max_contexts
+        self._answers: OrderedDict = OrderedDict()
+        self._contexts: OrderedDict = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+        self.bypassed = 0
+
+    def fingerprint(self, telegram_user_id: str) -> str | None:
+        """Return fingerprint of user conversation, None if it is unknown.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+        fingerprint = self._contexts.get(telegram_user_id)
+        if fingerprint is not None:
+            self._contexts.move_to_end(telegram_user_id)
+        return fingerprint
+
+    def _set_fingerprint(self, telegram_user_id: str, fingerprint: str | None):
+        if fingerprint is None:
+            self._contexts.pop(telegram_user_id, None)
+            return
+        self._contexts[telegram_user_id] = fingerprint
+        self._contexts.move_to_end(telegram_user_id)
+        while len(self._contexts) > self.max_contexts:
+            self._contexts.popitem(last=False)
+
+    def reset_context(self, telegram_user_id: str):
+        """Mark user conversation as empty.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+        self._set_fingerprint(telegram_user_id, EMPTY_CONTEXT)
+
+    def forget_context(self, telegram_user_id: str):
+        """Mark user conversation as unknown.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+        self._set_fingerprint(telegram_user_id, None)
+
+    def extend_context(self, telegram_user_id: str, *parts: str):
+        """Fold conversation change into user fingerprint.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            parts: description of change
+        """
+        fingerprint = self._contexts.get(telegram_user_id)
+        if fingerprint is None:
+            return
+        digest = hashlib.sha1(fingerprint.encode())
+        for part in parts:
+            digest.update(b"\0" + part.encode())
+        self._set_fingerprint(telegram_user_id, digest.hexdigest())
+
+    def get(self, key: tuple) -> list | None:
+        """Return cached answers or None.
+
+        Args:
+            key: cache key
+        """
+        item = self._answers.get(key)
+        if item is None:
+            return None
+        expire_at, messages = item
+        if expire_at < time.monotonic():
+            del self._answers[key]
+            return None
+        self._answers.move_to_end(key)
+        return messages
+
+    def put(self, key: tuple, messages: list):
+        """Store generated answers.
+
+        Args:
+            key: cache key
+            messages: generated answers
+        """
+        self._answers[key] = (time.monotonic() + self.ttl, list(messages))
+        self._answers.move_to_end(key)
+        while len(self._answers) > self.max_size:
+            self._answers.popitem(last=False)
+
+    def key(self, telegram_user_id: str, text: str) -> tuple | None:
+        """Return cache key of user message, None if user conversation is unknown.
+
+        Args:
+            telegram_user_id: id of user in telegram
+            text: user message
+        """
+        fingerprint = self.fingerprint(telegram_user_id)
+        if fingerprint is None:
+            return None
+        return normalize_prompt(text), fingerprint
+
+    async def get_or_generate(
+        self,
+        key: tuple,
+        generate: Callable[[], Awaitable],
+        register: Callable[[list], Awaitable],
+    ):
+        """Return response for cached answers or generate it, sharing concurrent generations.
+
+        Args:
+            key: cache key
+            generate: coroutine function generating answers for this user
+            register: coroutine function storing given answers in this user context, returns
+                None if it failed
+        """
+        messages = self.get(key)
+        cached = messages is not None
+        if not cached:
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                return await self._generate(key, generate)
+            self.merged += 1
+            messages = await asyncio.shield(waiter)
+            if messages is None:
+                return await self._fallback(generate)
+
+        response = await register(messages)
+        if response is None:
+            return await self._fallback(generate)
+        if cached:
+            self.hits += 1
+        return response
+
+    async def _fallback(self, generate: Callable[[], Awaitable]):
+        """Generate answers for this user only, when shared or cached ones can not be used."""
+        self.misses += 1
+        return await generate()
+
+    async def _generate(self, key: tuple, generate: Callable[[], Awaitable]):
+        """Generate answers and share them with identical requests waiting for them."""
+        self.misses += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._inflight[key] = waiter
+        messages = None
+        try:
+            response = await generate()
+            if response is not None:
+                messages = response.messages
+                self.put(key, messages)
+            return response
+        finally:
+            del self._inflight[key]
+            waiter.set_result(messages)
+
+    def metrics(self) -> dict:
+        """Return hit and miss counters."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "merged": self.merged,
+            "bypassed": self.bypassed,
+            "size": len(self._answers),
+        }
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import math
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+
+import httpx
+
+_LOGGER = logging.getLogger(__name__)
+
+ROUTING_HASH = "hash"
+ROUTING_LEAST_OUTSTANDING = "least_outstanding"
+ROUTING_LATENCY = "latency"
+ROUTINGS = (ROUTING_HASH, ROUTING_LEAST_OUTSTANDING, ROUTING_LATENCY)
+
+DEFAULT_ROUTING = ROUTING_HASH
+DEFAULT_LOAD_FACTOR = 1.25
+DEFAULT_VIRTUAL_NODES = 100
+DEFAULT_HEALTH_INTERVAL = 10.0
+DEFAULT_HEALTH_TIMEOUT = 2.0
+DEFAULT_HEALTH_PATH = "/"
+DEFAULT_EJECT_FAILURES = 3
+DEFAULT_EJECT_TIME = 30.0
+LATENCY_SMOOTHING = 0.2
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class Backend:
+    """Replica of chatbot API with its load, latency and health."""
+
+    def __init__(self, url: str):
+        """
+        Args:
+            url: base url of replica
+        """
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        # smoothed latency by endpoint, generation is much slower than other requests
+        self.latencies: dict[str, float] = {}
+        self.healthy = True
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+
+    @property
+    def available(self) -> bool:
+        """Replica passed last health check and is not ejected after failures."""
+        return self.healthy and time.monotonic() >= self.ejected_until
+
+    def observe(self, endpoint: str, latency: float):
+        """Smooth latency of successful request.
+
+        Args:
+            endpoint: name of endpoint
+            latency: seconds request took
+        """
+        self.failures = 0
+        previous = self.latencies.get(endpoint)
+        if previous is None:
+            self.latencies[endpoint] = latency
+        else:
+            self.latencies[endpoint] = previous + LATENCY_SMOOTHING * (latency - previous)
+
+    def score(self, endpoint: str) -> float:
+        """Expected wait of new request to endpoint, untried replica is preferred.
+
+        Args:
+            endpoint: name of endpoint
+        """
+        return self.latencies.get(endpoint, 0.0) * (self.outstanding + 1)
+
+
+class BackendPool:
+    """Route chatbot API requests between replicas.
+
+    With hash routing user sticks to replica found by consistent hashing of user id, so its
+    context stays warm there. Replica is skipped while it has more than load_factor times average
+    outstanding requests, so one busy user does not overload it. Other routings pick replica with
+    least outstanding requests or least expected wait from smoothed latency.
+    Replicas failing health checks or several requests in a row are out of rotation, when every
+    replica is out requests go to all of them.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        routing: str = DEFAULT_ROUTING,
+        load_factor: float = DEFAULT_LOAD_FACTOR,
+        health_interval: float = DEFAULT_HEALTH_INTERVAL,
+        health_timeout: float = DEFAULT_HEALTH_TIMEOUT,
+        health_path: str = DEFAULT_HEALTH_PATH,
+        eject_failures: int = DEFAULT_EJECT_FAILURES,
+        eject_time: float = DEFAULT_EJECT_TIME,
+    ):
+        """
+        Args:
+            urls: base urls of replicas
+            routing: hash, least_outstanding or latency
+            load_factor: max outstanding requests of replica relative to average, hash routing
+            health_interval: seconds between health checks, 0 disables them
+            health_timeout: seconds replica has to answer health check, slower one is out
+            health_path: path requested by health check, any answer below 500 is healthy
+            eject_failures: consecutive failed requests taking replica out of rotation
+            eject_time: seconds replica is out after failed requests
+        """
+        if not urls:
+            raise ValueError("at least one chatbot API url is required")
+        if routing not in ROUTINGS:
+            raise ValueError(f"unknown routing {routing}, expected one of {ROUTINGS}")
+        self.backends = [Backend(url) for url in urls]
+        self.routing = routing
+        self.load_factor = load_factor
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.health_path = health_path
+        self.eject_failures = eject_failures
+        self.eject_time = eject_time
+        self._ring = sorted(
+            (_hash(f"{backend.url}#{node}"), index)
+            for index, backend in enumerate(self.backends)
+            for node in range(DEFAULT_VIRTUAL_NODES)
+        )
+        self._ring_hashes = [point for point, _ in self._ring]
+        self._health_task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def _candidates(self) -> list[Backend]:
+        available = [backend for backend in self.backends if backend.available]
+        return available or self.backends
+
+    def select(self, endpoint: str, key: str | None = None) -> Backend:
+        """Return replica for next request.
+
+        Args:
+            endpoint: name of endpoint
+            key: user id requests of which stick to one replica with hash routing
+        """
+        if len(self.backends) == 1:
+            return self.backends[0]
+        candidates = self._candidates()
+        if self.routing == ROUTING_LEAST_OUTSTANDING:
+            return min(candidates, key=lambda backend: backend.outstanding)
+        if self.routing == ROUTING_LATENCY or key is None:
+            return min(candidates, key=lambda backend: backend.score(endpoint))
+
+        total = sum(backend.outstanding for backend in candidates) + 1
+        limit = math.ceil(self.load_factor * total / len(candidates))
+        start = bisect.bisect(self._ring_hashes, _hash(key))
+        for offset in range(len(self._ring)):
+            backend = self.backends[self._ring[(start + offset) % len(self._ring)][1]]
+            if backend.outstanding < limit and backend in candidates:
+                return backend
+        return min(candidates, key=lambda backend: backend.outstanding)
+
+    @contextmanager
+    def track(self, backend: Backend) -> Iterator[None]:
+        """Count request to replica as outstanding while block runs.
+
+        Args:
+            backend: replica request is sent to
+        """
+        backend.outstanding += 1
+        backend.requests += 1
+        try:
+            yield
+        finally:
+            backend.outstanding -= 1
+
+    def record_failure(self, backend: Backend):
+        """Count failed request, replica is ejected after several of them in a row.
+
+        Args:
+            backend: replica request failed on
+        """
+        if len(self.backends) == 1:
+            return
+        backend.failures += 1
+        if backend.failures >= self.eject_failures:
+            backend.failures = 0
+            backend.ejected_until = time.monotonic() + self.eject_time
+            _LOGGER.warning("Chatbot API %s is out of rotation after failures", backend.url)
+
+    def start_health_checks(self, client: httpx.AsyncClient):
+        """Start health checks on running loop unless they are running or disabled.
+
+        Args:
+            client: http client used for checks
+        """
+        if self._health_task is not None or self.health_interval <= 0 or len(self) == 1:
+            return
+        self._health_task = asyncio.create_task(self._check_loop(client))
+
+    async def stop_health_checks(self):
+        """Stop health checks."""
+        task, self._health_task = self._health_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _check_loop(self, client: httpx.AsyncClient):
+        while True:
+            await asyncio.gather(*(self.check(client, backend) for backend in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    async def check(self, client: httpx.AsyncClient, backend: Backend) -> bool:
+        """Check replica answers within health timeout, update and return its health.
+
+        Args:
+            client: http client used for check
+            backend: checked replica
+        """
+        try:
+            answer = await client.get(
+                f"{backend.url}{self.health_path}", timeout=self.health_timeout
+            )
+            healthy = answer.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != backend.healthy:
+            _LOGGER.warning(
+                "Chatbot API %s is %s", backend.url, "healthy" if healthy else "out of rotation"
+            )
+        backend.healthy = healthy
+        return healthy
+
+    def collect_metrics(self) -> Iterator[tuple[str, dict, float]]:
+        """Yield load, latency and health samples of replicas."""
+        for backend in self.backends:
+            labels = {"backend": backend.url}
+            yield "chat_api_backend_outstanding", labels, backend.outstanding
+            yield "chat_api_backend_available", labels, int(backend.available)
+            yield "chat_api_backend_requests", labels, backend.requests
+            for endpoint, latency in backend.latencies.items():
+                yield "chat_api_backend_latency_seconds", {**labels, "endpoint": endpoint}, latency
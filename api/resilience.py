@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import random
+import time
+from collections import deque
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_BASE = 0.2
+DEFAULT_BACKOFF_MAX = 2.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_BUDGET_WINDOW = 200
+DEFAULT_BUDGET_MULTIPLIER = 3.0
+DEFAULT_BUDGET_MIN_SAMPLES = 20
+DEFAULT_MIN_TIMEOUT = 1.0
+
+
+class BackendUnavailableError(Exception):
+    """Chatbot API failed to answer: transport error, timeout or server error."""
+
+
+class CircuitOpenError(BackendUnavailableError):
+    """Request was not sent because endpoint circuit is open."""
+
+
+def backoff_delay(
+    attempt: int, base: float = DEFAULT_BACKOFF_BASE, cap: float = DEFAULT_BACKOFF_MAX
+) -> float:
+    """Return seconds to wait before retry, exponential backoff with full jitter.
+
+    Args:
+        attempt: number of failed attempts before this retry, starting from 0
+        base: delay ceiling of first retry
+        cap: max delay ceiling
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))  # nosec B311
+
+
+class CircuitBreaker:
+    """Stop sending requests to failing endpoint for a while.
+
+    Circuit opens after failure_threshold consecutive failures. After reset_timeout one trial
+    request is let through (half-open), its success closes circuit, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+    ):
+        """
+        Args:
+            failure_threshold: consecutive failures opening circuit
+            reset_timeout: seconds circuit stays open before trial request
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Check request may be sent, takes trial slot in half-open state."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        """Close circuit."""
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def release(self):
+        """Give back trial slot of request which was cancelled before it finished."""
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        """Count failure, open circuit if threshold is reached or trial request failed."""
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+class LatencyBudget:
+    """Request timeout following observed p95 latency of recent requests.
+
+    Timeout is p95 times multiplier clamped to [min_timeout, max_timeout], max_timeout is used
+    until enough requests are observed. Timed out requests are observed with their timeout, so
+    budget grows back when backend becomes slower for everyone.
+    """
+
+    def __init__(
+        self,
+        max_timeout: float,
+        min_timeout: float = DEFAULT_MIN_TIMEOUT,
+        multiplier: float = DEFAULT_BUDGET_MULTIPLIER,
+        window: int = DEFAULT_BUDGET_WINDOW,
+        min_samples: int = DEFAULT_BUDGET_MIN_SAMPLES,
+    ):
+        """
+        Args:
+            max_timeout: configured endpoint timeout, budget never exceeds it
+            min_timeout: budget lower bound
+            multiplier: budget in units of p95 latency
+            window: number of recent requests budget is computed on
+            min_samples: requests observed before budget is applied
+        """
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._latencies: deque = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        """Add latency of finished request.
+
+        Args:
+            seconds: request latency
+        """
+        self._latencies.append(seconds)
+
+    def p95(self) -> float | None:
+        """Return p95 latency of recent requests, None if too few were observed."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def timeout(self) -> float:
+        """Return timeout of next request."""
+        p95 = self.p95()
+        if p95 is None:
+            return self.max_timeout
+        return max(self.min_timeout, min(self.max_timeout, p95 * self.multiplier))
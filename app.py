@@ -1,12 +1,261 @@
+from __future__ import annotations
+
+import logging
 import os
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
+
+import httpx
+from telegram.request import BaseRequest
 
-from api.ChatBotAPI import ChatBotAPI
+from api.AsyncChatBotAPI import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_WARM_UP_CONNECTIONS,
+    AsyncChatBotAPI,
+)
+from api.backend_pool import (
+    DEFAULT_HEALTH_INTERVAL,
+    DEFAULT_HEALTH_PATH,
+    DEFAULT_ROUTING,
+)
+from api.GenerationCache import DEFAULT_CACHE_TTL, GenerationCache
+from api.resilience import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+    DEFAULT_RETRIES,
+)
+from metrics.registry import REGISTRY, Registry
+from metrics.sampled_log import DEFAULT_SAMPLE_RATE
 from tg import TelegramBotApplication
+from tg.callback_store import (
+    DEFAULT_CALLBACK_STORE_SIZE,
+    DEFAULT_CALLBACK_TTL,
+    create_callback_store,
+)
+from tg.feedback_log import (
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_SYNC_INTERVAL,
+    create_feedback_log,
+)
+from tg.generation_queue import (
+    DEFAULT_GENERATION_QUEUE_SIZE,
+    DEFAULT_GENERATION_WORKERS,
+    DEFAULT_MAX_MERGED_MESSAGES,
+    create_generation_queue,
+)
+from tg.progress import DEFAULT_PLACEHOLDER_DELAY, DEFAULT_TYPING_INTERVAL
+from tg.rate_limiter import (
+    DEFAULT_CHAT_BURST,
+    DEFAULT_CHAT_RATE,
+    DEFAULT_GLOBAL_RATE,
+    TelegramRateLimiter,
+)
+from tg.streaming import DEFAULT_EDIT_INTERVAL
+from tg.update_processor import (
+    DEFAULT_MAX_CONCURRENT_UPDATES,
+    DEFAULT_MAX_CONCURRENT_UPDATES_PER_USER,
+    FairSlots,
+)
+from tg.user_registry import (
+    DEFAULT_DISK_TTL,
+    DEFAULT_MEMORY_TTL,
+    DEFAULT_REGISTRY_SIZE,
+    create_user_registry,
+)
+from tg.webhook import DEFAULT_MAX_CONNECTIONS, DEFAULT_WEBHOOK_PATH
+
+if TYPE_CHECKING:
+    from tg.metrics_server import MetricsServer
+
+
+def create_metrics_server(settings: Mapping[str, str]) -> MetricsServer | None:
+    """Create metrics server if METRICS_PORT is set.
+
+    Args:
+        settings: environment variables
+    """
+    if not settings.get("METRICS_PORT"):
+        return None
+    # pylint: disable-next=import-outside-toplevel
+    from tg.metrics_server import DEFAULT_METRICS_LISTEN, MetricsServer
+
+    return MetricsServer(
+        REGISTRY,
+        port=int(settings["METRICS_PORT"]),
+        listen=settings.get("METRICS_LISTEN", DEFAULT_METRICS_LISTEN),
+        profiling=settings.get("METRICS_PROFILING", "0") == "1",
+    )
+
+
+def create_chat_api(
+    settings: Mapping[str, str],
+    metrics: Registry | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> AsyncChatBotAPI:
+    """Create chatbot API client configured by environment variables.
+
+    Args:
+        settings: environment variables, or settings of one bot of host
+        metrics: registry recording chatbot API metrics, default one if None
+        client: http client shared with other bots
+    """
+    api_paths = [path.strip() for path in settings["CHAT_API_ADDRESS"].split(",") if path.strip()]
+    generation_cache_size = int(settings.get("GENERATION_CACHE_SIZE", 0))
+    generation_cache = None
+    if generation_cache_size:
+        generation_cache = GenerationCache(
+            max_size=generation_cache_size,
+            ttl=float(settings.get("GENERATION_CACHE_TTL", DEFAULT_CACHE_TTL)),
+        )
+    return AsyncChatBotAPI(
+        api_path=api_paths,
+        pool_size=int(settings.get("CHAT_API_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        generation_cache=generation_cache,
+        retries=int(settings.get("CHAT_API_RETRIES", DEFAULT_RETRIES)),
+        failure_threshold=int(
+            settings.get("CHAT_API_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)
+        ),
+        reset_timeout=float(settings.get("CHAT_API_RESET_TIMEOUT", DEFAULT_RESET_TIMEOUT)),
+        hedge=settings.get("CHAT_API_HEDGE", "0") == "1",
+        log_sample_rate=float(settings.get("LOG_SAMPLE_RATE", DEFAULT_SAMPLE_RATE)),
+        routing=settings.get("CHAT_API_ROUTING", DEFAULT_ROUTING),
+        health_interval=float(settings.get("CHAT_API_HEALTH_INTERVAL", DEFAULT_HEALTH_INTERVAL)),
+        health_path=settings.get("CHAT_API_HEALTH_PATH", DEFAULT_HEALTH_PATH),
+        metrics=metrics,
+        client=client,
+    )
+
+
+def create_bot(
+    settings: Mapping[str, str],
+    metrics: Registry | None = None,
+    metrics_server: MetricsServer | None = None,
+    request: BaseRequest | None = None,
+    chat_api_client: httpx.AsyncClient | None = None,
+    shared_slots: FairSlots | None = None,
+) -> TelegramBotApplication:
+    """Create bot configured by environment variables.
+
+    Args:
+        settings: environment variables, or settings of one bot of host
+        metrics: registry recording bot metrics, default one if None
+        metrics_server: server of /metrics started with bot
+        request: Bot API request shared with other bots
+        chat_api_client: chatbot API http client shared with other bots
+        shared_slots: update slots shared with other bots
+    """
+    max_concurrent_updates = int(
+        settings.get("TG_MAX_CONCURRENT_UPDATES", DEFAULT_MAX_CONCURRENT_UPDATES)
+    )
+    max_concurrent_updates_per_user = int(
+        settings.get("TG_MAX_CONCURRENT_UPDATES_PER_USER", DEFAULT_MAX_CONCURRENT_UPDATES_PER_USER)
+    )
+    users = create_user_registry(
+        path=settings.get("USER_REGISTRY_PATH"),
+        max_size=int(settings.get("USER_REGISTRY_SIZE", DEFAULT_REGISTRY_SIZE)),
+        memory_ttl=float(settings.get("USER_REGISTRY_MEMORY_TTL", DEFAULT_MEMORY_TTL)),
+        disk_ttl=float(settings.get("USER_REGISTRY_DISK_TTL", DEFAULT_DISK_TTL)),
+    )
+    callbacks = create_callback_store(
+        path=settings.get("CALLBACK_STORE_PATH"),
+        max_size=int(settings.get("CALLBACK_STORE_SIZE", DEFAULT_CALLBACK_STORE_SIZE)),
+        ttl=float(settings.get("CALLBACK_STORE_TTL", DEFAULT_CALLBACK_TTL)),
+    )
+    stream_edit_interval = float(settings.get("TG_STREAM_EDIT_INTERVAL", DEFAULT_EDIT_INTERVAL))
+    placeholder_delay: float | None = float(
+        settings.get("TG_PLACEHOLDER_DELAY", DEFAULT_PLACEHOLDER_DELAY)
+    )
+    if placeholder_delay < 0:
+        placeholder_delay = None
+    rate_limiter = TelegramRateLimiter(
+        global_rate=float(settings.get("TG_GLOBAL_RATE", DEFAULT_GLOBAL_RATE)),
+        chat_rate=float(settings.get("TG_CHAT_RATE", DEFAULT_CHAT_RATE)),
+        chat_burst=int(settings.get("TG_CHAT_BURST", DEFAULT_CHAT_BURST)),
+    )
+    chat_bot_api = create_chat_api(settings, metrics=metrics, client=chat_api_client)
+    generation_queue = None
+    generation_workers = int(settings.get("GENERATION_WORKERS", DEFAULT_GENERATION_WORKERS))
+    if generation_workers > 0:
+        generation_queue = create_generation_queue(
+            workers=generation_workers,
+            max_size=int(settings.get("GENERATION_QUEUE_SIZE", DEFAULT_GENERATION_QUEUE_SIZE)),
+            max_merged_messages=int(
+                settings.get("GENERATION_MAX_MERGED", DEFAULT_MAX_MERGED_MESSAGES)
+            ),
+            path=settings.get("GENERATION_QUEUE_PATH"),
+        )
+    feedback = None
+    feedback_flush_interval = float(
+        settings.get("FEEDBACK_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)
+    )
+    # in-memory log would lose choices users already see as saved on restart
+    if settings.get("FEEDBACK_LOG_PATH") and feedback_flush_interval > 0:
+        feedback = create_feedback_log(
+            path=settings["FEEDBACK_LOG_PATH"],
+            flush_interval=feedback_flush_interval,
+            sync_interval=float(settings.get("FEEDBACK_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL)),
+        )
+    return TelegramBotApplication(
+        settings["TG_BOT_TOKEN"],
+        chat_bot_api,
+        max_concurrent_updates=max_concurrent_updates,
+        max_concurrent_updates_per_user=max_concurrent_updates_per_user,
+        users=users,
+        callbacks=callbacks,
+        stream=settings.get("CHAT_API_STREAM", "0") == "1",
+        stream_edit_interval=stream_edit_interval,
+        placeholder_delay=placeholder_delay,
+        typing_interval=float(settings.get("TG_TYPING_INTERVAL", DEFAULT_TYPING_INTERVAL)),
+        rate_limiter=rate_limiter,
+        metrics=metrics,
+        metrics_server=metrics_server,
+        generation_queue=generation_queue,
+        warm_up_connections=int(
+            settings.get("CHAT_API_WARM_UP_CONNECTIONS", DEFAULT_WARM_UP_CONNECTIONS)
+        ),
+        base_url=settings.get("TG_API_BASE_URL"),
+        request=request,
+        shared_slots=shared_slots,
+        feedback=feedback,
+    )
+
 
 if __name__ == "__main__":
-    api_path = os.environ["CHAT_API_ADDRESS"]
-    tg_bot_token = os.environ["TG_BOT_TOKEN"]
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+    )
+    if os.environ.get("BOT_HOST_CONFIG"):
+        from tg.host import DEFAULT_RELOAD_INTERVAL, BotHost
 
-    chat_bot_api = ChatBotAPI(api_path=api_path)
-    bot = TelegramBotApplication(tg_bot_token, chat_bot_api)
-    bot.run()
+        BotHost(
+            os.environ["BOT_HOST_CONFIG"],
+            create_bot,
+            metrics_server=create_metrics_server(os.environ),
+            reload_interval=float(
+                os.environ.get("BOT_HOST_RELOAD_INTERVAL", DEFAULT_RELOAD_INTERVAL)
+            ),
+            chat_api_pool_size=int(os.environ.get("CHAT_API_POOL_SIZE", DEFAULT_POOL_SIZE)),
+            max_concurrent_updates=int(
+                os.environ.get("BOT_HOST_MAX_CONCURRENT_UPDATES", DEFAULT_MAX_CONCURRENT_UPDATES)
+            ),
+        ).run()
+    else:
+        webhook = os.environ.get("TG_MODE", "polling") == "webhook"
+        if webhook and not os.environ.get("TG_WEBHOOK_SECRET"):
+            # anyone knowing webhook url could post fake updates
+            raise SystemExit("TG_WEBHOOK_SECRET must be set in webhook mode")
+        bot = create_bot(os.environ, metrics_server=create_metrics_server(os.environ))
+        if webhook:
+            bot.run_webhook(
+                listen=os.environ.get("TG_WEBHOOK_LISTEN", "0.0.0.0"),  # nosec B104
+                port=int(os.environ.get("TG_WEBHOOK_PORT", 8443)),
+                secret_token=os.environ["TG_WEBHOOK_SECRET"],
+                url_path=os.environ.get("TG_WEBHOOK_PATH", DEFAULT_WEBHOOK_PATH),
+                webhook_url=os.environ.get("TG_WEBHOOK_URL"),
+                max_connections=int(
+                    os.environ.get("TG_WEBHOOK_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+                ),
+            )
+        else:
+            bot.run()
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import math
+import random
+import statistics
+import time
+
+import httpx
+from telegram import Bot, Update
+
+from tg.webhook import SECRET_TOKEN_HEADER, WebhookServer
+
+TOKEN = "123456:benchmark"
+WEBHOOK_SECRET = "benchmark-secret"
+
+
+class Latency:
+    """Distribution of emulated latency in seconds.
+
+    Spec formats: "0.05" or "fixed:0.05", "uniform:0.01,0.1", "exp:0.05" (mean),
+    "lognormal:0.05,0.5" (median, sigma), optional "+0.5@0.01" suffix adds 0.5 s to 1% of samples
+    to emulate rare stalls.
+    """
+
+    def __init__(self, kind: str, params: tuple, stall: float = 0.0, stall_share: float = 0.0):
+        """
+        Args:
+            kind: fixed, uniform, exp or lognormal
+            params: parameters of distribution
+            stall: extra seconds added to stalled samples
+            stall_share: share of stalled samples
+        """
+        self.kind = kind
+        self.params = params
+        self.stall = stall
+        self.stall_share = stall_share
+
+    @classmethod
+    def parse(cls, spec: str) -> Latency:
+        """Build distribution from spec string.
+
+        Args:
+            spec: distribution spec, see class docstring
+        """
+        spec, _, stall = spec.partition("+")
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        if kind not in ("fixed", "uniform", "exp", "lognormal"):
+            raise ValueError(f"unknown latency distribution {kind}")
+        stall_seconds, _, stall_share = stall.partition("@")
+        return cls(
+            kind,
+            tuple(float(param) for param in params.split(",")),
+            stall=float(stall_seconds or 0),
+            stall_share=float(stall_share or 0),
+        )
+
+    def sample(self) -> float:
+        """Return random latency."""
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = random.uniform(*self.params)  # nosec B311
+        elif self.kind == "exp":
+            value = random.expovariate(1 / self.params[0]) if self.params[0] else 0.0  # nosec
+        else:
+            median, sigma = self.params
+            value = random.lognormvariate(math.log(median), sigma) if median else 0.0  # nosec
+        if self.stall_share and random.random() < self.stall_share:  # nosec B311
+            value += self.stall
+        return value
+
+    def __repr__(self) -> str:
+        return f"Latency({self.kind}, {self.params}, stall={self.stall}@{self.stall_share})"
+
+
+def as_latency(value) -> Latency:
+    """Return distribution for Latency, spec string or fixed number of seconds."""
+    if isinstance(value, Latency):
+        return value
+    if isinstance(value, str):
+        return Latency.parse(value)
+    return Latency("fixed", (float(value),))
+
+
+class UpdateSender:
+    """Deliver update json to bot through fake Telegram long polling or through webhook."""
+
+    def __init__(self, bot, telegram, mode: str):
+        """
+        Args:
+            bot: TgBot with handlers added
+            telegram: FakeTelegram bot is pointed to
+            mode: polling or webhook
+        """
+        self.bot = bot
+        self.telegram = telegram
+        self.mode = mode
+        self.update_ids = itertools.count(1)
+        self.client: httpx.AsyncClient | None = None
+        self.webhook_url = ""
+
+    async def start(self):
+        """Start application and delivery of updates."""
+        await self.bot.app.initialize()
+        await self.bot.on_startup(self.bot.app)
+        await self.bot.app.start()
+        if self.mode == "polling":
+            await self.bot.app.updater.start_polling(poll_interval=0, timeout=10)
+        else:
+            self.client = httpx.AsyncClient()
+            self.bot.webhook = WebhookServer(
+                self.bot.app, "127.0.0.1", 0, secret_token=WEBHOOK_SECRET
+            )
+            await self.bot.webhook.start()
+            port = self.bot.webhook.server.port
+            self.webhook_url = f"http://127.0.0.1:{port}{self.bot.webhook.url_path}"
+
+    async def send(self, update: dict):
+        """Deliver update without update_id.
+
+        Args:
+            update: update json
+        """
+        if self.mode == "polling":
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.telegram.push_update, update
+            )
+        else:
+            await self.client.post(
+                self.webhook_url,
+                json={**update, "update_id": next(self.update_ids)},
+                headers={SECRET_TOKEN_HEADER: WEBHOOK_SECRET},
+            )
+
+    async def stop(self):
+        """Stop delivery and application."""
+        if self.mode == "polling":
+            await self.bot.app.updater.stop()
+        else:
+            await self.bot.webhook.stop()
+            await self.client.aclose()
+        await self.bot.app.stop()
+        await self.bot.on_stop(self.bot.app)
+        await self.bot.app.shutdown()
+
+
+def message_update_data(user_id: int, text: str, message_id: int, reply_to: int | None = None):
+    """Return update json with private text message from user.
+
+    Args:
+        user_id: telegram id of user, also used as chat id
+        text: message text
+        message_id: id of message
+        reply_to: id of bot message the message replies to
+    """
+    user = {"id": user_id, "is_bot": False, "first_name": "user", "username": f"user{user_id}"}
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user,
+        "text": text,
+    }
+    if reply_to is not None:
+        message["reply_to_message"] = {
+            "message_id": reply_to,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "text": "",
+        }
+    return {"message": message}
+
+
+def callback_update_data(user_id: int, data: str, message_id: int, query_id: int) -> dict:
+    """Return update json with button press of user.
+
+    Args:
+        user_id: telegram id of user, also used as chat id
+        data: callback_data of pressed button
+        message_id: id of message with keyboard
+        query_id: unique id of callback query
+    """
+    user = {"id": user_id, "is_bot": False, "first_name": "user", "username": f"user{user_id}"}
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "text": "",
+    }
+    return {
+        "callback_query": {
+            "id": str(query_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": message,
+        }
+    }
+
+
+def make_message_update(bot: Bot, update_id: int, user_id: int, text: str) -> Update:
+    """Build update with private text message from user.
+
+    Args:
+        bot: telegram bot the update is bound to
+        update_id: id of update, also used as message id
+        user_id: telegram id of user, also used as chat id
+        text: message text
+    """
+    data = message_update_data(user_id, text, message_id=update_id)
+    return Update.de_json({**data, "update_id": update_id}, bot)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Return q-th percentile of values, q in [0, 100]."""
+    values = sorted(values)
+    index = min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(latencies: list[float]) -> dict:
+    """Return mean and percentiles of latencies in seconds."""
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "mean_s": statistics.mean(latencies),
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "max_s": max(latencies),
+    }
+
+
+def print_result(result: dict, indent: int = 0):
+    """Print nested result dict."""
+    for key, value in result.items():
+        if isinstance(value, dict):
+            print(f"{' ' * indent}{key}:")
+            print_result(value, indent + 2)
+        elif isinstance(value, float):
+            print(f"{' ' * indent}{key}: {value:.4f}")
+        else:
+            print(f"{' ' * indent}{key}: {value}")
@@ -0,0 +1,99 @@
+"""Compare update delivery by long polling and by webhook against local stand-ins.
+
+Latency is measured from the moment fake Telegram gets user message until it gets the keyboard
+message answering it.
+Run: python -m benchmarks.delivery_latency --updates 100 --users 20 --rate 20
+"""
+import argparse
+import asyncio
+import time
+
+from api.AsyncChatBotAPI import AsyncChatBotAPI
+from benchmarks.common import (
+    TOKEN,
+    UpdateSender,
+    message_update_data,
+    print_result,
+    summarize,
+)
+from benchmarks.fake_backend import FakeBackend
+from benchmarks.fake_telegram import FakeTelegram
+from tg.bot import TgBot
+from tg.rate_limiter import TelegramRateLimiter
+
+
+async def run_mode(mode: str, args: argparse.Namespace) -> dict:
+    """Deliver updates to bot in given mode and measure end-to-end latency.
+
+    Args:
+        mode: polling or webhook
+        args: command line arguments
+    """
+    telegram = FakeTelegram(("127.0.0.1", 0), latency=args.telegram_latency).start()
+    backend = FakeBackend(
+        ("127.0.0.1", 0), tokens=args.tokens, token_delay=args.token_delay, latency=0.01
+    ).start()
+    bot = TgBot(
+        TOKEN,
+        AsyncChatBotAPI(backend.url),
+        base_url=telegram.base_url,
+        rate_limiter=TelegramRateLimiter(global_rate=1000, chat_rate=1000, chat_burst=1000),
+    )
+    bot.add_handlers()
+
+    loop = asyncio.get_running_loop()
+    sent_at: dict[int, float] = {}
+    done = {chat_id: asyncio.Event() for chat_id in range(1, args.users + 1)}
+    latencies = []
+
+    def on_call(method: str, params: dict, message_id: int):
+        # pylint: disable=unused-argument
+        if method == "sendMessage" and "reply_markup" in params:
+            chat_id = int(params["chat_id"])
+            latencies.append(time.perf_counter() - sent_at[chat_id])
+            loop.call_soon_threadsafe(done[chat_id].set)
+
+    telegram.listeners.append(on_call)
+
+    sender = UpdateSender(bot, telegram, mode)
+    await sender.start()
+
+    async def user_turn(chat_id: int, message_id: int):
+        # user sends next message only after answer to the previous one arrived
+        done[chat_id].clear()
+        sent_at[chat_id] = time.perf_counter()
+        await sender.send(message_update_data(chat_id, "Где ты работаешь?", message_id))
+        await done[chat_id].wait()
+
+    started = time.perf_counter()
+    turns: dict[int, asyncio.Task] = {}
+    for message_id in range(1, args.updates + 1):
+        chat_id = (message_id - 1) % args.users + 1
+        previous = turns.get(chat_id)
+        if previous is not None:
+            await previous
+        turns[chat_id] = asyncio.create_task(user_turn(chat_id, message_id))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*turns.values())
+    elapsed = time.perf_counter() - started
+
+    await sender.stop()
+    telegram.shutdown()
+    backend.shutdown()
+    return {**summarize(latencies), "throughput_per_s": len(latencies) / elapsed}
+
+
+async def run(args) -> dict:
+    """Run benchmark in both modes."""
+    return {mode: await run_mode(mode, args) for mode in ("polling", "webhook")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=20, help="updates per second")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    print_result(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,211 @@
+"""Local stand-in for chatbot API, supports streaming generation.
+
+Run: python -m benchmarks.fake_backend --port 8000 --tokens 30 --token-delay 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.common import Latency, as_latency
+
+ANSWERS = [
+    "Меня зовут Забик, я работаю в IT.",
+    "Я цифровой двойник и отвечаю на вопросы.",
+    "Не знаю, спросите что-нибудь попроще.",
+]
+
+
+class FakeBackend(ThreadingHTTPServer):
+    """Threaded http server emulating chatbot API."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        tokens: int = 30,
+        token_delay: float = 0.05,
+        latency: float | str | Latency = 0.01,
+        history_length: int = 1,
+        generation_latency: float | str | Latency = 0.0,
+    ):
+        """
+        Args:
+            address: (host, port) to listen on
+            tokens: number of tokens in every generated answer
+            token_delay: seconds between generated tokens
+            latency: seconds or distribution of seconds to answer any request besides generation
+            history_length: number of messages in every user context
+            generation_latency: seconds or distribution of seconds before first token
+        """
+        super().__init__(address, FakeBackendHandler)
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.latency = as_latency(latency)
+        self.generation_latency = as_latency(generation_latency)
+        self.history_length = history_length
+        self.lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.answer_ids = itertools.count()
+
+    def start(self) -> FakeBackend:
+        """Serve in background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        """Base url of fake API."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def history(self, offset: int = 0, limit: int | None = None) -> list[dict]:
+        """Return page of user context."""
+        end = self.history_length if limit is None else min(offset + limit, self.history_length)
+        roles = ("user", "bot")
+        return [
+            {"role": roles[index % 2], "context": f"{ANSWERS[index % len(ANSWERS)]} #{index}"}
+            for index in range(offset, end)
+        ]
+
+    def record(self, endpoint: str):
+        """Count call of endpoint."""
+        with self.lock:
+            self.calls[endpoint] += 1
+
+    def sleep(self, latency: Latency):
+        """Emulate processing time."""
+        seconds = latency.sample()
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def answers(self) -> list[list[str]]:
+        """Return tokens of every answer."""
+        return [
+            list(itertools.islice(itertools.cycle(answer.split(" ")), self.tokens))
+            for answer in ANSWERS
+        ]
+
+
+class FakeBackendHandler(BaseHTTPRequestHandler):
+    """Request handler of FakeBackend."""
+
+    protocol_version = "HTTP/1.1"
+    server: FakeBackend
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep output quiet."""
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, event: str, data: dict):
+        payload = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+        self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _generate(self, body: dict):
+        answers = self.server.answers()
+        answer_id = str(next(self.server.answer_ids))
+        self.server.sleep(self.server.generation_latency)
+        if not body.get("stream"):
+            time.sleep(self.server.token_delay * self.server.tokens)
+            self._send_json(
+                {"messages": [" ".join(tokens) for tokens in answers], "answer_id": answer_id}
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for position in range(self.server.tokens):
+            time.sleep(self.server.token_delay)
+            for index, tokens in enumerate(answers):
+                text = tokens[position] if not position else " " + tokens[position]
+                self._send_event("token", {"index": index, "text": text})
+        self._send_event(
+            "done", {"messages": [" ".join(tokens) for tokens in answers], "answer_id": answer_id}
+        )
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _route(self):
+        body = self._read_json()
+        url = urlsplit(self.path)
+        path = url.path
+        if re.fullmatch(r"/users/[^/]+/context/generate", path):
+            self.server.record("generate")
+            self._generate(body)
+            return
+        self.server.sleep(self.server.latency)
+        if path == "/users" and self.command == "POST":
+            self.server.record("create_user")
+            self._send_json({"user_id": body.get("user_id"), "context": []})
+        elif path.endswith("/context/answers"):
+            self.server.record("register_answer")
+            answer_id = str(next(self.server.answer_ids))
+            self._send_json({"messages": body["messages"], "answer_id": answer_id})
+        elif path.endswith("/possible_contexts_ids"):
+            self.server.record("possible_contexts_ids")
+            self._send_json({"possible_contexts_ids": body.get("possible_contexts_ids", [])})
+        elif path.endswith("/user_choice"):
+            self.server.record("user_choice")
+            self._send_json({"text": ANSWERS[0]})
+        elif path.endswith("/custom_answer"):
+            self.server.record("custom_answer")
+            self._send_json(
+                {"message_id": body.get("message_id"), "text": body.get("custom_text")}
+            )
+        elif path.endswith("/context") and self.command == "GET":
+            self.server.record("get_context_page")
+            query = parse_qs(url.query)
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["100"])[0])
+            self._send_json({"context": self.server.history(offset, limit)})
+        elif path.startswith("/users/") and self.command == "GET":
+            self.server.record("get_user")
+            self._send_json({"context": self.server.history()})
+        else:
+            self.server.record("other")
+            self._send_json({"status": "ok"})
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _route
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--tokens", type=int, default=30)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--latency", default="0.01", help="latency spec")
+    parser.add_argument("--generation-latency", default="0", help="latency spec")
+    parser.add_argument("--history-length", type=int, default=1)
+    options = parser.parse_args()
+    server = FakeBackend(
+        (options.host, options.port),
+        tokens=options.tokens,
+        token_delay=options.token_delay,
+        latency=options.latency,
+        history_length=options.history_length,
+        generation_latency=options.generation_latency,
+    )
+    print(f"Fake chatbot API on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,174 @@
+"""Local stand-in for Telegram Bot API, answers bot methods used by TgBot.
+
+Run: python -m benchmarks.fake_telegram --port 8081 --latency lognormal:0.05,0.5
+Point bot to it with base_url=http://127.0.0.1:8081/bot
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from benchmarks.common import Latency, as_latency
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "twin", "username": "twin_bot"}
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    """Threaded http server emulating Telegram Bot API."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float | str | Latency = 0.05, jitter: float = 0.5):
+        """
+        Args:
+            address: (host, port) to listen on
+            latency: mean seconds to answer every method or latency distribution
+            jitter: relative spread of numeric latency, 0.5 means latency * [0.5, 1.5]
+        """
+        super().__init__(address, FakeTelegramHandler)
+        if isinstance(latency, (int, float)):
+            latency = Latency("uniform", (latency * (1 - jitter), latency * (1 + jitter)))
+        self.latency = as_latency(latency)
+        self.message_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.calls: list[tuple[str, dict]] = []
+        self.method_counts: Counter = Counter()
+        self.listeners: list[Callable[[str, dict, int], None]] = []
+        self.update_ids = itertools.count(1)
+        self.updates: list[dict] = []
+        self.updates_ready = threading.Condition()
+
+    def start(self) -> FakeTelegram:
+        """Serve in background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def base_url(self) -> str:
+        """Url to pass as bot base_url."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def sleep(self):
+        """Emulate network and Telegram processing time."""
+        seconds = self.latency.sample()
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def record(self, method: str, params: dict) -> int:
+        """Store called method and return id for new message, ids grow in order of arrival."""
+        with self.lock:
+            self.calls.append((method, params))
+            self.method_counts[method] += 1
+            message_id = next(self.message_ids)
+        for listener in self.listeners:
+            listener(method, params, message_id)
+        return message_id
+
+    def push_update(self, update: dict) -> dict:
+        """Queue update for getUpdates, update_id is assigned automatically.
+
+        Args:
+            update: update without update_id
+        """
+        with self.updates_ready:
+            update = {**update, "update_id": next(self.update_ids)}
+            self.updates.append(update)
+            self.updates_ready.notify_all()
+        return update
+
+    def get_updates(self, offset: int, timeout: float) -> list[dict]:
+        """Long poll updates starting from offset, confirming older ones.
+
+        Args:
+            offset: first update id to return
+            timeout: max seconds to wait for updates
+        """
+        with self.updates_ready:
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            self.updates_ready.wait_for(lambda: self.updates, timeout)
+            return list(self.updates)
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Request handler of FakeTelegram."""
+
+    protocol_version = "HTTP/1.1"
+    server: FakeTelegram
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep output quiet."""
+
+    def _read_params(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(body or "{}")
+        return {key: _decode(value) for key, value in parse_qsl(body)}
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        """Answer bot method."""
+        method = self.path.rsplit("/", 1)[-1]
+        params = self._read_params()
+        self.server.sleep()
+        message_id = self.server.record(method, params)
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getUpdates":
+            result = self.server.get_updates(
+                int(params.get("offset") or 0), float(params.get("timeout") or 0)
+            )
+        elif method in {"sendMessage", "sendDocument"}:
+            result = _message(message_id, params)
+        elif method == "editMessageText":
+            result = _message(int(params["message_id"]), params)
+        else:
+            result = True
+        self._send_json({"ok": True, "result": result})
+
+    do_GET = do_POST
+
+
+def _decode(value: str):
+    """Bot sends form values json encoded."""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _message(message_id: int, params: dict) -> dict:
+    """Return message sent by bot."""
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+        "from": BOT_USER,
+        "text": str(params.get("text", "")),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="uniform:0.025,0.075", help="latency spec")
+    options = parser.parse_args()
+    server = FakeTelegram((options.host, options.port), latency=options.latency)
+    print(f"Fake Telegram Bot API on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,303 @@
+"""Load test replaying multi-user conversations against local Telegram and chatbot API stand-ins.
+
+Users send messages, press variant buttons and reply to variants with their own text. Actions
+arrive as Poisson process at target rate and go to idle users, every user waits for the bot to
+finish previous action. Latency is measured from delivery of update until the last Telegram call
+of its handler: keyboard message, edit of chosen variant or delete of user reply.
+Run: python -m benchmarks.load_test --users 50 --rate 20 --duration 30 --output results.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from api.AsyncChatBotAPI import AsyncChatBotAPI
+from benchmarks.common import (
+    TOKEN,
+    UpdateSender,
+    callback_update_data,
+    message_update_data,
+    print_result,
+    summarize,
+)
+from benchmarks.fake_backend import FakeBackend
+from benchmarks.fake_telegram import FakeTelegram
+from tg.bot import TgBot
+from tg.constants import NUMBERS
+from tg.feedback_log import FeedbackLog
+from tg.generation_queue import GenerationQueue
+from tg.rate_limiter import TelegramRateLimiter
+
+PROMPTS = ["Где ты работаешь?", "Как тебя зовут?", "Что ты любишь?", "Расскажи о себе"]
+USER_ID_BASE = 100_000
+# ids of user messages never collide with ids fake telegram gives to bot messages
+USER_MESSAGE_ID_BASE = 10_000_000
+
+
+def rss_mb() -> float:
+    """Return resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Return peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class SimulatedUser:
+    """State of one user conversation seen from Telegram side."""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.variant_ids: list[int] = []
+        self.keyboard: tuple[int, list[str]] | None = None
+
+    def reset(self):
+        """Forget variants and keyboard of previous answer."""
+        self.variant_ids = []
+        self.keyboard = None
+
+
+class LoadTest:
+    """Drive bot with synthetic conversations and collect latencies."""
+
+    # latencies and counters of every action, pylint: disable=too-many-instance-attributes
+
+    def __init__(self, args, telegram: FakeTelegram, sender: UpdateSender):
+        self.args = args
+        self.telegram = telegram
+        self.sender = sender
+        self.loop = asyncio.get_running_loop()
+        self.users = {
+            USER_ID_BASE + index: SimulatedUser(USER_ID_BASE + index)
+            for index in range(args.users)
+        }
+        self.idle = list(self.users)
+        self.waiters: dict[tuple, asyncio.Future] = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.timeouts: dict[str, int] = defaultdict(int)
+        self.skipped = 0
+        self.message_ids = iter(range(USER_MESSAGE_ID_BASE, USER_MESSAGE_ID_BASE * 2))
+        self.query_ids = iter(range(1, USER_MESSAGE_ID_BASE))
+        self.random = random.Random(args.seed)  # nosec B311
+
+    def on_call(self, method: str, params: dict, message_id: int):
+        """Follow bot messages of simulated users, called from fake telegram threads."""
+        chat_id = int(params.get("chat_id") or 0)
+        user = self.users.get(chat_id)
+        if user is None:
+            return
+        if method == "sendMessage":
+            markup = params.get("reply_markup")
+            if markup:
+                data = [button["callback_data"] for button in markup["inline_keyboard"][0]]
+                user.keyboard = (message_id, data)
+                self._resolve(("keyboard", chat_id))
+            elif str(params.get("text", "")).startswith("Вариант"):
+                user.variant_ids.append(message_id)
+        elif method == "editMessageText":
+            self._resolve(("edit", chat_id, int(params["message_id"])))
+        elif method == "deleteMessage":
+            self._resolve(("delete", chat_id, int(params["message_id"])))
+        elif method == "deleteMessages":
+            for deleted_id in params["message_ids"]:
+                self._resolve(("delete", chat_id, int(deleted_id)))
+
+    def _resolve(self, key: tuple):
+        waiter = self.waiters.get(key)
+        if waiter is not None:
+            self.loop.call_soon_threadsafe(_set_done, waiter)
+
+    def next_action(self, user: SimulatedUser) -> tuple[str, dict, tuple]:
+        """Return action name, update and key of Telegram call finishing its handling."""
+        chat_id = user.user_id
+        if user.keyboard is not None and user.variant_ids:
+            choice = self.random.random()
+            if choice < self.args.button_share:
+                keyboard_id, data = user.keyboard
+                index = self.random.randrange(min(len(data), len(NUMBERS)))
+                keep_id = sorted(user.variant_ids)[index]
+                user.reset()
+                update = callback_update_data(
+                    chat_id, data[index], keyboard_id, next(self.query_ids)
+                )
+                return "button", update, ("edit", chat_id, keep_id)
+            if choice < self.args.button_share + self.args.reply_share:
+                variant_id = self.random.choice(user.variant_ids)
+                message_id = next(self.message_ids)
+                user.reset()
+                update = message_update_data(
+                    chat_id, "Мой вариант ответа", message_id, reply_to=variant_id
+                )
+                return "reply", update, ("delete", chat_id, message_id)
+
+        user.reset()
+        update = message_update_data(chat_id, self.random.choice(PROMPTS), next(self.message_ids))
+        return "message", update, ("keyboard", chat_id)
+
+    async def act(self, user: SimulatedUser):
+        """Perform next action of user and wait until bot handled it."""
+        action, update, key = self.next_action(user)
+        waiter = self.loop.create_future()
+        self.waiters[key] = waiter
+        started = time.perf_counter()
+        try:
+            await self.sender.send(update)
+            await asyncio.wait_for(waiter, self.args.action_timeout)
+            self.latencies[action].append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            self.timeouts[action] += 1
+            user.reset()
+        finally:
+            del self.waiters[key]
+            self.idle.append(user.user_id)
+
+    async def run(self) -> float:
+        """Generate actions for duration and return elapsed seconds until all finished."""
+        tasks = set()
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        next_at = started
+        while True:
+            next_at += self.random.expovariate(self.args.rate)
+            if next_at >= deadline:
+                break
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            if not self.idle:
+                # every user waits for the bot, offered load is above what users can produce
+                self.skipped += 1
+                continue
+            user_id = self.idle.pop(self.random.randrange(len(self.idle)))
+            task = asyncio.create_task(self.act(self.users[user_id]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+
+def _set_done(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+async def run(args) -> dict:
+    """Run load test and return results."""
+    telegram = FakeTelegram(("127.0.0.1", 0), latency=args.telegram_latency).start()
+    backend = FakeBackend(
+        ("127.0.0.1", 0),
+        tokens=args.tokens,
+        token_delay=args.token_delay,
+        latency=args.backend_latency,
+        generation_latency=args.generation_latency,
+    ).start()
+    rate_limiter = None
+    if args.no_rate_limit:
+        rate_limiter = TelegramRateLimiter(global_rate=10_000, chat_rate=10_000, chat_burst=10_000)
+    bot = TgBot(
+        TOKEN,
+        AsyncChatBotAPI(backend.url),
+        base_url=telegram.base_url,
+        stream=args.stream,
+        rate_limiter=rate_limiter,
+        generation_queue=GenerationQueue(args.generation_workers)
+        if args.generation_workers
+        else None,
+        feedback=FeedbackLog() if args.feedback_log else None,
+    )
+    bot.add_handlers()
+    sender = UpdateSender(bot, telegram, args.mode)
+    rss_before = rss_mb()
+    await sender.start()
+
+    test = LoadTest(args, telegram, sender)
+    telegram.listeners.append(test.on_call)
+    calls_before = telegram.method_counts.copy()
+    elapsed = await test.run()
+    rss_after = rss_mb()
+    await sender.stop()
+    telegram.shutdown()
+    backend.shutdown()
+
+    latencies = [latency for values in test.latencies.values() for latency in values]
+    return {
+        "overall": summarize(latencies),
+        "actions": {action: summarize(values) for action, values in test.latencies.items()},
+        "throughput_per_s": len(latencies) / elapsed,
+        "offered_rate_per_s": args.rate,
+        "elapsed_s": elapsed,
+        "timeouts": dict(test.timeouts),
+        "skipped_arrivals": test.skipped,
+        "memory_mb": {"rss_before": rss_before, "rss_after": rss_after, "peak": peak_rss_mb()},
+        "telegram_calls": dict(telegram.method_counts - calls_before),
+        "backend_calls": dict(backend.calls),
+    }
+
+
+def compare(result: dict, baseline: dict) -> dict:
+    """Return relative change of main numbers against baseline result."""
+    changes = {}
+    for key in ("p50_s", "p95_s", "p99_s"):
+        old, new = baseline["overall"].get(key), result["overall"].get(key)
+        if old and new is not None:
+            changes[key] = f"{(new - old) / old:+.1%}"
+    old, new = baseline["throughput_per_s"], result["throughput_per_s"]
+    if old:
+        changes["throughput_per_s"] = f"{(new - old) / old:+.1%}"
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=20, help="target actions per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds actions arrive")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--button-share", type=float, default=0.5)
+    parser.add_argument("--reply-share", type=float, default=0.2)
+    parser.add_argument("--telegram-latency", default="lognormal:0.05,0.4", help="latency spec")
+    parser.add_argument("--backend-latency", default="lognormal:0.01,0.5", help="latency spec")
+    parser.add_argument("--generation-latency", default="lognormal:0.2,0.5", help="latency spec")
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--generation-workers", type=int, default=0, help="0 disables queue")
+    parser.add_argument(
+        "--feedback-log", action="store_true", help="send choices to backend in background"
+    )
+    parser.add_argument("--no-rate-limit", action="store_true", help="lift Telegram limits")
+    parser.add_argument("--action-timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results json to this file")
+    parser.add_argument("--baseline", help="results json of previous run to compare with")
+    arguments = parser.parse_args()
+
+    results = asyncio.run(run(arguments))
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": vars(arguments),
+        "results": results,
+    }
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as baseline_file:
+            report["change"] = compare(results, json.load(baseline_file)["results"])
+    print_result(results)
+    if "change" in report:
+        print_result({"change": report["change"]})
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2, ensure_ascii=False)
@@ -0,0 +1,63 @@
+"""End-to-end latency of one user message against local Telegram and chatbot API stand-ins.
+
+Run: python -m benchmarks.message_latency --messages 20 --telegram-latency 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from api.AsyncChatBotAPI import AsyncChatBotAPI
+from benchmarks.common import TOKEN, make_message_update, print_result, summarize
+from benchmarks.fake_backend import FakeBackend
+from benchmarks.fake_telegram import FakeTelegram
+from tg.bot import TgBot
+
+
+async def run(args) -> dict:
+    """Send messages one by one and measure time until handler finished."""
+    telegram = FakeTelegram(("127.0.0.1", 0), latency=args.telegram_latency).start()
+    backend = FakeBackend(
+        ("127.0.0.1", 0),
+        tokens=args.tokens,
+        token_delay=args.token_delay,
+        latency=args.backend_latency,
+    ).start()
+    bot = TgBot(
+        TOKEN, AsyncChatBotAPI(backend.url), base_url=telegram.base_url, stream=args.stream
+    )
+    bot.add_handlers()
+    await bot.app.initialize()
+
+    latencies = []
+    calls_before = len(telegram.calls)
+    for update_id in range(1, args.messages + 1):
+        update = make_message_update(
+            bot.app.bot, update_id, user_id=1000 + update_id, text="Где ты работаешь?"
+        )
+        started = time.perf_counter()
+        await bot.app.process_update(update)
+        latencies.append(time.perf_counter() - started)
+
+    await bot.app.shutdown()
+    telegram.shutdown()
+    backend.shutdown()
+
+    generation = args.tokens * args.token_delay
+    summary = summarize(latencies)
+    return {
+        **summary,
+        "generation_s": generation,
+        "overhead_p50_s": summary["p50_s"] - generation,
+        "telegram_calls_per_message": (len(telegram.calls) - calls_before) / args.messages,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--backend-latency", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--stream", action="store_true")
+    print_result(asyncio.run(run(parser.parse_args())))
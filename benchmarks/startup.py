@@ -0,0 +1,164 @@
+"""Startup cost of production entry point: import time, time to first update and memory.
+
+Every round starts app.py in new process against local Telegram and chatbot API stand-ins with
+one user message already waiting in getUpdates. Time is measured from process start until the
+bot first reacts in the chat and until it sends keyboard with answers, memory is read from
+/proc after that.
+Run: python -m benchmarks.startup --rounds 5 --output startup.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import signal
+import statistics
+import subprocess  # nosec B404
+import sys
+import threading
+import time
+
+from benchmarks.common import TOKEN, message_update_data, print_result, summarize
+from benchmarks.fake_backend import FakeBackend
+from benchmarks.fake_telegram import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = 4242
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app; "
+    "print(time.perf_counter() - started)"
+)
+IMPORT_TIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| *(\S+)")
+
+
+def import_seconds() -> float:
+    """Return seconds fresh interpreter spends importing app."""
+    output = subprocess.run(  # nosec B603
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output.strip())
+
+
+def slowest_imports(count: int) -> dict:
+    """Return top level packages taking most time to import, cumulative ms."""
+    output = subprocess.run(  # nosec B603
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    packages: dict[str, float] = {}
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        package = match.group(2).split(".")[0]
+        # cumulative time of outermost import of package includes all its submodules
+        packages[package] = max(packages.get(package, 0.0), int(match.group(1)) / 1000)
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+    return {package: milliseconds for package, milliseconds in top if package != "app"}
+
+
+def memory_mb(pid: int) -> dict:
+    """Return current and peak resident set size of process in MB."""
+    with open(f"/proc/{pid}/status", encoding="ascii") as status:
+        fields = dict(line.split(":", 1) for line in status if ":" in line)
+    return {
+        "rss_mb": int(fields["VmRSS"].split()[0]) / 1024,
+        "peak_rss_mb": int(fields["VmHWM"].split()[0]) / 1024,
+    }
+
+
+def run_round(args) -> dict | None:
+    """Start bot process once and return its startup numbers, None if it did not answer."""
+    telegram = FakeTelegram(("127.0.0.1", 0), latency=args.telegram_latency).start()
+    backend = FakeBackend(
+        ("127.0.0.1", 0), tokens=args.tokens, token_delay=args.token_delay
+    ).start()
+    first_call = threading.Event()
+    keyboard = threading.Event()
+    reached: dict[str, float] = {}
+
+    def on_call(method: str, params: dict, message_id: int):
+        # pylint: disable=unused-argument
+        if int(params.get("chat_id") or 0) != USER_ID:
+            return
+        now = time.perf_counter()
+        if not first_call.is_set():
+            reached["first_response_s"] = now
+            first_call.set()
+        if method == "sendMessage" and params.get("reply_markup"):
+            reached["first_answer_s"] = now
+            keyboard.set()
+
+    telegram.listeners.append(on_call)
+    telegram.push_update(message_update_data(USER_ID, "Где ты работаешь?", 1))
+    env = {
+        **os.environ,
+        **dict(setting.split("=", 1) for setting in args.set),
+        "TG_BOT_TOKEN": TOKEN,
+        "TG_API_BASE_URL": telegram.base_url,
+        "CHAT_API_ADDRESS": backend.url,
+        "LOG_LEVEL": "WARNING",
+    }
+    started = time.perf_counter()
+    with subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env) as process:  # nosec B603
+        try:
+            if not keyboard.wait(args.timeout):
+                return None
+            result = {name: moment - started for name, moment in reached.items()}
+            result.update(memory_mb(process.pid))
+            return result
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            telegram.shutdown()
+            backend.shutdown()
+
+
+def run(args) -> dict:
+    """Measure startup for given number of rounds."""
+    imports = [import_seconds() for _ in range(args.rounds)]
+    rounds = [run_round(args) for _ in range(args.rounds)]
+    finished = [result for result in rounds if result is not None]
+    results = {
+        "import_s": summarize(imports),
+        "failed_rounds": len(rounds) - len(finished),
+        "slowest_imports_ms": slowest_imports(args.top_imports),
+    }
+    for key in ("first_response_s", "first_answer_s"):
+        results[key] = summarize([result[key] for result in finished if key in result])
+    for key in ("rss_mb", "peak_rss_mb"):
+        values = [result[key] for result in finished]
+        results[key] = {"p50": statistics.median(values), "max": max(values)} if values else {}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--telegram-latency", default="0.01", help="latency spec")
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=30, help="max seconds to first answer")
+    parser.add_argument("--top-imports", type=int, default=10)
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="NAME=VALUE", help="bot env variable"
+    )
+    parser.add_argument("--output", help="write results json to this file")
+    arguments = parser.parse_args()
+
+    startup = run(arguments)
+    print_result(startup)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            json.dump({"config": vars(arguments), "results": startup}, output_file, indent=2)
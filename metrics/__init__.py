@@ -0,0 +1,3 @@
+from metrics.histogram import DEFAULT_BUCKETS, Histogram
+from metrics.registry import REGISTRY, LabeledRegistry, Registry, flatten
+from metrics.sampled_log import SampledLogger
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import bisect
+import math
+from collections.abc import Sequence
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Prometheus style histogram with fixed upper bounds of buckets."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: sorted upper bounds of buckets, +Inf bucket is added automatically
+        """
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Add observed value.
+
+        Args:
+            value: observed value
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Return upper bound of bucket containing q-quantile, None if nothing was observed.
+
+        Args:
+            q: quantile in [0, 1]
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """Return (upper bound, number of values <= bound) for every bucket."""
+        result = []
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            result.append((bound, seen))
+        return result
+
+    def snapshot(self) -> dict:
+        """Return summary of observed values."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
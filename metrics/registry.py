@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import math
+import time
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import contextmanager
+
+from metrics.histogram import DEFAULT_BUCKETS, Histogram
+
+# sample returned by collectors: metric name, labels, value
+Sample = tuple[str, dict, float]
+Collector = Callable[[], Iterable[Sample]]
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Iterable[tuple[str, object]]) -> str:
+    pairs = [
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in labels
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def flatten(prefix: str, values: dict, **labels) -> Iterator[Sample]:
+    """Yield numeric values of metrics dict as gauges, nested dicts are joined into names.
+
+    Args:
+        prefix: prefix of metric names
+        values: metrics dict, e.g. result of component metrics()
+        labels: labels of every sample
+    """
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from flatten(name, value, **labels)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, labels, value
+
+
+class Registry:
+    """Process metrics rendered in Prometheus text format.
+
+    Hot path only updates dicts and histogram buckets, state of components is pulled from
+    collectors when metrics are scraped.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: upper bounds of histogram buckets in seconds
+        """
+        self.buckets = buckets
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+        self._collectors: dict[str, Collector] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        """Add value to histogram.
+
+        Args:
+            name: metric name
+            value: observed value
+            labels: metric labels
+        """
+        series = self._histograms.setdefault(name, {})
+        key = _labels_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase counter.
+
+        Args:
+            name: metric name, should end with _total
+            value: increment
+            labels: metric labels
+        """
+        series = self._counters.setdefault(name, {})
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def add(self, name: str, value: float, **labels):
+        """Change gauge by value.
+
+        Args:
+            name: metric name
+            value: positive or negative change
+            labels: metric labels
+        """
+        series = self._gauges.setdefault(name, {})
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    @contextmanager
+    def track(self, name: str, **labels):
+        """Measure block: <name>_seconds histogram, <name>_in_flight gauge, <name>_errors_total.
+
+        Args:
+            name: metric name prefix
+            labels: metric labels
+        """
+        self.add(f"{name}_in_flight", 1, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+            self.add(f"{name}_in_flight", -1, **labels)
+
+    def add_collector(self, key: str, collector: Collector):
+        """Register function returning samples on every scrape, replaces collector with same key.
+
+        Args:
+            key: unique name of collector
+            collector: function returning (name, labels, value) samples
+        """
+        self._collectors[key] = collector
+
+    def remove_collector(self, key: str):
+        """Unregister collector.
+
+        Args:
+            key: name collector was registered with
+        """
+        self._collectors.pop(key, None)
+
+    def labeled(self, **labels) -> LabeledRegistry:
+        """Return view of registry adding labels to everything recorded through it.
+
+        Args:
+            labels: labels added to every metric, e.g. name of bot
+        """
+        return LabeledRegistry(self, **labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """Return histogram, empty one if nothing was observed.
+
+        Args:
+            name: metric name
+            labels: metric labels
+        """
+        return self._histograms.get(name, {}).get(_labels_key(labels)) or Histogram(self.buckets)
+
+    def render(self) -> str:
+        """Return all metrics in Prometheus text exposition format."""
+        lines = []
+        for name, series in sorted(self._histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                for bound, count in histogram.cumulative():
+                    labels = _format_labels(key + (("le", _format_value(bound)),))
+                    lines.append(f"{name}_bucket{labels} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        for kind, families in (("counter", self._counters), ("gauge", self._gauges)):
+            for name, series in sorted(families.items()):
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        collected: dict[str, list[str]] = {}
+        for collector in list(self._collectors.values()):
+            for name, labels, value in collector():
+                collected.setdefault(name, []).append(
+                    f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}"
+                )
+        for name, samples in sorted(collected.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class LabeledRegistry(Registry):
+    """View of registry adding constant labels, so several instances of a component share it.
+
+    Collectors are registered in parent registry under key extended with labels, close() removes
+    them when instance is gone.
+    """
+
+    def __init__(self, registry: Registry, **labels):
+        """
+        Args:
+            registry: parent registry metrics are recorded to
+            labels: labels added to every metric
+        """
+        super().__init__(registry.buckets)
+        self.registry = registry
+        self.labels = labels
+        self._keys: set[str] = set()
+
+    def observe(self, name: str, value: float, **labels):
+        self.registry.observe(name, value, **labels, **self.labels)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.registry.inc(name, value, **labels, **self.labels)
+
+    def add(self, name: str, value: float, **labels):
+        self.registry.add(name, value, **labels, **self.labels)
+
+    def _key(self, key: str) -> str:
+        return key + _format_labels(sorted(self.labels.items()))
+
+    def add_collector(self, key: str, collector: Collector):
+        def labeled() -> Iterator[Sample]:
+            for name, labels, value in collector():
+                yield name, {**labels, **self.labels}, value
+
+        self._keys.add(key)
+        self.registry.add_collector(self._key(key), labeled)
+
+    def remove_collector(self, key: str):
+        self._keys.discard(key)
+        self.registry.remove_collector(self._key(key))
+
+    def labeled(self, **labels) -> LabeledRegistry:
+        return LabeledRegistry(self.registry, **self.labels, **labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self.registry.histogram(name, **labels, **self.labels)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+    def close(self):
+        """Remove collectors registered through this view."""
+        for key in list(self._keys):
+            self.remove_collector(key)
+
+
+# registry used by bot components unless other one is given
+REGISTRY = Registry()
@@ -0,0 +1,45 @@
+import json
+import logging
+import random
+
+DEFAULT_SAMPLE_RATE = 0.01
+
+
+class SampledLogger:
+    """Log one JSON line per event for a random sample of events.
+
+    Skipped events cost one random number, payload is serialized only for sampled ones.
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = DEFAULT_SAMPLE_RATE):
+        """
+        Args:
+            logger: logger to write to
+            sample_rate: share of events logged, 0 disables and 1 logs every event
+        """
+        self.logger = logger
+        self.sample_rate = sample_rate
+
+    def log(self, level: int, event: str, **fields):
+        """Log event with given probability.
+
+        Args:
+            level: logging level
+            event: event name
+            fields: event fields, must be JSON serializable or convertible with str
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:  # nosec B311
+            return
+        if not self.logger.isEnabledFor(level):
+            return
+        fields["event"] = event
+        self.logger.log(level, json.dumps(fields, ensure_ascii=False, default=str))
+
+    def info(self, event: str, **fields):
+        """Log sampled event with INFO level.
+
+        Args:
+            event: event name
+            fields: event fields
+        """
+        self.log(logging.INFO, event, **fields)
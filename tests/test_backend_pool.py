@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import httpx
+
+from api.backend_pool import BackendPool
+
+URLS = ["http://chat-1.test", "http://chat-2.test", "http://chat-3.test"]
+
+
+def test_user_sticks_to_replica():
+    """Hash routing sends every request of user to the same replica, users are spread."""
+    pool = BackendPool(URLS)
+    homes = {str(user): pool.select("add_message", str(user)) for user in range(100)}
+    for user, home in homes.items():
+        assert pool.select("get_user", user) is home
+    assert len({home.url for home in homes.values()}) == len(URLS)
+
+
+def test_busy_replica_spills_over_and_is_used_again():
+    """Replica above load bound is skipped, user comes back once its load drops."""
+    pool = BackendPool(URLS, load_factor=1.25)
+    home = pool.select("add_message", "1")
+    home.outstanding = 10
+    spilled = pool.select("add_message", "1")
+    assert spilled is not home
+    assert pool.select("add_message", "1") is spilled
+
+    home.outstanding = 0
+    assert pool.select("add_message", "1") is home
+
+
+def test_ejected_replica_is_skipped_until_eject_time_passes():
+    """Replica failing requests in a row is out of rotation for eject_time."""
+    pool = BackendPool(URLS, eject_failures=2, eject_time=0.05)
+    home = pool.select("add_message", "1")
+    pool.record_failure(home)
+    assert pool.select("add_message", "1") is home
+
+    pool.record_failure(home)
+    assert not home.available
+    assert pool.select("add_message", "1") is not home
+
+    time.sleep(0.06)
+    assert home.available
+    assert pool.select("add_message", "1") is home
+
+
+def test_unhealthy_replica_is_skipped_until_check_passes():
+    """Replica answering health check with 5xx is out of rotation until it answers again."""
+    pool = BackendPool(URLS)
+    home = pool.select("add_message", "1")
+    statuses = {backend.url: 200 for backend in pool.backends}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(statuses[f"{request.url.scheme}://{request.url.host}"])
+
+    async def check_all():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return [await pool.check(client, backend) for backend in pool.backends]
+
+    statuses[home.url] = 503
+    assert asyncio.run(check_all()).count(False) == 1
+    assert pool.select("add_message", "1") is not home
+
+    statuses[home.url] = 200
+    assert all(asyncio.run(check_all()))
+    assert pool.select("add_message", "1") is home
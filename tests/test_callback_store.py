@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api.resilience import BackendUnavailableError
+from metrics.registry import Registry
+from tg.bot import TgBot
+from tg.callback_store import (
+    MemoryCallbackStore,
+    SqliteCallbackStore,
+    TieredCallbackStore,
+    create_callback_store,
+)
+from tg.constants import CALLBACK_EXPIRED
+
+STATE = {"ids": [10, 11, 12], "db": "answer-1", "texts": ["a", "b", "c"]}
+
+
+def test_memory_store_forgets_used_expired_and_evicted_keyboards():
+    """Keyboard is returned once by pop, expired and least recently used ones are forgotten."""
+    store = MemoryCallbackStore(max_size=2)
+    store.put("first", STATE)
+    store.put("second", STATE)
+    store.put("third", STATE)
+    assert store.get("first") is None
+    assert store.get("second") == STATE
+    assert store.pop("second") == STATE
+    assert store.pop("second") is None
+
+    expired = MemoryCallbackStore(ttl=-1)
+    expired.put("token", STATE)
+    assert expired.get("token") is None
+    assert expired.pop("token") is None
+
+
+def test_keyboards_survive_restart_with_sqlite_store(tmp_path):
+    """Keyboard registered before restart is usable after it, get does not consume it."""
+    path = str(tmp_path / "callbacks.db")
+    store = create_callback_store(path)
+    token = store.register(STATE)
+    store.close()
+
+    restarted = TieredCallbackStore(MemoryCallbackStore(), SqliteCallbackStore(path))
+    assert restarted.get(token) == STATE
+    assert restarted.pop(token) == STATE
+    assert restarted.pop(token) is None
+    restarted.close()
+
+
+class FailingChatApi:
+    """Chatbot API failing choice updates until it is told to accept them."""
+
+    def __init__(self):
+        self.available = False
+        self.choices: list[str] = []
+
+    async def update_user_choice(self, telegram_user_id: str, answer_id: str, message_id: int):
+        if not self.available:
+            raise BackendUnavailableError("chatbot API is down")
+        self.choices.append(f"{telegram_user_id}:{answer_id}:{message_id}")
+        return "chosen"
+
+
+class FakeQuery:
+    """Callback query recording answers and deleted keyboard message."""
+
+    def __init__(self, data: str):
+        self.data = data
+        self.message = SimpleNamespace(chat_id=1)
+        self.answers: list = []
+        self.deleted = False
+
+    async def answer(self, text: str | None = None):
+        self.answers.append(text)
+
+    async def delete_message(self):
+        self.deleted = True
+
+
+class FakeBot:
+    """Bot API recording deleted and edited messages."""
+
+    def __init__(self):
+        self.deleted: list[tuple[int, int]] = []
+        self.edited: list[tuple[int, int, str]] = []
+
+    async def deleteMessage(self, chat_id: int, message_id: int):
+        self.deleted.append((chat_id, message_id))
+
+    async def editMessageText(self, chat_id: int, message_id: int, text: str):
+        self.edited.append((chat_id, message_id, text))
+
+
+def test_keyboard_stays_usable_when_choice_fails():
+    """Choice rejected by chatbot API keeps keyboard and messages, next press applies it."""
+    api = FailingChatApi()
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=7))
+    context = SimpleNamespace(bot=FakeBot())
+
+    async def main():
+        bot = TgBot("123:token", api, metrics=Registry())
+        token = bot.callbacks.register(STATE)
+        first = FakeQuery(f"{token}:1")
+        with pytest.raises(BackendUnavailableError):
+            await bot.button(SimpleNamespace(callback_query=first, **vars(update)), context)
+        assert not first.deleted
+        assert not context.bot.deleted
+        assert bot.callbacks.get(token) == STATE
+
+        api.available = True
+        second = FakeQuery(f"{token}:1")
+        await bot.button(SimpleNamespace(callback_query=second, **vars(update)), context)
+        return bot, token, second
+
+    bot, token, second = asyncio.run(main())
+    assert api.choices == ["7:answer-1:11"]
+    assert second.deleted
+    assert sorted(context.bot.deleted) == [(1, 10), (1, 12)]
+    assert context.bot.edited == [(1, 11, "chosen")]
+    assert bot.callbacks.get(token) is None
+
+
+@pytest.mark.parametrize("index", ["x", "3", "-1", ""])
+def test_malformed_callback_data_is_rejected(index):
+    """Index which is not a number or is out of keyboard is an unknown keyboard."""
+
+    async def parse():
+        bot = TgBot("123:token", FailingChatApi(), metrics=Registry())
+        token = bot.callbacks.register(STATE)
+        return bot.parse_callback(f"{token}:{index}" if index else "{not json")
+
+    assert asyncio.run(parse()) is None
+
+
+def test_legacy_keyboard_is_used_once():
+    """Choice of JSON keyboard sent before callback store is applied once, replay is expired."""
+    api = FailingChatApi()
+    api.available = True
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=7))
+    context = SimpleNamespace(bot=FakeBot())
+    data = json.dumps({"ids": [11, 10, 12], "db": "answer-1"})
+    first, replay = FakeQuery(data), FakeQuery(data)
+
+    async def main():
+        bot = TgBot("123:token", api, metrics=Registry())
+        for query in (first, replay):
+            await bot.button(SimpleNamespace(callback_query=query, **vars(update)), context)
+
+    asyncio.run(main())
+    assert api.choices == ["7:answer-1:11"]
+    assert first.deleted and not replay.deleted
+    assert replay.answers == [CALLBACK_EXPIRED]
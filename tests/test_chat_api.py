@@ -0,0 +1,179 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from api.AsyncChatBotAPI import (
+    AsyncChatBotAPI,
+    ChatApiError,
+    GenerationChoiceResponse,
+    GenerationChunk,
+    UserNotFoundError,
+)
+from metrics.registry import Registry
+
+API = "http://chat.test"
+
+
+def make_api(handler, **kwargs) -> AsyncChatBotAPI:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AsyncChatBotAPI(API, client=client, metrics=Registry(), **kwargs)
+
+
+async def collect(api: AsyncChatBotAPI, user_id: str = "1", text: str = "hi") -> list:
+    return [item async for item in api.stream_message(user_id, text)]
+
+
+def test_stream_reads_server_sent_events():
+    """Chunks are yielded as they arrive and whole answers at the end."""
+    events = (
+        'data: {"index": 0, "text": "Hel"}\n\n'
+        'data: {"index": 0, "text": "lo"}\n\n'
+        'event: done\ndata: {"messages": ["Hello"], "answer_id": "a1"}\n\n'
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content) == {"text": "hi", "stream": True}
+        return httpx.Response(200, text=events, headers={"Content-Type": "text/event-stream"})
+
+    api = make_api(handler)
+    items = asyncio.run(collect(api))
+    assert items == [
+        GenerationChunk(0, "Hel"),
+        GenerationChunk(0, "lo"),
+        GenerationChoiceResponse(["Hello"], "a1"),
+    ]
+    assert api.breaker("add_message").failures == 0
+
+
+def test_stream_falls_back_to_json_answer():
+    """Chat api ignoring stream flag answers with JSON, it is not a failure."""
+
+    def handler(_: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"messages": ["a", "b"], "answer_id": "a2"})
+
+    api = make_api(handler)
+    items = asyncio.run(collect(api))
+    assert items == [GenerationChoiceResponse(["a", "b"], "a2")]
+    assert api.breaker("add_message").failures == 0
+
+
+def context_handler(messages: list, honor_offset: bool = True):
+    """Handler of context pages, optionally ignoring offset and limit like old chat api."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if not honor_offset:
+            return httpx.Response(200, json={"context": messages})
+        offset = int(request.url.params["offset"])
+        limit = int(request.url.params["limit"])
+        return httpx.Response(200, json={"context": messages[offset : offset + limit]})
+
+    return handler
+
+
+async def read_context(api: AsyncChatBotAPI, **kwargs) -> list:
+    return [message async for message in api.iter_context("1", **kwargs)]
+
+
+def test_context_is_read_page_by_page():
+    """Pages are requested until short page."""
+    messages = [{"role": "user", "context": str(i)} for i in range(5)]
+    api = make_api(context_handler(messages))
+    assert asyncio.run(read_context(api, page_size=2)) == messages
+
+
+def test_context_paging_stops_when_offset_is_ignored():
+    """Chat api returning the same page again does not make paging loop forever."""
+    messages = [{"role": "user", "context": str(i)} for i in range(3)]
+    api = make_api(context_handler(messages, honor_offset=False))
+    assert asyncio.run(read_context(api, page_size=2)) == messages
+
+
+def test_context_paging_is_capped():
+    """No more than max_pages pages are fetched."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        offset = int(request.url.params["offset"])
+        return httpx.Response(200, json={"context": [{"n": offset}, {"n": offset + 1}]})
+
+    api = make_api(handler)
+    assert len(asyncio.run(read_context(api, page_size=2, max_pages=3))) == 6
+    assert len(requests) == 3
+
+
+def test_context_without_paging_falls_back_to_user():
+    """Chat api without paging answers 405, whole user entity is read instead."""
+    messages = [{"role": "user", "context": "hi"}]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/context"):
+            return httpx.Response(405)
+        return httpx.Response(200, json={"context": messages})
+
+    assert asyncio.run(read_context(make_api(handler))) == messages
+
+
+def test_unknown_user_context_raises():
+    """Chat api answering 404 does not know user, it is not a fallback to whole user."""
+    api = make_api(lambda request: httpx.Response(404, json={"detail": "user not found"}))
+    with pytest.raises(UserNotFoundError):
+        asyncio.run(read_context(api))
+
+
+@pytest.mark.parametrize(
+    "call",
+    [
+        lambda api: api.add_message("1", "hi"),
+        lambda api: api.update_user_choice("1", "a1", "10"),
+        lambda api: api.get_context_page("1", 0),
+        lambda api: api.create_user("1", "user", "1"),
+        lambda api: api.remove_user("1"),
+        lambda api: api.clear_history("1"),
+        lambda api: api.update_possible_context_id("1", "a1", ["10"]),
+    ],
+)
+def test_rejected_request_raises(call):
+    """Client error answer raises ChatApiError instead of being read as result."""
+    api = make_api(lambda request: httpx.Response(422, json={"detail": "invalid"}))
+    with pytest.raises(ChatApiError) as error:
+        asyncio.run(call(api))
+    assert error.value.status_code == 422
+    assert api.breaker(error.value.endpoint).failures == 0
+
+
+def test_existing_user_is_not_an_error():
+    """Creating user chat api already knows succeeds, e.g. after registry was lost."""
+    api = make_api(lambda request: httpx.Response(409, json={"detail": "exists"}))
+    assert json.loads(asyncio.run(api.create_user("1", "user", "1"))) == {"detail": "exists"}
+
+
+@pytest.mark.parametrize(
+    "answer, expected",
+    [
+        (httpx.Response(201, json={"messages": ["a"], "answer_id": "a3"}), "a3"),
+        (httpx.Response(204), None),
+    ],
+)
+def test_registered_answers_are_accepted_with_any_success_status(answer, expected):
+    """Cached answers registered with 201 or 204 are used, 204 gives no answer id."""
+    api = make_api(lambda request: answer)
+    response = asyncio.run(api.register_answer("1", "hi", ["a"]))
+    assert response == GenerationChoiceResponse(["a"], expected)
+
+
+@pytest.mark.parametrize("status", [405, 503])
+def test_answers_not_registered_are_generated(status):
+    """Chat api without answers endpoint or unavailable one makes cache fall back to generation."""
+    api = make_api(lambda request: httpx.Response(status))
+    assert asyncio.run(api.register_answer("1", "hi", ["a"])) is None
+
+
+def test_rejected_registration_raises():
+    """Client error answer of registration is reported, not read as answers."""
+    api = make_api(lambda request: httpx.Response(422, json={"detail": "invalid"}))
+    with pytest.raises(ChatApiError) as error:
+        asyncio.run(api.register_answer("1", "hi", ["a"]))
+    assert error.value.endpoint == "register_answer"
@@ -0,0 +1,79 @@
+import asyncio
+
+from api.resilience import BackendUnavailableError
+from tg.feedback_log import (
+    CHOICE,
+    CUSTOM,
+    FeedbackEvent,
+    FeedbackLog,
+    JsonlFeedbackStore,
+)
+
+
+class Delivery:
+    """Chatbot API accepting events once it is available."""
+
+    def __init__(self, available: bool = True):
+        self.available = available
+        self.delivered: list[tuple[str, str, str]] = []
+
+    async def __call__(self, event: FeedbackEvent):
+        if not self.available:
+            raise BackendUnavailableError("chatbot API is down")
+        self.delivered.append((event.user_id, event.kind, event.answer_id or event.text))
+
+
+def test_choice_survives_restart(tmp_path):
+    """Choice not delivered before stop is delivered by log started on the same file."""
+    path = str(tmp_path / "feedback.jsonl")
+
+    async def record_while_api_is_down():
+        log = FeedbackLog(JsonlFeedbackStore(path), flush_interval=60)
+        await log.start(Delivery(available=False))
+        log.record_choice("1", "answer-1", 10)
+        await log.stop()
+        log.close()
+        return len(log)
+
+    async def restart(delivery: Delivery):
+        log = FeedbackLog(JsonlFeedbackStore(path), flush_interval=60)
+        await log.start(delivery)
+        delivered = await log.flush()
+        await log.stop()
+        log.close()
+        return delivered
+
+    assert asyncio.run(record_while_api_is_down()) == 1
+    delivery = Delivery()
+    assert asyncio.run(restart(delivery))
+    assert delivery.delivered == [("1", CHOICE, "answer-1")]
+
+    # delivered choice is acknowledged in file and is not sent again
+    again = Delivery()
+    asyncio.run(restart(again))
+    assert not again.delivered
+
+
+def test_events_of_user_are_delivered_in_order_after_failure():
+    """Failed delivery keeps events of user for retry, they are delivered in recorded order."""
+
+    async def main():
+        delivery = Delivery(available=False)
+        log = FeedbackLog(flush_interval=60)
+        await log.start(delivery)
+        log.record_choice("1", "answer-1", 10)
+        log.record_custom("1", 11, "own answer")
+        log.record_choice("2", "answer-2", 20)
+        assert not await log.flush()
+        delivery.available = True
+        assert await log.flush()
+        await log.stop()
+        return log, delivery
+
+    log, delivery = asyncio.run(main())
+    assert [item for item in delivery.delivered if item[0] == "1"] == [
+        ("1", CHOICE, "answer-1"),
+        ("1", CUSTOM, "own answer"),
+    ]
+    assert log.metrics()["delivered"] == 3
+    assert log.metrics()["retried"] == 2
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+
+from api.AsyncChatBotAPI import GenerationChoiceResponse
+from api.GenerationCache import GenerationCache, normalize_prompt
+
+
+class FakeChatApi:
+    """Generation and registration of answers counting calls."""
+
+    def __init__(self, accept_register: bool = True):
+        self.accept_register = accept_register
+        self.generated = 0
+        self.registered = 0
+
+    async def generate(self) -> GenerationChoiceResponse:
+        self.generated += 1
+        await asyncio.sleep(0.01)
+        return GenerationChoiceResponse(["a", "b"], f"generated-{self.generated}")
+
+    async def register(self, messages: list) -> GenerationChoiceResponse | None:
+        self.registered += 1
+        if not self.accept_register:
+            return None
+        return GenerationChoiceResponse(messages, f"registered-{self.registered}")
+
+
+def ask(cache: GenerationCache, api: FakeChatApi, user_id: str, text: str):
+    return cache.get_or_generate(cache.key(user_id, text), api.generate, api.register)
+
+
+def test_prompts_differing_in_case_and_punctuation_are_equal():
+    """Normalized prompt ignores case, repeated spaces and edge punctuation."""
+    assert normalize_prompt("  Привет,   Мир!! ") == normalize_prompt("привет, мир")
+
+
+def test_answers_are_reused_in_same_conversation_state():
+    """Second user with empty conversation reuses answers, they are registered, not generated."""
+
+    async def main():
+        cache = GenerationCache()
+        api = FakeChatApi()
+        cache.reset_context("1")
+        cache.reset_context("2")
+        first = await ask(cache, api, "1", "Hi!")
+        second = await ask(cache, api, "2", "hi")
+        return cache, api, first, second
+
+    cache, api, first, second = asyncio.run(main())
+    assert (first.answer_id, second.answer_id) == ("generated-1", "registered-1")
+    assert second.messages == first.messages
+    assert (api.generated, api.registered) == (1, 1)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_concurrent_identical_requests_share_generation():
+    """Identical requests generated at the same time wait for one generation."""
+
+    async def main():
+        cache = GenerationCache()
+        api = FakeChatApi()
+        for user_id in "123":
+            cache.reset_context(user_id)
+        await asyncio.gather(*(ask(cache, api, user_id, "hi") for user_id in "123"))
+        return cache, api
+
+    cache, api = asyncio.run(main())
+    assert api.generated == 1
+    assert (cache.merged, cache.misses, cache.hits) == (2, 1, 0)
+
+
+def test_failed_register_counts_miss_not_hit():
+    """Cached answers rejected by chat api are generated again and counted as miss."""
+
+    async def main():
+        cache = GenerationCache()
+        api = FakeChatApi(accept_register=False)
+        cache.reset_context("1")
+        cache.reset_context("2")
+        await ask(cache, api, "1", "hi")
+        response = await ask(cache, api, "2", "hi")
+        return cache, response
+
+    cache, response = asyncio.run(main())
+    assert response.answer_id == "generated-2"
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_unknown_conversation_is_not_cached():
+    """User whose context is unknown has no cache key, changed context changes key."""
+    cache = GenerationCache()
+    assert cache.key("1", "hi") is None
+    cache.reset_context("1")
+    key = cache.key("1", "hi")
+    cache.extend_context("1", "user", "hi")
+    assert cache.key("1", "hi") not in (None, key)
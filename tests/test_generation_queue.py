@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from telegram import Update
+
+from tg.generation_queue import GenerationJob, GenerationQueue, SqliteJobStore
+
+
+class Recorder:
+    """Job handler recording answered texts, blocked until released."""
+
+    def __init__(self, blocked: bool = False):
+        self.answered: list[str] = []
+        self.release = asyncio.Event()
+        if not blocked:
+            self.release.set()
+
+    async def __call__(self, job: GenerationJob):
+        await self.release.wait()
+        self.answered.append(job.text)
+
+
+def test_submit_before_start_raises():
+    """Queue which is not started rejects messages with clear error."""
+    queue = GenerationQueue(1)
+    with pytest.raises(RuntimeError):
+        asyncio.run(queue.submit("1", Update(1), "hi"))
+
+
+def test_other_updates_of_user_wait_for_queued_messages():
+    """wait_user returns after queued messages of user are answered, other users do not wait."""
+
+    async def main():
+        queue = GenerationQueue(1)
+        handler = Recorder(blocked=True)
+        await queue.start(handler, None)
+        await queue.submit("1", Update(1), "first")
+        await asyncio.sleep(0)
+        await queue.submit("1", Update(2), "second")
+        await asyncio.wait_for(queue.wait_user("2"), 0.1)
+        waiting = asyncio.create_task(queue.wait_user("1"))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        handler.release.set()
+        await asyncio.wait_for(waiting, 1)
+        await queue.stop()
+        return handler.answered
+
+    assert asyncio.run(main()) == ["first", "second"]
+
+
+def test_stop_answers_queued_messages_of_memory_store():
+    """In-memory store would lose waiting jobs, stop runs them before workers exit."""
+
+    async def main():
+        queue = GenerationQueue(1)
+        handler = Recorder()
+        await queue.start(handler, None)
+        for user_id in ("1", "2", "3"):
+            await queue.submit(user_id, Update(1), user_id)
+        await queue.stop()
+        return handler.answered
+
+    assert asyncio.run(main()) == ["1", "2", "3"]
+
+
+def test_stop_keeps_queued_messages_of_sqlite_store(tmp_path):
+    """Durable store keeps waiting jobs for restart, running job is cancelled after timeout."""
+    path = str(tmp_path / "jobs.db")
+
+    async def stop_with_queued_jobs():
+        queue = GenerationQueue(1, store=SqliteJobStore(path))
+        handler = Recorder(blocked=True)
+        await queue.start(handler, None)
+        await queue.submit("1", Update(1), "running")
+        await asyncio.sleep(0)
+        await queue.submit("2", Update(2), "queued")
+        await queue.stop(timeout=0.01)
+        queue.close()
+        return handler.answered
+
+    async def restart():
+        queue = GenerationQueue(1, store=SqliteJobStore(path))
+        handler = Recorder()
+        await queue.start(handler, None)
+        await asyncio.wait_for(asyncio.gather(queue.wait_user("1"), queue.wait_user("2")), 1)
+        await queue.stop()
+        queue.close()
+        return handler.answered
+
+    assert asyncio.run(stop_with_queued_jobs()) == []
+    assert asyncio.run(restart()) == ["running", "queued"]
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from metrics.registry import Registry
+from tg.host import BotHost, load_config
+
+
+def write_config(path, bots: dict, defaults: dict | None = None):
+    path.write_text(json.dumps({"defaults": defaults or {}, "bots": bots}), encoding="utf-8")
+
+
+def test_config_merges_defaults_environment_and_placeholders(tmp_path):
+    """Bot settings override defaults, $NAME is read from given environment, {bot} is bot name."""
+    path = tmp_path / "bots.json"
+    write_config(
+        path,
+        {"first": {"TG_BOT_TOKEN": "$FIRST_TOKEN"}, "second": {"TG_BOT_TOKEN": "2", "A": "b"}},
+        defaults={"A": "a", "USER_REGISTRY_PATH": "/data/{bot}/users.db"},
+    )
+    config = load_config(str(path), {"FIRST_TOKEN": "1", "CHAT_API_ADDRESS": "http://chat"})
+    assert config["first"] == {
+        "FIRST_TOKEN": "1",
+        "CHAT_API_ADDRESS": "http://chat",
+        "TG_BOT_TOKEN": "1",
+        "A": "a",
+        "USER_REGISTRY_PATH": "/data/first/users.db",
+    }
+    assert config["second"]["A"] == "b"
+    assert config["second"]["USER_REGISTRY_PATH"] == "/data/second/users.db"
+
+
+@pytest.mark.parametrize(
+    "bots, defaults",
+    [
+        ({"first": {"TG_BOT_TOKEN": "1"}, "second": {"TG_BOT_TOKEN": "1"}}, {}),
+        (
+            {"first": {"TG_BOT_TOKEN": "1"}, "second": {"TG_BOT_TOKEN": "2"}},
+            {"FEEDBACK_LOG_PATH": "f"},
+        ),
+        ({"first": {}}, {}),
+    ],
+)
+def test_invalid_config_raises(tmp_path, bots, defaults):
+    """Bots sharing token or local file and bots without token are rejected."""
+    path = tmp_path / "bots.json"
+    write_config(path, bots, defaults)
+    with pytest.raises(ValueError):
+        load_config(str(path), {})
+
+
+class FakeBot:
+    """Bot recording whether it runs."""
+
+    def __init__(self, settings):
+        self.settings = dict(settings)
+        self.running = False
+
+    async def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+
+def test_reload_restarts_only_changed_bots(tmp_path):
+    """New bots start, removed ones stop, changed ones restart and others keep running."""
+    path = tmp_path / "bots.json"
+    write_config(path, {"kept": {"TG_BOT_TOKEN": "1"}, "changed": {"TG_BOT_TOKEN": "2"}})
+    created = []
+
+    def create_bot(settings, **_resources):
+        created.append(FakeBot(settings))
+        return created[-1]
+
+    async def main():
+        host = BotHost(str(path), create_bot, metrics=Registry(), reload_interval=0)
+        stop = asyncio.Event()
+        serving = asyncio.create_task(host.serve(stop))
+        await asyncio.sleep(0.01)
+        kept, changed = host.bots["kept"], host.bots["changed"]
+        write_config(path, {"kept": {"TG_BOT_TOKEN": "1"}, "changed": {"TG_BOT_TOKEN": "3"}})
+        await host.reload()
+        assert host.bots["kept"] is kept
+        assert host.bots["changed"] is not changed and not changed.running
+        stop.set()
+        await serving
+        return host
+
+    host = asyncio.run(main())
+    assert not host.bots
+    assert [bot.running for bot in created] == [False, False, False]
+    assert host.reloads == 2
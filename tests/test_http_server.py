@@ -0,0 +1,55 @@
+import asyncio
+
+from tg.http_server import HttpServer, Request, Response
+
+
+async def echo(request: Request) -> Response:
+    return Response(body=request.body)
+
+
+async def exchange(raw: bytes) -> bytes:
+    """Send raw request to new server and return whole answer."""
+    server = HttpServer("127.0.0.1", 0)
+    server.add_route("POST", "/echo", echo)
+    await server.start()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(raw)
+        await writer.drain()
+        answer = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return answer
+    finally:
+        await server.stop()
+
+
+def post(content_length: str, body: bytes = b"") -> bytes:
+    head = f"POST /echo HTTP/1.1\r\nContent-Length: {content_length}\r\nConnection: close\r\n\r\n"
+    return head.encode() + body
+
+
+def test_body_is_read_by_content_length():
+    """Request body of given length is passed to handler."""
+    answer = asyncio.run(exchange(post("5", b"hello")))
+    assert answer.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert answer.endswith(b"\r\n\r\nhello")
+
+
+def test_malformed_content_length_is_rejected():
+    """Content-Length which is not a non-negative integer gets 400."""
+    for value in ("abc", "-1", "1e3", "+5"):
+        answer = asyncio.run(exchange(post(value)))
+        assert answer.startswith(b"HTTP/1.1 400 Bad Request\r\n"), value
+
+
+def test_overlong_header_line_is_rejected():
+    """Header line longer than stream limit gets 400 instead of breaking connection handler."""
+    raw = b"POST /echo HTTP/1.1\r\nX-Padding: " + b"a" * 100_000 + b"\r\n\r\n"
+    answer = asyncio.run(exchange(raw))
+    assert answer.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+
+
+def test_too_large_body_is_rejected():
+    """Body over max body size gets 413."""
+    answer = asyncio.run(exchange(post(str(10 * 1024 * 1024))))
+    assert answer.startswith(b"HTTP/1.1 413 Payload Too Large\r\n")
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from tg.progress import ProgressIndicator
+
+
+class SlowBot:
+    """Bot API whose typing actions and placeholder messages finish when they are released."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.actions: list[tuple[int, str]] = []
+        self.deleted: list[tuple[int, int]] = []
+
+    async def send_chat_action(self, chat_id: int, action: str):
+        # like http request, typing action is not interrupted at once when cancelled
+        self.actions.append((chat_id, action))
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            await self.release.wait()
+            raise
+
+    async def send_message(self, chat_id: int, text: str):
+        await self.release.wait()
+        return SimpleNamespace(chat_id=chat_id, text=text, message_id=5)
+
+    async def delete_message(self, chat_id: int, message_id: int):
+        self.deleted.append((chat_id, message_id))
+
+
+def test_cancellation_of_caller_is_not_swallowed():
+    """Caller cancelled while typing task is stopping gets CancelledError from stop."""
+
+    async def main():
+        bot = SlowBot()
+        indicator = ProgressIndicator(bot, chat_id=1, placeholder_delay=None)
+
+        async def answer():
+            async with indicator:
+                await asyncio.sleep(0)
+                await indicator.stop()
+            return "answered"
+
+        answering = asyncio.create_task(answer())
+        await asyncio.sleep(0.01)
+        answering.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await answering
+        bot.release.set()
+        await asyncio.sleep(0)
+        return bot
+
+    assert len(asyncio.run(main()).actions) == 1
+
+
+def test_placeholder_sent_during_stop_is_deleted():
+    """Placeholder message in flight when indicator stops is deleted once it is sent."""
+
+    async def main():
+        bot = SlowBot()
+        bot.send_chat_action = lambda chat_id, action: asyncio.sleep(0)
+        async with ProgressIndicator(bot, chat_id=1, placeholder_delay=0) as indicator:
+            await asyncio.sleep(0.01)
+            assert indicator.placeholder_id is None
+            asyncio.get_running_loop().call_later(0.01, bot.release.set)
+        return bot, indicator
+
+    bot, indicator = asyncio.run(main())
+    assert bot.deleted == [(1, 5)]
+    assert indicator.placeholder_id is None
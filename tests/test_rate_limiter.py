@@ -0,0 +1,110 @@
+import asyncio
+
+from tg.rate_limiter import TelegramRateLimiter
+
+CHAT_ID = 42
+
+
+class FakeBotApi:
+    """Callback of rate limiter recording Bot API calls."""
+
+    def __init__(self):
+        self.calls: list[tuple[str, dict]] = []
+
+    async def __call__(self, endpoint: str, data: dict) -> bool:
+        self.calls.append((endpoint, data))
+        return True
+
+
+async def send(limiter: TelegramRateLimiter, api: FakeBotApi, endpoint: str, **data):
+    data = {"chat_id": CHAT_ID, **data}
+    return await limiter.process_request(api, (endpoint, data), {}, endpoint, data, None)
+
+
+async def start_limiter() -> TelegramRateLimiter:
+    # one request at once in chat, next one waits 50 ms for token
+    limiter = TelegramRateLimiter(chat_rate=20, chat_burst=1)
+    await limiter.initialize()
+    return limiter
+
+
+def test_waiting_deletes_are_merged_and_repeats_dropped():
+    """Deletes waiting in one chat become one deleteMessages call, repeated delete is dropped."""
+
+    async def main():
+        limiter = await start_limiter()
+        api = FakeBotApi()
+        await send(limiter, api, "sendMessage", text="hi")
+        results = await asyncio.gather(
+            send(limiter, api, "deleteMessage", message_id=1),
+            send(limiter, api, "deleteMessage", message_id=2),
+            send(limiter, api, "deleteMessage", message_id=1),
+        )
+        await send(limiter, api, "deleteMessage", message_id=2)
+        return limiter, api, results
+
+    limiter, api, results = asyncio.run(main())
+    assert results == [True, True, True]
+    assert api.calls[1:] == [("deleteMessages", {"chat_id": "42", "message_ids": [1, 2]})]
+    metrics = limiter.metrics()
+    assert (metrics["sent"], metrics["merged"], metrics["dropped"]) == (2, 1, 2)
+
+
+def test_outdated_edits_are_dropped():
+    """Edit replaced by newer edit of the same message and edit of deleted message are dropped."""
+
+    async def main():
+        limiter = await start_limiter()
+        api = FakeBotApi()
+        await send(limiter, api, "sendMessage", text="hi")
+        await asyncio.gather(
+            send(limiter, api, "editMessageText", message_id=1, text="a"),
+            send(limiter, api, "editMessageText", message_id=1, text="ab"),
+            send(limiter, api, "editMessageText", message_id=1, text="abc"),
+        )
+        await send(limiter, api, "deleteMessage", message_id=1)
+        await send(limiter, api, "editMessageText", message_id=1, text="abcd")
+        return limiter, api
+
+    limiter, api = asyncio.run(main())
+    assert [call[0] for call in api.calls] == ["sendMessage", "editMessageText", "deleteMessage"]
+    assert api.calls[1][1]["text"] == "abc"
+    assert limiter.metrics()["dropped"] == 3
+
+
+def test_cancelled_edit_is_forgotten():
+    """Edit cancelled while waiting for token does not leave its version behind."""
+
+    async def main():
+        limiter = await start_limiter()
+        api = FakeBotApi()
+        await send(limiter, api, "sendMessage", text="hi")
+        editing = asyncio.create_task(
+            send(limiter, api, "editMessageText", message_id=1, text="a")
+        )
+        await asyncio.sleep(0.01)
+        editing.cancel()
+        await asyncio.gather(editing, return_exceptions=True)
+        return limiter, api
+
+    limiter, api = asyncio.run(main())
+    assert not limiter._edits
+    assert [call[0] for call in api.calls] == ["sendMessage"]
+
+
+def test_deletes_joined_to_cancelled_leader_are_sent():
+    """Cancelling first delete of batch does not cancel deletes merged into it."""
+
+    async def main():
+        limiter = await start_limiter()
+        api = FakeBotApi()
+        await send(limiter, api, "sendMessage", text="hi")
+        leader = asyncio.create_task(send(limiter, api, "deleteMessage", message_id=1))
+        joined = asyncio.create_task(send(limiter, api, "deleteMessage", message_id=2))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return api, await joined
+
+    api, joined = asyncio.run(main())
+    assert joined is True
+    assert api.calls[1:] == [("deleteMessages", {"chat_id": "42", "message_ids": [1, 2]})]
@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from api.AsyncChatBotAPI import AsyncChatBotAPI
+from api.resilience import (
+    BackendUnavailableError,
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyBudget,
+    backoff_delay,
+)
+from metrics.registry import Registry
+
+API = "http://chat.test"
+
+
+def make_api(handler, **kwargs) -> AsyncChatBotAPI:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AsyncChatBotAPI(API, client=client, metrics=Registry(), **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Retries are sent at once."""
+    monkeypatch.setattr("api.AsyncChatBotAPI.backoff_delay", lambda attempt: 0)
+
+
+def test_backoff_delay_is_jittered_below_exponential_cap():
+    """Delay is random, its ceiling doubles with every attempt up to cap."""
+    for attempt, ceiling in ((0, 0.2), (1, 0.4), (2, 0.8), (5, 2.0)):
+        delays = [backoff_delay(attempt) for _ in range(100)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert len(set(delays)) > 1
+
+
+def test_circuit_opens_after_failures_and_closes_after_trial():
+    """Consecutive failures open circuit, one trial request is let through after timeout."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+
+
+def test_latency_budget_follows_p95():
+    """Configured timeout is used until enough latencies are observed, then p95 times 3."""
+    budget = LatencyBudget(max_timeout=10, min_timeout=0.1, min_samples=20)
+    assert budget.timeout() == 10
+    for _ in range(20):
+        budget.observe(0.5)
+    assert budget.timeout() == pytest.approx(1.5)
+    for _ in range(200):
+        budget.observe(60)
+    assert budget.timeout() == 10
+
+
+def test_idempotent_request_is_retried():
+    """Server errors of reads are retried, successful retry is returned."""
+    statuses = [503, 502, 200]
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(statuses.pop(0), json={"context": []})
+
+    api = make_api(handler)
+    assert asyncio.run(api.get_user("1")) == {"context": []}
+    assert not statuses
+    assert api.breaker("get_user").state == CircuitBreaker.CLOSED
+
+
+def test_failing_endpoint_circuit_rejects_requests():
+    """Non-idempotent request is sent once, open circuit rejects requests without sending."""
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request.url.path)
+        return httpx.Response(503)
+
+    api = make_api(handler, failure_threshold=2)
+    for _ in range(2):
+        with pytest.raises(BackendUnavailableError):
+            asyncio.run(api.update_user_choice("1", "a1", "10"))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(api.update_user_choice("1", "a1", "10"))
+    assert len(sent) == 2
+
+
+def test_request_timeout_follows_latency_budget():
+    """Timeout of request is budget of its endpoint."""
+    timeouts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        timeouts.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json={"context": []})
+
+    api = make_api(handler)
+    asyncio.run(api.get_user("1"))
+    for _ in range(20):
+        api.budget("get_user").observe(1.0)
+    asyncio.run(api.get_user("1"))
+    assert timeouts == [30, 3.0]
+
+
+def test_slow_read_is_hedged():
+    """Read slower than p95 is sent again, first answer wins and slow request is cancelled."""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={"context": ["slow"]})
+        return httpx.Response(200, json={"context": ["fast"]})
+
+    api = make_api(handler, hedge=True)
+    for _ in range(20):
+        api.budget("get_user").observe(0.01)
+    started = time.monotonic()
+    assert asyncio.run(api.get_user("1")) == {"context": ["fast"]}
+    assert time.monotonic() - started < 0.5
+    assert len(calls) == 2
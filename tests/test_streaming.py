@@ -0,0 +1,178 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+from telegram.error import BadRequest, NetworkError
+
+from api.AsyncChatBotAPI import GenerationChoiceResponse, GenerationChunk
+from metrics.registry import Registry
+from tg.bot import TgBot
+from tg.progress import ProgressIndicator
+from tg.streaming import StreamingReply
+
+MESSAGE_IDS = itertools.count(1)
+
+
+class FakeMessage:
+    """Sent message remembering edits, failing edits with given errors first.
+
+    Like telegram it strips text and rejects edits which do not change it.
+    """
+
+    def __init__(self, text: str, errors: list):
+        self.message_id = next(MESSAGE_IDS)
+        self.text = text.strip()
+        self.errors = errors
+        self.edits: list[str] = []
+        self.deleted = False
+
+    async def edit_text(self, text: str):
+        if self.errors:
+            raise self.errors.pop(0)
+        if text.strip() == self.text:
+            raise BadRequest("Message is not modified: specified new message content is the same")
+        self.edits.append(text)
+        self.text = text.strip()
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeUserMessage:
+    def __init__(self, errors: list):
+        self.errors = errors
+        self.replies: list[FakeMessage] = []
+
+    async def reply_text(self, text: str) -> FakeMessage:
+        self.replies.append(FakeMessage(text, self.errors))
+        return self.replies[-1]
+
+
+class FakeUpdate:
+    def __init__(self, errors: list = ()):
+        self.message = FakeUserMessage(list(errors))
+        self.effective_chat = SimpleNamespace(id=1)
+
+
+def test_chunks_are_coalesced_into_few_edits():
+    """Chunks arriving faster than edit interval are flushed together."""
+
+    async def main():
+        update = FakeUpdate()
+        reply = StreamingReply(update, edit_interval=0.05)
+        for word in ("Hello", ",", " world", "!"):
+            await reply.add_chunk(GenerationChunk(0, word))
+        await asyncio.sleep(0.1)
+        ids = await reply.finish(["Hello, world!"])
+        return update, ids
+
+    update, ids = asyncio.run(main())
+    (message,) = update.message.replies
+    assert ids == [message.message_id]
+    assert len(message.edits) == 1
+    assert message.text == StreamingReply.format("Hello, world!", 0)
+
+
+def test_failed_edit_is_retried():
+    """Failed edits do not stop streaming nor fail finish."""
+
+    async def main():
+        update = FakeUpdate([NetworkError("connection reset")])
+        reply = StreamingReply(update, edit_interval=0)
+        await reply.add_chunk(GenerationChunk(0, "Hello"))
+        await reply.add_chunk(GenerationChunk(0, " world"))
+        await asyncio.sleep(0.01)
+        ids = await reply.finish(["Hello world"])
+        return update, reply, ids
+
+    update, reply, ids = asyncio.run(main())
+    (message,) = update.message.replies
+    assert ids == [message.message_id]
+    assert not message.deleted
+    assert message.text == StreamingReply.format("Hello world", 0)
+    assert reply._flush_task is None
+
+
+def test_trailing_whitespace_is_not_edited():
+    """Text differing only by whitespace telegram strips is not edited again."""
+
+    async def main():
+        update = FakeUpdate()
+        reply = StreamingReply(update, edit_interval=0)
+        await reply.add_chunk(GenerationChunk(0, "Hello"))
+        await reply.add_chunk(GenerationChunk(0, " \n"))
+        await asyncio.sleep(0.01)
+        await reply.finish(["Hello"])
+        return update
+
+    (message,) = asyncio.run(main()).message.replies
+    assert message.edits == []
+
+
+class StreamingChatApi:
+    """Chat api streaming one answer, remembering whether stream was closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def stream_message(self, telegram_user_id: str, text: str):
+        try:
+            yield GenerationChunk(0, f"{text}, {telegram_user_id}")
+            yield GenerationChoiceResponse([f"{text}, {telegram_user_id}"], "a1")
+            yield GenerationChunk(0, "after answer")
+        finally:
+            self.closed = True
+
+
+class TypingBot:
+    """Bot API recording typing actions."""
+
+    def __init__(self):
+        self.actions: list[tuple[int, str]] = []
+
+    async def send_chat_action(self, chat_id: int, action: str):
+        self.actions.append((chat_id, action))
+
+
+def test_stream_is_closed_when_answer_is_received(monkeypatch):
+    """Stream is closed at once after whole answers, not when it is garbage collected."""
+    monkeypatch.setattr(
+        TgBot,
+        "progress",
+        lambda self, update, **_: ProgressIndicator(TypingBot(), 1, placeholder_delay=None),
+    )
+    api = StreamingChatApi()
+
+    async def main():
+        bot = TgBot("123:token", api, metrics=Registry(), stream_edit_interval=0)
+        generated = await bot.stream_answers(FakeUpdate(), "7", "Hello")
+        return generated, api.closed
+
+    generated, closed = asyncio.run(main())
+    assert closed
+    assert generated[1:] == ("a1", ["Hello, 7"])
+
+
+class ShuffledChat:
+    """User message whose replies arrive after delay given for their text."""
+
+    def __init__(self, delays: dict[str, float]):
+        self.delays = delays
+        self.replies: list[FakeMessage] = []
+
+    async def reply_text(self, text: str) -> FakeMessage:
+        await asyncio.sleep(self.delays[text])
+        self.replies.append(FakeMessage(text, []))
+        return self.replies[-1]
+
+
+def test_variants_arriving_out_of_order_are_shown_in_order():
+    """Texts are moved between messages so chat shows them in given order, others are kept."""
+    chat = ShuffledChat({"first": 0.01, "second": 0.03, "third": 0.02})
+    update = SimpleNamespace(message=chat)
+    ids = asyncio.run(TgBot.send_ordered(update, ["first", "second", "third"]))
+
+    shown = sorted(chat.replies, key=lambda message: message.message_id)
+    assert [message.text for message in shown] == ["first", "second", "third"]
+    assert ids == [message.message_id for message in shown]
+    assert sum(len(message.edits) for message in chat.replies) == 2
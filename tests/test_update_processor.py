@@ -0,0 +1,113 @@
+import asyncio
+
+from telegram import Chat, Message, Update, User
+
+from tg.update_processor import FairSlots, PerUserUpdateProcessor
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = User(user_id, "user", is_bot=False)
+    message = Message(update_id, None, Chat(user_id, Chat.PRIVATE), from_user=user)
+    return Update(update_id, message=message)
+
+
+def test_fair_slots_alternate_owners():
+    """Released slot goes to next owner in line, not to owner with longest queue."""
+    order = []
+
+    async def job(slots: FairSlots, owner: str):
+        await slots.acquire(owner)
+        order.append(owner)
+        await asyncio.sleep(0.01)
+        slots.release()
+
+    async def main():
+        slots = FairSlots(1)
+        jobs = [job(slots, "busy") for _ in range(6)] + [job(slots, "quiet") for _ in range(2)]
+        await asyncio.gather(*jobs)
+        return slots
+
+    slots = asyncio.run(main())
+    assert order[:5] == ["busy", "busy", "quiet", "busy", "quiet"]
+    assert slots.metrics() == {"capacity": 1, "in_use": 0, "waiting": 0}
+
+
+def test_fair_slots_cancelled_waiter_frees_slot():
+    """Cancelled waiter does not keep slot."""
+
+    async def main():
+        slots = FairSlots(1)
+        await slots.acquire("a")
+        waiter = asyncio.create_task(slots.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        slots.release()
+        return slots.metrics()
+
+    assert asyncio.run(main()) == {"capacity": 1, "in_use": 0, "waiting": 0}
+
+
+def test_updates_of_user_keep_order():
+    """Updates of one user run one by one in order, other users are not blocked."""
+    events = []
+
+    async def handle(name: str, delay: float):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    async def main():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4)
+        await asyncio.gather(
+            processor.process_update(make_update(1, 1), handle("1a", 0.03)),
+            processor.process_update(make_update(2, 1), handle("1b", 0)),
+            processor.process_update(make_update(3, 2), handle("2a", 0.01)),
+        )
+        return processor.metrics()
+
+    metrics = asyncio.run(main())
+    assert events.index("end 1a") < events.index("start 1b")
+    assert events.index("end 2a") < events.index("end 1a")
+    assert metrics == {
+        "running": 0,
+        "queued": 0,
+        "users": 0,
+        "max_user_queue_depth": 0,
+        "processed": 3,
+    }
+
+
+def test_cancelled_waiting_update_is_not_queued():
+    """Update cancelled while waiting for user slot or global slot leaves queue."""
+
+    async def main():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=1)
+        release = asyncio.Event()
+        running = asyncio.create_task(
+            processor.do_process_update(make_update(1, 1), release.wait())
+        )
+        handlers = [asyncio.sleep(0), asyncio.sleep(0)]
+        waiting_user = asyncio.create_task(
+            processor.do_process_update(make_update(2, 1), handlers[0])
+        )
+        waiting_global = asyncio.create_task(
+            processor.do_process_update(make_update(3, 2), handlers[1])
+        )
+        await asyncio.sleep(0.01)
+        queued = processor.metrics()["queued"]
+        waiting_user.cancel()
+        waiting_global.cancel()
+        await asyncio.gather(waiting_user, waiting_global, return_exceptions=True)
+        # handlers of cancelled updates never start, close them to avoid unawaited coroutines
+        for handler in handlers:
+            handler.close()
+        release.set()
+        await running
+        return queued, processor.metrics()
+
+    queued, metrics = asyncio.run(main())
+    assert queued == 2
+    assert metrics["queued"] == 0
+    assert metrics["running"] == 0
+    assert metrics["users"] == 0
@@ -0,0 +1,58 @@
+from tg.user_registry import (
+    MemoryUserRegistry,
+    SqliteUserRegistry,
+    TieredUserRegistry,
+    create_user_registry,
+)
+
+
+def test_memory_registry_forgets_expired_and_least_recently_used_users():
+    """Checked user stays, least recently used one is evicted and expired ones are forgotten."""
+    registry = MemoryUserRegistry(max_size=2)
+    registry.add("1")
+    registry.add("2")
+    assert "1" in registry
+    registry.add("3")
+    assert "2" not in registry
+    assert "1" in registry and "3" in registry
+    assert len(registry) == 2
+
+    expired = MemoryUserRegistry(ttl=-1)
+    expired.add("1")
+    assert "1" not in expired
+    assert len(expired) == 0
+
+
+def test_sqlite_registry_survives_restart_until_ttl(tmp_path):
+    """Users are kept in file for next start, expired ones are removed when it is opened."""
+    path = str(tmp_path / "users.db")
+    registry = SqliteUserRegistry(path)
+    registry.add("1")
+    registry.add("2")
+    registry.discard("2")
+    registry.close()
+
+    restarted = SqliteUserRegistry(path)
+    assert "1" in restarted and "2" not in restarted
+    restarted.close()
+
+    expired = SqliteUserRegistry(path, ttl=-1)
+    assert "1" not in expired
+    expired.close()
+
+
+def test_user_found_on_disk_is_promoted_to_memory(tmp_path):
+    """Memory miss is answered by disk tier and remembered in memory."""
+    path = str(tmp_path / "users.db")
+    first = create_user_registry(path)
+    first.add("1")
+    first.close()
+
+    registry = TieredUserRegistry(MemoryUserRegistry(), SqliteUserRegistry(path))
+    assert "1" not in registry.memory
+    assert "1" in registry
+    assert "1" in registry.memory
+
+    registry.discard("1")
+    assert "1" not in registry
+    registry.close()
@@ -1,67 +1,204 @@
 #  type: ignore
+from __future__ import annotations
+
+import asyncio
 import json
+import logging
+import signal
+import time
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
     ApplicationBuilder,
+    BaseRateLimiter,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     MessageHandler,
 )
-
-from api.ChatBotAPI import ChatBotAPI
+from telegram.request import BaseRequest
+
+from api.AsyncChatBotAPI import (
+    DEFAULT_WARM_UP_CONNECTIONS,
+    AsyncChatBotAPI,
+    ChatApiError,
+    GenerationChunk,
+    UserNotFoundError,
+)
+from api.resilience import BackendUnavailableError
+from metrics.registry import REGISTRY, Registry, flatten
+from tg.callback_store import CallbackStore, create_callback_store
 from tg.constants import (
     API_NOT_AVAILABLE,
+    CALLBACK_EXPIRED,
     HELP_MESSAGE,
-    MAX_TEXT_LENGTH,
+    HISTORY_EMPTY,
     NUMBERS,
-    WAITING_FOR_RESPONSE,
+    QUEUE_FULL,
+    QUEUE_POSITION,
+    REQUEST_REJECTED,
+    USER_QUEUE_FULL,
+    VARIANT_TEMPLATE,
+)
+from tg.feedback_log import CHOICE, FeedbackEvent, FeedbackLog
+from tg.generation_queue import (
+    GenerationJob,
+    GenerationQueue,
+    QueueFullError,
+    UserQueueFullError,
+)
+from tg.progress import (
+    DEFAULT_PLACEHOLDER_DELAY,
+    DEFAULT_TYPING_INTERVAL,
+    ProgressIndicator,
 )
+from tg.rate_limiter import TelegramRateLimiter
+from tg.streaming import DEFAULT_EDIT_INTERVAL, StreamingReply
+from tg.telegram_request import InstrumentedRequest
+from tg.update_processor import (
+    DEFAULT_MAX_CONCURRENT_UPDATES,
+    DEFAULT_MAX_CONCURRENT_UPDATES_PER_USER,
+    FairSlots,
+    PerUserUpdateProcessor,
+)
+from tg.user_registry import UserRegistry, create_user_registry
+from tg.webhook import DEFAULT_MAX_CONNECTIONS, DEFAULT_WEBHOOK_PATH, WebhookServer
 
+if TYPE_CHECKING:
+    from tg.metrics_server import MetricsServer
 
-class WaitingMessage:
-    """Class to show waiting message while backend in working."""
+_LOGGER = logging.getLogger(__name__)
 
-    wait_message_id = None
+# same as python-telegram-bot default for bot requests
+TELEGRAM_POOL_SIZE = 256
 
-    def __init__(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-        self.chat_id = update.message.chat_id
-        self.ctx = ctx
-        self.update = update
 
-    async def wait(self):
-        """Show waiting message."""
-        wait_message = await self.update.message.reply_text(WAITING_FOR_RESPONSE)
-        self.wait_message_id = wait_message.message_id
+def legacy_token(ids: list) -> str:
+    """Return callback store token marking legacy JSON keyboard of given messages as used.
 
-    async def stop_wait(self):
-        """Remove waiting message."""
-        await self.ctx.bot.deleteMessage(message_id=self.wait_message_id, chat_id=self.chat_id)
+    Args:
+        ids: ids of variant messages from callback_data of keyboard
+    """
+    return "legacy:" + ",".join(str(message_id) for message_id in sorted(ids))
 
 
 class TgBot:
-    def __init__(self, token: str, chat_bot: ChatBotAPI) -> None:
-        self.app = ApplicationBuilder().token(token).build()
+    # bot wires handlers to all its parts, each of them is configurable from app.py environment
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        token: str,
+        chat_bot: AsyncChatBotAPI,
+        max_concurrent_updates: int = DEFAULT_MAX_CONCURRENT_UPDATES,
+        max_concurrent_updates_per_user: int = DEFAULT_MAX_CONCURRENT_UPDATES_PER_USER,
+        users: UserRegistry | None = None,
+        callbacks: CallbackStore | None = None,
+        stream: bool = False,
+        stream_edit_interval: float = DEFAULT_EDIT_INTERVAL,
+        placeholder_delay: float | None = DEFAULT_PLACEHOLDER_DELAY,
+        typing_interval: float = DEFAULT_TYPING_INTERVAL,
+        base_url: str | None = None,
+        rate_limiter: BaseRateLimiter | None = None,
+        metrics: Registry | None = None,
+        metrics_server: MetricsServer | None = None,
+        generation_queue: GenerationQueue | None = None,
+        warm_up_connections: int = DEFAULT_WARM_UP_CONNECTIONS,
+        request: BaseRequest | None = None,
+        shared_slots: FairSlots | None = None,
+        feedback: FeedbackLog | None = None,
+    ) -> None:
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.metrics_server = metrics_server
+        self.update_processor = PerUserUpdateProcessor(
+            max_concurrent_updates=max_concurrent_updates,
+            max_concurrent_updates_per_user=max_concurrent_updates_per_user,
+            shared_slots=shared_slots,
+        )
+        if request is None:
+            request = InstrumentedRequest(
+                connection_pool_size=TELEGRAM_POOL_SIZE, metrics=self.metrics
+            )
+        builder = (
+            ApplicationBuilder()
+            .token(token)
+            .concurrent_updates(self.update_processor)
+            .rate_limiter(rate_limiter if rate_limiter is not None else TelegramRateLimiter())
+            .request(request)
+            .get_updates_request(InstrumentedRequest(metrics=self.metrics))
+            .post_init(self.on_startup)
+            .post_stop(self.on_stop)
+            .post_shutdown(self.on_shutdown)
+        )
+        if base_url:
+            builder = builder.base_url(base_url)
+        self.app = builder.build()
         self.chat_bot = chat_bot
-        self.users = set()
+        self.users = users if users is not None else create_user_registry()
+        self.callbacks = callbacks if callbacks is not None else create_callback_store()
+        self.stream = stream
+        self.stream_edit_interval = stream_edit_interval
+        self.placeholder_delay = placeholder_delay
+        self.typing_interval = typing_interval
+        self.generation_queue = generation_queue
+        self.warm_up_connections = warm_up_connections
+        self.feedback = feedback
+        self.webhook: WebhookServer | None = None
+        self.metrics.add_collector("tg_bot", self.collect_metrics)
+
+    def collect_metrics(self):
+        """Yield update queue, rate limiter and webhook samples."""
+        yield from flatten("tg_updates", self.update_processor.metrics())
+        rate_limiter = self.app.bot.rate_limiter
+        if isinstance(rate_limiter, TelegramRateLimiter):
+            yield from flatten("tg_rate_limiter", rate_limiter.metrics())
+        if self.webhook is not None:
+            yield from flatten("tg_webhook", self.webhook.metrics())
+        if self.generation_queue is not None:
+            yield from flatten("tg_generation_queue", self.generation_queue.metrics())
+        if self.feedback is not None:
+            yield from flatten("tg_feedback", self.feedback.metrics())
+
+    def instrument(self, name: str, callback: Callable[..., Awaitable[object]]):
+        """Wrap handler callback recording tg_handler_* metrics labeled with handler name.
+
+        Args:
+            name: handler name
+            callback: handler coroutine function
+        """
+
+        async def instrumented(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+            with self.metrics.track("tg_handler", handler=name):
+                return await callback(update, ctx)
+
+        return instrumented
 
     async def get_whole_user_handler(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        # pylint: disable=unused-argument
-        """Return whole user handler
+        """Return whole user handler, /get file sends history as document.
+
         Args:
             update: bot update class
             ctx: bot context
         """
-        telegram_user_id: str = str(update.effective_user.id)
-        response = self.chat_bot.get_user(telegram_user_id)["context"]
-        text = [f"{msg['role']} : {msg['context']}" for msg in response]
-        response = "\n".join(text)
+        # rarely used command, its module is imported on first use to keep startup lean
+        from tg.history_export import (  # pylint: disable=import-outside-toplevel
+            send_history,
+            send_history_document,
+        )
 
-        if len(response) > MAX_TEXT_LENGTH:
-            for x in range(0, len(response), MAX_TEXT_LENGTH):
-                await update.message.reply_text(response[x : x + MAX_TEXT_LENGTH])
-            await update.message.reply_text(response)
+        telegram_user_id: str = str(update.effective_user.id)
+        await self.wait_generation(telegram_user_id)
+        await self.flush_feedback(telegram_user_id)
+        messages = self.chat_bot.iter_context(telegram_user_id)
+        try:
+            if ctx.args and ctx.args[0] in {"file", "document"}:
+                await send_history_document(update, messages)
+            else:
+                await send_history(update, messages)
+        except UserNotFoundError:
+            await update.message.reply_text(HISTORY_EMPTY)
 
     async def remove_user_handler(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         # pylint: disable=unused-argument
@@ -72,12 +209,22 @@ class TgBot:
             ctx: bot context
         """
         telegram_user_id: str = str(update.effective_user.id)
-        response = self.chat_bot.remove_user(telegram_user_id)
+        await self.wait_generation(telegram_user_id)
+        await self.flush_feedback(telegram_user_id)
+        response = await self.chat_bot.remove_user(telegram_user_id)
+        self.users.discard(telegram_user_id)
         await update.message.reply_text(response)
 
-    def check_user(self, telegram_user_id: str, chat_id: str, username: str):
+    async def check_user(self, telegram_user_id: str, chat_id: str, username: str):
+        """Create user in chatbot API unless user registry already knows it.
+
+        Args:
+            telegram_user_id: user id
+            chat_id: id of chat
+            username: telegram username
+        """
         if telegram_user_id not in self.users:
-            self.chat_bot.create_user(
+            await self.chat_bot.create_user(
                 chat_id=chat_id, username=username, telegram_user_id=str(telegram_user_id)
             )
             self.users.add(telegram_user_id)
@@ -90,7 +237,8 @@ class TgBot:
         edit_message_id: str,
         text: str,
     ) -> None:
-        """Handle reply edit model answer.
+        """Handle reply edit model answer, with feedback log message is edited before backend
+        knows about it.
 
         Args:
             telegram_user_id: user id
@@ -99,50 +247,137 @@ class TgBot:
             edit_message_id:  id of message will edit (model answer)
             text: text using to replace model answer
         """
-
-        self.chat_bot.update_user_custom_choice(
-            telegram_user_id=telegram_user_id, message_id=edit_message_id, custom_text=text
-        )
+        if self.feedback is not None:
+            self.feedback.record_custom(telegram_user_id, edit_message_id, text)
+        else:
+            await self.chat_bot.update_user_custom_choice(
+                telegram_user_id=telegram_user_id, message_id=edit_message_id, custom_text=text
+            )
 
         await self.app.bot.editMessageText(chat_id=chat_id, message_id=edit_message_id, text=text)
 
         await self.app.bot.deleteMessage(chat_id=chat_id, message_id=delete_message_id)
 
-    @staticmethod
     async def create_replay_markup(
-        possible_contexts_ids: list[int], answer_id: str
+        self, possible_contexts_ids: list[int], answer_id: str, answers: list | None = None
     ) -> InlineKeyboardMarkup:
         """Create markup to choose model answer.
 
+        Keyboard state is kept in callback store, every button only carries store token and
+        index of its variant.
         Args:
             possible_contexts_ids: id of model answer messages to choose
             answer_id: id of answer from backend
+            answers: texts of variants, chosen one replaces its message without waiting for backend
         """
 
-        buttons = []
-        for message_id, number in zip(possible_contexts_ids, NUMBERS):
-            callback_data = {
-                "ids": [message_id] + list(set(possible_contexts_ids) - {message_id}),
-                "db": answer_id,
-            }
-            button = InlineKeyboardButton(
-                number, callback_data=json.dumps(callback_data, separators=(",", ":"))
-            )
-            buttons.append(button)
-
-        keyboard = [
-            buttons,
-            [
-                InlineKeyboardButton(
-                    "💩", callback_data=json.dumps({"ids": possible_contexts_ids, "db": ""})
-                )
-            ],
+        state = {"ids": possible_contexts_ids, "db": answer_id}
+        if answers is not None:
+            state["texts"] = answers[: len(possible_contexts_ids)]
+        token = self.callbacks.register(state)
+        buttons = [
+            InlineKeyboardButton(number, callback_data=f"{token}:{index}")
+            for index, number in enumerate(NUMBERS[: len(possible_contexts_ids)])
         ]
 
+        keyboard = [buttons, [InlineKeyboardButton("💩", callback_data=f"{token}:")]]
+
         reply_markup = InlineKeyboardMarkup(keyboard)
         return reply_markup
 
+    def progress(self, update: Update, placeholder: bool = True) -> ProgressIndicator:
+        """Return indicator showing user that answer is being generated.
+
+        Args:
+            update: bot update class
+            placeholder: send placeholder message if generation takes longer than threshold
+        """
+        return ProgressIndicator(
+            self.app.bot,
+            update.effective_chat.id,
+            placeholder_delay=self.placeholder_delay if placeholder else None,
+            typing_interval=self.typing_interval,
+        )
+
+    async def send_answers(
+        self, update: Update, telegram_user_id: str, text: str
+    ) -> tuple[list[int], str, list] | None:
+        """Generate answers and send them when all of them are ready.
+
+        Return ids of variant messages, id of answer and answers, None if generation failed.
+        Args:
+            update: bot update class
+            telegram_user_id: id of user in telegram
+            text: user message
+        """
+        async with self.progress(update):
+            response = await self.chat_bot.add_message(telegram_user_id, text)
+        if not response:
+            return None
+
+        texts = [
+            VARIANT_TEMPLATE.format(number=number, answer=answer)
+            for answer, number in zip(response.messages, NUMBERS)
+        ]
+        possible_contexts_ids = await self.send_ordered(update, texts)
+        return possible_contexts_ids, response.answer_id, response.messages
+
+    @staticmethod
+    async def send_ordered(update: Update, texts: list[str]) -> list[int]:
+        """Send messages concurrently and return their ids in order of texts.
+
+        Telegram shows messages in order of arrival, so when concurrent sends arrive out of order
+        texts are moved to messages following order of their ids.
+        Args:
+            update: bot update class
+            texts: texts of messages in order they have to be shown
+        """
+        messages = await asyncio.gather(*(update.message.reply_text(text) for text in texts))
+        order = sorted(range(len(messages)), key=lambda index: messages[index].message_id)
+        await asyncio.gather(
+            *(
+                messages[index].edit_text(texts[position])
+                for position, index in enumerate(order)
+                if position != index
+            )
+        )
+        return [messages[index].message_id for index in order]
+
+    async def stream_answers(
+        self, update: Update, telegram_user_id: str, text: str
+    ) -> tuple[list[int], str, list] | None:
+        """Generate answers editing variant messages while text is generated.
+
+        Return ids of variant messages, id of answer and answers, None if generation failed.
+        Args:
+            update: bot update class
+            telegram_user_id: id of user in telegram
+            text: user message
+        """
+        reply = StreamingReply(update, edit_interval=self.stream_edit_interval)
+        # streamed text shows progress itself, typing is shown only until first chunk
+        progress = self.progress(update, placeholder=False)
+        stream = self.chat_bot.stream_message(telegram_user_id, text)
+        try:
+            async with progress:
+                async for item in stream:
+                    await progress.stop()
+                    if isinstance(item, GenerationChunk):
+                        await reply.add_chunk(item)
+                    else:
+                        ids = await reply.finish(item.messages)
+                        return ids, item.answer_id, item.messages
+        except Exception:
+            await reply.delete()
+            raise
+        finally:
+            # returning inside loop leaves stream suspended, close it to release connection now
+            await stream.aclose()
+        await reply.delete()
+        return None
+
     async def message_handler(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+        # pylint: disable=unused-argument
         """Any message handler, send request to chatbot to generate answer using LLM
         update:
 
@@ -154,7 +389,7 @@ class TgBot:
         text = str(update.message.text)
         chat_id = str(update.message.chat_id)
 
-        self.check_user(
+        await self.check_user(
             telegram_user_id=telegram_user_id,
             chat_id=chat_id,
             username=update.effective_user.username,
@@ -163,6 +398,7 @@ class TgBot:
         if update.message.reply_to_message:
             delete_message_id = str(update.message.message_id)
             edit_message_id = str(update.message.reply_to_message.message_id)
+            await self.wait_generation(telegram_user_id)
             await self.reply_handler(
                 telegram_user_id=telegram_user_id,
                 chat_id=chat_id,
@@ -173,37 +409,70 @@ class TgBot:
 
             return
 
-        wait_message = WaitingMessage(update, ctx)
-        await wait_message.wait()
+        if self.generation_queue is None:
+            await self.answer(update, telegram_user_id, text)
+            return
 
-        response = self.chat_bot.add_message(telegram_user_id, text)
-        if not response:
-            await update.message.reply_text(API_NOT_AVAILABLE)
+        try:
+            position = await self.generation_queue.submit(telegram_user_id, update, text)
+        except UserQueueFullError:
+            await update.message.reply_text(USER_QUEUE_FULL)
+            return
+        except QueueFullError:
+            await update.message.reply_text(QUEUE_FULL)
             return
+        if position:
+            await update.message.reply_text(QUEUE_POSITION.format(position=position))
 
-        answers = response.messages
-        answer_id = response.answer_id
+    async def process_job(self, job: GenerationJob) -> None:
+        """Answer queued messages of user, errors go to error handler like errors of updates.
 
-        texts = [f"Вариант {number}:\n{answer}" for answer, number in zip(answers, NUMBERS)]
+        Args:
+            job: generation job
+        """
+        self.metrics.observe("tg_generation_queue_wait_seconds", time.time() - job.created_at)
+        try:
+            await self.answer(job.update, job.user_id, job.text)
+        except Exception as error:  # pylint: disable=broad-except
+            await self.app.process_error(job.update, error)
 
-        possible_contexts_ids = []
-        for text in texts:
-            message = await update.message.reply_text(text)
-            possible_contexts_ids.append(message.message_id)
+    async def answer(self, update: Update, telegram_user_id: str, text: str) -> None:
+        """Generate answers, send them and keyboard to choose the best one.
 
-        self.chat_bot.update_possible_context_id(
+        Args:
+            update: bot update with user message
+            telegram_user_id: id of user in telegram
+            text: user message
+        """
+        # choices of user are part of context answer is generated from
+        await self.flush_feedback(telegram_user_id)
+        if self.stream:
+            generated = await self.stream_answers(update, telegram_user_id, text)
+        else:
+            generated = await self.send_answers(update, telegram_user_id, text)
+
+        if not generated:
+            await update.message.reply_text(API_NOT_AVAILABLE)
+            return
+
+        possible_contexts_ids, answer_id, answers = generated
+
+        reply_markup = await self.create_replay_markup(
+            possible_contexts_ids=possible_contexts_ids, answer_id=answer_id, answers=answers
+        )
+        update_contexts = self.chat_bot.update_possible_context_id(
             telegram_user_id,
             answer_id,
             possible_contexts_ids=[
                 str(possible_contexts_id) for possible_contexts_id in possible_contexts_ids
             ],
         )
-
-        reply_markup = await self.create_replay_markup(
-            possible_contexts_ids=possible_contexts_ids, answer_id=answer_id
+        # user updates are processed one by one and wait for queued job of user, so backend
+        # knows possible contexts before any button of this keyboard is handled
+        await asyncio.gather(
+            update_contexts,
+            update.message.reply_text("Выберайте лучший ответ", reply_markup=reply_markup),
         )
-        await update.message.reply_text("Выберайте лучший ответ", reply_markup=reply_markup)
-        await wait_message.stop_wait()
 
     async def clear_history_handler(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         # pylint: disable=unused-argument
@@ -215,33 +484,112 @@ class TgBot:
             ctx: bot context
         """
         telegram_user_id: str = str(update.effective_user.id)
-        response = self.chat_bot.clear_history(telegram_user_id)
+        await self.wait_generation(telegram_user_id)
+        await self.flush_feedback(telegram_user_id)
+        response = await self.chat_bot.clear_history(telegram_user_id)
         await update.message.reply_text(response)
 
+    def parse_callback(self, data: str) -> tuple[int, list[int], str, str | None] | None:
+        """Return id of kept message, ids of removed messages, id of chosen answer and its text.
+
+        Id of answer is empty if no variant was chosen, text is None if keyboard does not know it.
+        Return None for unknown, used or malformed keyboard. Keyboard stays usable until
+        forget_callback is called, so choice failed to reach chatbot API can be repeated.
+        Args:
+            data: callback_data of pressed button
+        """
+        if data.startswith("{"):
+            # keyboards sent before callback store was introduced, used ones are kept in store
+            try:
+                legacy = json.loads(data)
+                keep_id, *remove_ids = legacy["ids"]
+                answer_id = legacy["db"]
+            except (ValueError, KeyError, TypeError):
+                return None
+            if self.callbacks.get(legacy_token(legacy["ids"])) is not None:
+                return None
+            return keep_id, remove_ids, answer_id, None
+
+        token, _, index = data.partition(":")
+        state = self.callbacks.get(token)
+        if state is None:
+            return None
+        ids = state["ids"]
+        if not index:
+            return ids[0], ids[1:], "", None
+        try:
+            position = int(index)
+        except ValueError:
+            return None
+        if not 0 <= position < len(ids):
+            return None
+        keep_id = ids[position]
+        texts = state.get("texts")
+        return (
+            keep_id,
+            [message_id for message_id in ids if message_id != keep_id],
+            state["db"],
+            texts[position] if texts and position < len(texts) else None,
+        )
+
+    def forget_callback(self, data: str):
+        """Make keyboard unusable once its choice is handled.
+
+        Args:
+            data: callback_data of pressed button
+        """
+        if data.startswith("{"):
+            self.callbacks.put(legacy_token(json.loads(data)["ids"]), {"used": True})
+        else:
+            self.callbacks.pop(data.partition(":")[0])
+
     async def button(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Parses the CallbackQuery and updates the message text."""
+        """Parses the CallbackQuery and updates the message text.
+
+        With feedback log and known text of chosen variant choice is recorded and message is
+        updated at once, backend gets choice later.
+        """
         query = update.callback_query
 
+        choice = self.parse_callback(query.data)
+        if choice is None:
+            # keyboard is expired, forgotten after restart or was already used
+            await query.answer(CALLBACK_EXPIRED)
+            return
+
         # CallbackQueries need to be answered, even if no notification to the user is needed
         # Some clients may have trouble otherwise. See https://core.telegram.org/bots/api#callbackquery
         await query.answer()
-        query_question_answer = json.loads(query.data)
-        keep_id, *remove_ids = query_question_answer["ids"]
-        for remove_message_id in remove_ids:
-            await context.bot.deleteMessage(
-                chat_id=query.message.chat_id, message_id=remove_message_id
-            )
-        if query_question_answer["db"]:
-            text = self.chat_bot.update_user_choice(
-                telegram_user_id=str(update.effective_user.id),
-                answer_id=query_question_answer["db"],
-                message_id=keep_id,
-            )
-            await context.bot.editMessageText(
-                chat_id=update.callback_query.message.chat_id, message_id=keep_id, text=text
-            )
+        await self.wait_generation(str(update.effective_user.id))
+        keep_id, remove_ids, answer_id, text = choice
+        chosen = None
+        if answer_id:
+            telegram_user_id = str(update.effective_user.id)
+            if self.feedback is not None and text is not None:
+                self.feedback.record_choice(telegram_user_id, answer_id, keep_id)
+                chosen = text
+            else:
+                # keyboard is kept if chatbot API fails, so user can choose again
+                chosen = await self.chat_bot.update_user_choice(
+                    telegram_user_id=telegram_user_id, answer_id=answer_id, message_id=keep_id
+                )
+        self.forget_callback(query.data)
+
+        async def show_choice():
+            if chosen is not None:
+                await context.bot.editMessageText(
+                    chat_id=query.message.chat_id, message_id=keep_id, text=chosen
+                )
 
-        await query.delete_message()
+        # deletes sent together are merged into one call by rate limiter
+        await asyncio.gather(
+            *(
+                context.bot.deleteMessage(chat_id=query.message.chat_id, message_id=message_id)
+                for message_id in remove_ids
+            ),
+            query.delete_message(),
+            show_choice(),
+        )
 
     async def get_help(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         # pylint: disable=unused-argument
@@ -253,7 +601,7 @@ class TgBot:
             ctx: bot context
         """
         help_msg = HELP_MESSAGE
-        self.chat_bot.create_user(
+        await self.check_user(
             chat_id=str(update.message.chat_id),
             username=update.effective_user.username,
             telegram_user_id=str(update.effective_user.id),
@@ -261,12 +609,205 @@ class TgBot:
 
         await update.message.reply_text(help_msg)
 
+    async def wait_generation(self, telegram_user_id: str) -> None:
+        """Wait for queued messages of user to be answered before handling next update of user.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+        if self.generation_queue is not None:
+            await self.generation_queue.wait_user(telegram_user_id)
+
+    async def flush_feedback(self, telegram_user_id: str) -> None:
+        """Deliver recorded choices of user before request depending on them.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+        if self.feedback is not None:
+            await self.feedback.flush_user(telegram_user_id)
+
+    async def deliver_feedback(self, event: FeedbackEvent) -> None:
+        """Send recorded choice or custom answer to chatbot API.
+
+        Args:
+            event: feedback event
+        """
+        if event.kind == CHOICE:
+            await self.chat_bot.update_user_choice(
+                telegram_user_id=event.user_id,
+                answer_id=event.answer_id,
+                message_id=event.message_id,
+            )
+        else:
+            await self.chat_bot.update_user_custom_choice(
+                telegram_user_id=event.user_id,
+                message_id=event.message_id,
+                custom_text=event.text,
+            )
+
+    async def on_startup(self, app) -> None:
+        # pylint: disable=unused-argument
+        """Start metrics server, open connections to chatbot API, start generation workers and
+        feedback delivery."""
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        await self.chat_bot.warm_up(self.warm_up_connections)
+        if self.feedback is not None:
+            await self.feedback.start(self.deliver_feedback)
+        if self.generation_queue is not None:
+            await self.generation_queue.start(self.process_job, self.app.bot)
+
+    async def on_stop(self, app) -> None:
+        # pylint: disable=unused-argument
+        """Stop generation workers while bot can still send messages, deliver feedback."""
+        if self.generation_queue is not None:
+            await self.generation_queue.stop()
+        if self.feedback is not None:
+            await self.feedback.stop()
+
+    async def on_shutdown(self, app) -> None:
+        # pylint: disable=unused-argument
+        """Stop metrics server, close chatbot API connection pool and local stores."""
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.chat_bot.aclose()
+        self.users.close()
+        self.callbacks.close()
+        if self.generation_queue is not None:
+            self.generation_queue.close()
+        if self.feedback is not None:
+            self.feedback.close()
+
+    async def on_error(self, update: object, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+        """Answer user when chatbot API is not available or rejects request, log other errors.
+
+        Args:
+            update: update which caused error, may be None
+            ctx: bot context with error
+        """
+        if isinstance(ctx.error, BackendUnavailableError):
+            _LOGGER.warning("Chatbot API is not available: %r", ctx.error)
+            text = API_NOT_AVAILABLE
+        elif isinstance(ctx.error, ChatApiError):
+            _LOGGER.warning("Chatbot API rejected request: %s", ctx.error)
+            text = REQUEST_REJECTED
+        else:
+            _LOGGER.error("Error while handling update", exc_info=ctx.error)
+            return
+        if isinstance(update, Update) and update.effective_message is not None:
+            await update.effective_message.reply_text(text)
+
+    def add_handlers(self):
+        """Register bot handlers."""
+        self.app.add_error_handler(self.on_error)
+        self.app.add_handler(
+            CommandHandler(command="start", callback=self.instrument("start", self.get_help))
+        )
+        self.app.add_handler(CallbackQueryHandler(self.instrument("button", self.button)))
+        self.app.add_handler(
+            CommandHandler(command="help", callback=self.instrument("help", self.get_help))
+        )
+        self.app.add_handler(
+            CommandHandler(
+                command="get", callback=self.instrument("get", self.get_whole_user_handler)
+            )
+        )
+        self.app.add_handler(
+            CommandHandler(
+                command="clear", callback=self.instrument("clear", self.clear_history_handler)
+            )
+        )
+        self.app.add_handler(
+            MessageHandler(filters=None, callback=self.instrument("message", self.message_handler))
+        )
+
     def run(self):
         """Run bot."""
-        self.app.add_handler(CommandHandler(command="start", callback=self.get_help))
-        self.app.add_handler(CallbackQueryHandler(self.button))
-        self.app.add_handler(CommandHandler(command="help", callback=self.get_help))
-        # self.app.add_handler(CommandHandler(command="get", callback=self.get_whole_user_handler))
-        self.app.add_handler(CommandHandler(command="clear", callback=self.clear_history_handler))
-        self.app.add_handler(MessageHandler(filters=None, callback=self.message_handler))
+        self.add_handlers()
         self.app.run_polling()
+
+    async def start(self):
+        """Start receiving updates with long polling on running loop shared with other bots."""
+        self.add_handlers()
+        await self.app.initialize()
+        await self.on_startup(self.app)
+        await self.app.updater.start_polling()
+        await self.app.start()
+
+    async def stop(self):
+        """Stop receiving updates, process received ones and shut down, also after failed start."""
+        if self.app.updater.running:
+            await self.app.updater.stop()
+        if self.app.running:
+            # application processes updates already in queue before it stops
+            await self.app.stop()
+        await self.on_stop(self.app)
+        await self.app.shutdown()
+        await self.on_shutdown(self.app)
+
+    def run_webhook(
+        self,
+        listen: str,
+        port: int,
+        secret_token: str,
+        url_path: str = DEFAULT_WEBHOOK_PATH,
+        webhook_url: str | None = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ):
+        """Run bot receiving updates with webhook until SIGINT or SIGTERM.
+
+        Args:
+            listen: address to listen on
+            port: port to listen on
+            secret_token: secret token telegram sends with every update, updates without it are
+                rejected
+            url_path: path telegram posts updates to
+            webhook_url: public url registered in telegram, None if other replica registers it
+            max_connections: max number of connections telegram opens to webhook
+
+        Raises:
+            ValueError: secret token is empty
+        """
+        if not secret_token:
+            raise ValueError("webhook requires secret token")
+        self.add_handlers()
+        self.webhook = WebhookServer(
+            self.app, listen, port, url_path=url_path, secret_token=secret_token
+        )
+        loop = asyncio.get_event_loop()
+        stop_event = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop_event.set)
+        loop.run_until_complete(
+            self.serve_webhook(
+                stop_event, webhook_url=webhook_url, max_connections=max_connections
+            )
+        )
+
+    async def serve_webhook(
+        self,
+        stop_event: asyncio.Event,
+        webhook_url: str | None = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ):
+        """Serve webhook until stop event, then drain received updates and shut down.
+
+        Args:
+            stop_event: event signaling shutdown
+            webhook_url: public url registered in telegram, None if other replica registers it
+            max_connections: max number of connections telegram opens to webhook
+        """
+        await self.app.initialize()
+        await self.on_startup(self.app)
+        await self.app.start()
+        try:
+            await self.webhook.start(webhook_url=webhook_url, max_connections=max_connections)
+            await stop_event.wait()
+        finally:
+            await self.webhook.stop()
+            # application processes updates already in queue before it stops
+            await self.app.stop()
+            await self.on_stop(self.app)
+            await self.app.shutdown()
+            await self.on_shutdown(self.app)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+import secrets
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+DEFAULT_CALLBACK_STORE_SIZE = 10_000
+DEFAULT_CALLBACK_TTL = 60 * 60 * 24 * 7
+TOKEN_BYTES = 8
+
+
+class CallbackStore(ABC):
+    """Server-side state of inline keyboards, callback_data only carries short token."""
+
+    @abstractmethod
+    def put(self, token: str, state: dict):
+        """Remember keyboard state.
+
+        Args:
+            token: token sent in callback_data
+            state: keyboard state
+        """
+
+    @abstractmethod
+    def get(self, token: str) -> dict | None:
+        """Return keyboard state, None if it is unknown, expired or already used.
+
+        Args:
+            token: token from callback_data
+        """
+
+    @abstractmethod
+    def pop(self, token: str) -> dict | None:
+        """Return keyboard state and forget it, None if it is unknown, expired or already used.
+
+        Args:
+            token: token from callback_data
+        """
+
+    def register(self, state: dict) -> str:
+        """Remember keyboard state under new random token and return token.
+
+        Args:
+            state: keyboard state
+        """
+        token = secrets.token_urlsafe(TOKEN_BYTES)
+        self.put(token, state)
+        return token
+
+    def close(self):
+        """Free resources."""
+
+
+class MemoryCallbackStore(CallbackStore):
+    """In-memory store with LRU eviction and TTL expiry."""
+
+    def __init__(
+        self, max_size: int = DEFAULT_CALLBACK_STORE_SIZE, ttl: float = DEFAULT_CALLBACK_TTL
+    ):
+        """
+        Args:
+            max_size: max number of remembered keyboards
+            ttl: seconds keyboard stays usable
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._states: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def put(self, token: str, state: dict):
+        self._states[token] = (time.monotonic() + self.ttl, state)
+        self._states.move_to_end(token)
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+
+    def get(self, token: str) -> dict | None:
+        item = self._states.get(token)
+        if item is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def pop(self, token: str) -> dict | None:
+        item = self._states.pop(token, None)
+        if item is None:
+            return None
+        expire_at, state = item
+        if expire_at < time.monotonic():
+            return None
+        return state
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class SqliteCallbackStore(CallbackStore):
+    """Store in local SQLite file, keyboards keep working after bot restarts."""
+
+    def __init__(self, path: str, ttl: float = DEFAULT_CALLBACK_TTL):
+        """
+        Args:
+            path: path to SQLite database file
+            ttl: seconds keyboard stays usable
+        """
+        self.path = path
+        self.ttl = ttl
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS callbacks "
+            "(token TEXT PRIMARY KEY, state TEXT NOT NULL, added_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "DELETE FROM callbacks WHERE added_at < ?", (self._expired_before(),)
+        )
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl
+
+    def put(self, token: str, state: dict):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO callbacks (token, state, added_at) VALUES (?, ?, ?)",
+            (token, json.dumps(state, separators=(",", ":")), time.time()),
+        )
+
+    def get(self, token: str) -> dict | None:
+        row = self._connection.execute(
+            "SELECT state FROM callbacks WHERE token = ? AND added_at >= ?",
+            (token, self._expired_before()),
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def pop(self, token: str) -> dict | None:
+        row = self._connection.execute(
+            "SELECT state, added_at FROM callbacks WHERE token = ?", (token,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._connection.execute("DELETE FROM callbacks WHERE token = ?", (token,))
+        if row[1] < self._expired_before():
+            return None
+        return json.loads(row[0])
+
+    def close(self):
+        self._connection.close()
+
+
+class TieredCallbackStore(CallbackStore):
+    """Memory store in front of optional disk store."""
+
+    def __init__(self, memory: MemoryCallbackStore, disk: CallbackStore | None = None):
+        """
+        Args:
+            memory: fast in-memory tier
+            disk: persistent tier, checked on memory miss
+        """
+        self.memory = memory
+        self.disk = disk
+
+    def put(self, token: str, state: dict):
+        self.memory.put(token, state)
+        if self.disk is not None:
+            self.disk.put(token, state)
+
+    def get(self, token: str) -> dict | None:
+        state = self.memory.get(token)
+        if state is None and self.disk is not None:
+            state = self.disk.get(token)
+        return state
+
+    def pop(self, token: str) -> dict | None:
+        state = self.memory.pop(token)
+        if self.disk is not None:
+            disk_state = self.disk.pop(token)
+            if state is None:
+                state = disk_state
+        return state
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+def create_callback_store(
+    path: str | None = None,
+    max_size: int = DEFAULT_CALLBACK_STORE_SIZE,
+    ttl: float = DEFAULT_CALLBACK_TTL,
+) -> TieredCallbackStore:
+    """Create callback store, persistent if path to SQLite file is given.
+
+    Args:
+        path: path to SQLite database file, None keeps keyboards only in memory
+        max_size: max number of keyboards kept in memory
+        ttl: seconds keyboard stays usable
+    """
+    disk = SqliteCallbackStore(path, ttl=ttl) if path else None
+    return TieredCallbackStore(MemoryCallbackStore(max_size=max_size, ttl=ttl), disk)
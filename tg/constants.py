@@ -3,6 +3,20 @@ API_NOT_AVAILABLE = "К сожалению в данный момент я от
 
 WAITING_FOR_RESPONSE = "Думаю над ответом 🤔 ...."
 
+VARIANT_TEMPLATE = "Вариант {number}:\n{answer}"
+
+HISTORY_EMPTY = "История пуста."
+
+CALLBACK_EXPIRED = "Этот выбор уже недоступен."
+
+REQUEST_REJECTED = "Не получилось, попробуйте ещё раз."
+
+QUEUE_POSITION = "Вы {position}-й в очереди, отвечу как только освобожусь."
+
+QUEUE_FULL = "Сейчас слишком много вопросов, попробуйте чуть позже."
+
+USER_QUEUE_FULL = "Дождитесь ответа на предыдущие сообщения."
+
 MAX_TEXT_LENGTH = 2048
 
 HELP_MESSAGE = f"""Привет! Это цифровой двойник Забика {VERSION}
@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+
+from api.resilience import BackendUnavailableError, backoff_delay
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_SYNC_INTERVAL = 0.1
+DEFAULT_FLUSH_CONCURRENCY = 8
+DEFAULT_COMPACT_SIZE = 1 << 20
+MAX_RETRY_DELAY = 60.0
+
+CHOICE = "choice"
+CUSTOM = "custom"
+
+
+@dataclass
+class FeedbackEvent:
+    """Variant chosen by user or answer user replaced with own text."""
+
+    seq: int
+    kind: str
+    user_id: str
+    # sent to chatbot API as it was given by bot
+    message_id: int | str
+    answer_id: str = ""
+    text: str = ""
+    created_at: float = field(default_factory=time.time)
+
+
+class FeedbackStore:
+    """Store of undelivered events, this one keeps nothing and events are lost on restart."""
+
+    @property
+    def dirty(self) -> bool:
+        """Store has changes which are not synced yet."""
+        return False
+
+    def append(self, event: FeedbackEvent):
+        """Remember new event.
+
+        Args:
+            event: new event
+        """
+
+    def ack(self, event: FeedbackEvent):
+        """Forget delivered event.
+
+        Args:
+            event: stored event
+        """
+
+    def load(self) -> list[FeedbackEvent]:
+        """Return undelivered events in order they were recorded."""
+        return []
+
+    def sync(self):
+        """Make changes durable, blocking call run outside of event loop."""
+
+    def close(self):
+        """Free resources."""
+
+
+class JsonlFeedbackStore(FeedbackStore):
+    """Append-only JSON lines file, undelivered events are delivered after restart.
+
+    Events and acknowledgements of delivered events are appended as lines and fsynced in
+    batches. Once file grows over compact_size it is rewritten with undelivered events only.
+    """
+
+    def __init__(self, path: str, compact_size: int = DEFAULT_COMPACT_SIZE):
+        """
+        Args:
+            path: path to log file
+            compact_size: size of file in bytes after which it is compacted
+        """
+        self.path = path
+        self.compact_size = compact_size
+        self._lock = threading.Lock()
+        # sync may still run in thread of cancelled task when log is stopped
+        self._sync_lock = threading.Lock()
+        self._lines: list[str] = []
+        self._unacked: dict[int, str] = {}
+        self._file = open(path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._lines)
+
+    def append(self, event: FeedbackEvent):
+        line = json.dumps(asdict(event), ensure_ascii=False)
+        with self._lock:
+            self._lines.append(line)
+            self._unacked[event.seq] = line
+
+    def ack(self, event: FeedbackEvent):
+        with self._lock:
+            self._lines.append(json.dumps({"ack": event.seq}))
+            self._unacked.pop(event.seq, None)
+
+    def load(self) -> list[FeedbackEvent]:
+        events: dict[int, FeedbackEvent] = {}
+        with open(self.path, encoding="utf-8") as log_file:
+            for number, line in enumerate(log_file, 1):
+                try:
+                    record = json.loads(line)
+                    if "ack" in record:
+                        events.pop(record["ack"], None)
+                    else:
+                        events[record["seq"]] = FeedbackEvent(**record)
+                except (ValueError, TypeError, KeyError):
+                    # last line may be cut by crash while it was written
+                    _LOGGER.warning("Skipped broken line %s of feedback log %s", number, self.path)
+        with self._lock:
+            for seq, event in sorted(events.items()):
+                self._unacked[seq] = json.dumps(asdict(event), ensure_ascii=False)
+        return [event for _, event in sorted(events.items())]
+
+    def sync(self):
+        with self._sync_lock:
+            with self._lock:
+                lines, self._lines = self._lines, []
+            if lines:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            if self._file.tell() > self.compact_size:
+                self._compact()
+
+    def _compact(self):
+        """Rewrite file with undelivered events, buffered lines are written to new file."""
+        with self._lock:
+            self._lines = []
+            lines = list(self._unacked.values())
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as log_file:
+            log_file.write("".join(line + "\n" for line in lines))
+            log_file.flush()
+            os.fsync(log_file.fileno())
+        self._file.close()
+        os.replace(temporary, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
+class FeedbackLog:
+    """Feedback events recorded at once and delivered to chatbot API in background.
+
+    Events of one user are delivered in order they were recorded, events of different users
+    concurrently. Delivery stops at first event which fails with BackendUnavailableError and is
+    retried with backoff, event failing otherwise is dropped. Events of user should be flushed
+    before next request depending on them, e.g. generation of next answer.
+    """
+
+    # delivery state and counters exported as metrics
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        store: FeedbackStore | None = None,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        sync_interval: float = DEFAULT_SYNC_INTERVAL,
+        concurrency: int = DEFAULT_FLUSH_CONCURRENCY,
+    ):
+        """
+        Args:
+            store: store of undelivered events, in-memory if None
+            flush_interval: seconds between deliveries, first retry delay of failed delivery
+            sync_interval: max seconds recorded event waits for sync of store
+            concurrency: number of users whose events are delivered at the same time
+        """
+        self.store = store if store is not None else FeedbackStore()
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self.concurrency = concurrency
+        self._seq = itertools.count(1)
+        self._pending: dict[str, deque[FeedbackEvent]] = {}
+        self._delivering: dict[str, asyncio.Task] = {}
+        self._deliver: Callable[[FeedbackEvent], Awaitable[object]] | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.failures = 0
+        self.recorded = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.retried = 0
+
+    def __len__(self) -> int:
+        return sum(len(events) for events in self._pending.values())
+
+    def record_choice(self, user_id: str, answer_id: str, message_id: int | str) -> FeedbackEvent:
+        """Record variant chosen by user.
+
+        Args:
+            user_id: id of user in telegram
+            answer_id: id of answer
+            message_id: id of message with chosen variant
+        """
+        return self._record(CHOICE, user_id, message_id, answer_id=answer_id)
+
+    def record_custom(self, user_id: str, message_id: int | str, text: str) -> FeedbackEvent:
+        """Record answer replaced by user with own text.
+
+        Args:
+            user_id: id of user in telegram
+            message_id: id of message with replaced answer
+            text: text of user
+        """
+        return self._record(CUSTOM, user_id, message_id, text=text)
+
+    def _record(self, kind: str, user_id: str, message_id: int | str, **fields) -> FeedbackEvent:
+        event = FeedbackEvent(next(self._seq), kind, user_id, message_id, **fields)
+        self.store.append(event)
+        self._pending.setdefault(user_id, deque()).append(event)
+        self.recorded += 1
+        return event
+
+    async def start(self, deliver: Callable[[FeedbackEvent], Awaitable[object]]):
+        """Restore undelivered events and start background sync and delivery.
+
+        Args:
+            deliver: coroutine function sending event to chatbot API
+        """
+        self._deliver = deliver
+        self._slots = asyncio.Semaphore(self.concurrency)
+        events = self.store.load()
+        for event in events:
+            self._pending.setdefault(event.user_id, deque()).append(event)
+        if events:
+            self._seq = itertools.count(events[-1].seq + 1)
+            _LOGGER.info("Restored %s undelivered feedback events", len(events))
+        self._tasks = [asyncio.create_task(self._sync_loop()), asyncio.create_task(self._run())]
+
+    async def _sync_loop(self):
+        """Sync recorded events in batches."""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            if self.store.dirty:
+                await asyncio.to_thread(self.store.sync)
+
+    async def _run(self):
+        """Deliver events periodically, backing off while chatbot API is not available."""
+        while True:
+            if self.failures:
+                delay = backoff_delay(
+                    self.failures - 1, base=self.flush_interval, cap=MAX_RETRY_DELAY
+                )
+            else:
+                delay = self.flush_interval
+            await asyncio.sleep(delay)
+            if self._pending:
+                await self.flush()
+
+    async def flush(self) -> bool:
+        """Deliver events of all users, return False if some of them are left for retry."""
+        delivered = await asyncio.gather(
+            *(self.flush_user(user_id) for user_id in list(self._pending))
+        )
+        if all(delivered):
+            self.failures = 0
+            return True
+        self.failures += 1
+        return False
+
+    async def flush_user(self, user_id: str) -> bool:
+        """Deliver events of user, return False if some of them are left for retry.
+
+        Args:
+            user_id: id of user in telegram
+        """
+        if user_id not in self._pending:
+            return True
+        task = self._delivering.get(user_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._deliver_user(user_id))
+            self._delivering[user_id] = task
+            task.add_done_callback(lambda _: self._forget_task(user_id, task))
+        # caller being cancelled does not interrupt delivery
+        return await asyncio.shield(task)
+
+    def _forget_task(self, user_id: str, task: asyncio.Task):
+        if self._delivering.get(user_id) is task:
+            del self._delivering[user_id]
+
+    async def _deliver_user(self, user_id: str) -> bool:
+        """Deliver events of user one by one while chatbot API accepts them."""
+        async with self._slots:
+            events = self._pending.get(user_id, deque())
+            while events:
+                event = events[0]
+                try:
+                    await self._deliver(event)
+                except BackendUnavailableError as error:
+                    self.retried += 1
+                    _LOGGER.warning("Feedback event %s is not delivered: %r", event.seq, error)
+                    return False
+                except Exception:  # pylint: disable=broad-except
+                    self.dropped += 1
+                    _LOGGER.exception("Feedback event %s is dropped", event.seq)
+                else:
+                    self.delivered += 1
+                events.popleft()
+                self.store.ack(event)
+            self._pending.pop(user_id, None)
+            return True
+
+    async def stop(self):
+        """Stop background tasks, deliver what chatbot API accepts and sync the rest."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._deliver is not None and self._pending:
+            await self.flush()
+        if self._pending:
+            _LOGGER.warning("%s feedback events are not delivered", len(self))
+        await asyncio.to_thread(self.store.sync)
+
+    def close(self):
+        """Free resources."""
+        self.store.close()
+
+    def metrics(self) -> dict:
+        """Return number of undelivered events, age of oldest of them and counters."""
+        oldest = min((events[0].created_at for events in self._pending.values()), default=None)
+        return {
+            "pending": len(self),
+            "oldest_pending_seconds": time.time() - oldest if oldest is not None else 0,
+            "recorded": self.recorded,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dropped": self.dropped,
+        }
+
+
+def create_feedback_log(
+    path: str | None = None,
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    sync_interval: float = DEFAULT_SYNC_INTERVAL,
+) -> FeedbackLog:
+    """Create feedback log, persistent if path to log file is given.
+
+    Args:
+        path: path to JSON lines log file, None keeps events only in memory
+        flush_interval: seconds between deliveries to chatbot API
+        sync_interval: max seconds recorded event waits for fsync
+    """
+    store = JsonlFeedbackStore(path) if path else None
+    return FeedbackLog(store, flush_interval=flush_interval, sync_interval=sync_interval)
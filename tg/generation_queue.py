@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from telegram import Bot, Update
+
+_LOGGER = logging.getLogger(__name__)
+
+# queue is opt-in, without it messages are answered as their updates are processed
+DEFAULT_GENERATION_WORKERS = 0
+DEFAULT_GENERATION_QUEUE_SIZE = 256
+DEFAULT_MAX_MERGED_MESSAGES = 5
+DEFAULT_STOP_TIMEOUT = 30.0
+
+
+class QueueFullError(Exception):
+    """Queue has no room for new job."""
+
+
+class UserQueueFullError(QueueFullError):
+    """Queued job of user already has max number of messages."""
+
+
+@dataclass
+class GenerationJob:
+    """Messages of user waiting for one generated answer."""
+
+    user_id: str
+    update: Update
+    texts: list[str]
+    created_at: float = field(default_factory=time.time)
+    job_id: int | None = None
+
+    @property
+    def text(self) -> str:
+        """Merged text of all messages."""
+        return "\n".join(self.texts)
+
+
+class JobStore:
+    """Store of queued jobs, this one keeps nothing and jobs are lost on restart."""
+
+    @property
+    def durable(self) -> bool:
+        """Stored jobs survive restart."""
+        return False
+
+    def add(self, job: GenerationJob):
+        """Remember new job.
+
+        Args:
+            job: new job with id
+        """
+
+    def update(self, job: GenerationJob):
+        """Remember changed messages of job.
+
+        Args:
+            job: stored job
+        """
+
+    def remove(self, job: GenerationJob):
+        """Forget finished job.
+
+        Args:
+            job: stored job
+        """
+
+    def load(self, bot: Bot) -> list[GenerationJob]:  # pylint: disable=unused-argument
+        """Return unfinished jobs in order they were added.
+
+        Args:
+            bot: bot restored updates are bound to
+        """
+        return []
+
+    def close(self):
+        """Free resources."""
+
+
+class SqliteJobStore(JobStore):
+    """Store in local SQLite file, queued and interrupted jobs are run again after restart.
+
+    Changes are written outside of event loop, queue runs one of them at a time.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: path to SQLite database file
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "user_id TEXT NOT NULL, update_data TEXT NOT NULL, texts TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+
+    @property
+    def durable(self) -> bool:
+        return True
+
+    def add(self, job: GenerationJob):
+        self._connection.execute(
+            "INSERT INTO jobs (id, user_id, update_data, texts, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job.job_id, job.user_id, job.update.to_json(), json.dumps(job.texts), job.created_at),
+        )
+
+    def update(self, job: GenerationJob):
+        self._connection.execute(
+            "UPDATE jobs SET update_data = ?, texts = ? WHERE id = ?",
+            (job.update.to_json(), json.dumps(job.texts), job.job_id),
+        )
+
+    def remove(self, job: GenerationJob):
+        self._connection.execute("DELETE FROM jobs WHERE id = ?", (job.job_id,))
+
+    def load(self, bot: Bot) -> list[GenerationJob]:
+        rows = self._connection.execute(
+            "SELECT id, user_id, update_data, texts, created_at FROM jobs ORDER BY id"
+        ).fetchall()
+        return [
+            GenerationJob(
+                user_id=user_id,
+                update=Update.de_json(json.loads(update_data), bot),
+                texts=json.loads(texts),
+                created_at=created_at,
+                job_id=job_id,
+            )
+            for job_id, user_id, update_data, texts, created_at in rows
+        ]
+
+    def close(self):
+        self._connection.close()
+
+
+class GenerationQueue:
+    """Bounded queue of generation jobs run by fixed number of workers.
+
+    User has at most one job waiting: messages sent before it starts are merged into it. Jobs of
+    one user never run at the same time, job of user whose answer is being generated waits until
+    that answer is sent and only then joins the queue. Other updates of user wait for its jobs
+    with wait_user, so they are handled in order they were sent.
+    """
+
+    # queue state by user and counters exported as metrics
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        workers: int,
+        max_size: int = DEFAULT_GENERATION_QUEUE_SIZE,
+        max_merged_messages: int = DEFAULT_MAX_MERGED_MESSAGES,
+        store: JobStore | None = None,
+    ):
+        """
+        Args:
+            workers: number of jobs run at the same time, match it to backend capacity
+            max_size: max number of waiting jobs
+            max_merged_messages: max number of messages merged into one job
+            store: store of waiting jobs, in-memory if None
+        """
+        if workers < 1:
+            raise ValueError("`workers` must be a positive integer!")
+        self.workers = workers
+        self.max_size = max_size
+        self.max_merged_messages = max_merged_messages
+        self.store = store if store is not None else JobStore()
+        self._ids = itertools.count(1)
+        self._pending: deque[GenerationJob] = deque()
+        # waiting jobs by user, both pending and deferred until current job of user finishes
+        self._waiting: dict[str, GenerationJob] = {}
+        self._deferred: dict[str, GenerationJob] = {}
+        self._running: dict[str, GenerationJob] = {}
+        self._finished: dict[str, asyncio.Event] = {}
+        self._ready: asyncio.Semaphore | None = None
+        self._store_lock: asyncio.Lock | None = None
+        self._stopping = False
+        self._tasks: list[asyncio.Task] = []
+        self._handler: Callable[[GenerationJob], Awaitable[None]] | None = None
+        self.idle_workers = 0
+        self.merged = 0
+        self.rejected = 0
+        self.processed = 0
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    def position(self, job: GenerationJob) -> int:
+        """Return number of jobs to wait for before job starts, 0 if it starts right away.
+
+        Args:
+            job: waiting job
+        """
+        if job.user_id in self._deferred:
+            return max(1, len(self._pending) + 1 - self.idle_workers)
+        return max(0, self._pending.index(job) + 1 - self.idle_workers)
+
+    async def submit(self, user_id: str, update: Update, text: str) -> int:
+        """Queue message of user and return its position in line, 0 if it starts right away.
+
+        Args:
+            user_id: id of user in telegram
+            update: update with message, answers are sent in reply to it
+            text: user message
+
+        Raises:
+            RuntimeError: queue is not started
+            UserQueueFullError: waiting job of user has max number of messages
+            QueueFullError: queue has max number of waiting jobs
+        """
+        if self._ready is None:
+            raise RuntimeError("generation queue is not started")
+        job = self._waiting.get(user_id)
+        if job is not None:
+            if len(job.texts) >= self.max_merged_messages:
+                self.rejected += 1
+                raise UserQueueFullError(user_id)
+            job.texts.append(text)
+            job.update = update
+            self.merged += 1
+            position = self.position(job)
+            await self._persist(self.store.update, job)
+            return position
+
+        if len(self._waiting) >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(user_id)
+        job = GenerationJob(user_id=user_id, update=update, texts=[text], job_id=next(self._ids))
+        self._enqueue(job)
+        position = self.position(job)
+        await self._persist(self.store.add, job)
+        return position
+
+    async def _persist(self, change: Callable[[GenerationJob], None], job: GenerationJob):
+        """Write change of job to store outside of event loop, in order changes were made."""
+        async with self._store_lock:
+            await asyncio.to_thread(change, job)
+
+    async def wait_user(self, user_id: str):
+        """Wait until queued messages of user are answered or queue stops.
+
+        Args:
+            user_id: id of user in telegram
+        """
+        while self._tasks and (user_id in self._waiting or user_id in self._running):
+            await self._finished.setdefault(user_id, asyncio.Event()).wait()
+
+    def _finish_user(self, user_id: str):
+        finished = self._finished.pop(user_id, None)
+        if finished is not None:
+            finished.set()
+
+    def _enqueue(self, job: GenerationJob):
+        self._waiting[job.user_id] = job
+        if job.user_id in self._running:
+            self._deferred[job.user_id] = job
+        else:
+            self._pending.append(job)
+            self._ready.release()
+
+    def _should_exit(self) -> bool:
+        """Stopping queue runs no new jobs, unless they would be lost with in-memory store."""
+        return self._stopping and (self.store.durable or not self._pending)
+
+    async def _work(self):
+        """Run pending jobs one by one."""
+        while not self._should_exit():
+            self.idle_workers += 1
+            try:
+                await self._ready.acquire()
+            finally:
+                self.idle_workers -= 1
+            if self._should_exit():
+                return
+            job = self._pending.popleft()
+            del self._waiting[job.user_id]
+            self._running[job.user_id] = job
+            try:
+                await self._handler(job)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Generation job %s failed", job.job_id)
+            finally:
+                del self._running[job.user_id]
+                deferred = self._deferred.pop(job.user_id, None)
+                if deferred is not None:
+                    self._pending.append(deferred)
+                    self._ready.release()
+                self._finish_user(job.user_id)
+            # cancelled job stays in store and is run again after restart
+            await self._persist(self.store.remove, job)
+            self.processed += 1
+
+    async def start(self, handler: Callable[[GenerationJob], Awaitable[None]], bot: Bot):
+        """Restore stored jobs and start workers.
+
+        Args:
+            handler: coroutine function generating and sending answer of job
+            bot: bot restored updates are bound to
+        """
+        self._handler = handler
+        self._ready = asyncio.Semaphore(0)
+        self._store_lock = asyncio.Lock()
+        self._stopping = False
+        for job in self.store.load(bot):
+            if job.user_id in self._waiting:
+                # both jobs of user were stored when bot stopped, merge them
+                waiting = self._waiting[job.user_id]
+                waiting.texts.extend(job.texts)
+                waiting.update = job.update
+                self.store.update(waiting)
+                self.store.remove(job)
+                continue
+            self._enqueue(job)
+            self._ids = itertools.count(job.job_id + 1)
+        if self._waiting:
+            _LOGGER.info("Restored %s generation jobs", len(self._waiting))
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = DEFAULT_STOP_TIMEOUT):
+        """Stop workers once running jobs finish, cancel jobs still running after timeout.
+
+        Waiting jobs are kept in durable store and run after restart. In-memory store would lose
+        them, so they are run before workers stop.
+        Args:
+            timeout: seconds jobs are waited for
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        # wake idle workers, so they see queue is stopping
+        for _ in self._tasks:
+            self._ready.release()
+        _, running = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if running:
+            _LOGGER.warning("Cancelled %s generation jobs still running on stop", len(running))
+        if self._waiting and not self.store.durable:
+            _LOGGER.warning("%s queued generation jobs are lost on stop", len(self._waiting))
+        for user_id in list(self._finished):
+            self._finish_user(user_id)
+
+    def close(self):
+        """Free resources."""
+        self.store.close()
+
+    def metrics(self) -> dict:
+        """Return queue depth and counters."""
+        return {
+            "pending": len(self._pending),
+            "deferred": len(self._deferred),
+            "running": len(self._running),
+            "idle_workers": self.idle_workers,
+            "merged": self.merged,
+            "rejected": self.rejected,
+            "processed": self.processed,
+        }
+
+
+def create_generation_queue(
+    workers: int,
+    max_size: int = DEFAULT_GENERATION_QUEUE_SIZE,
+    max_merged_messages: int = DEFAULT_MAX_MERGED_MESSAGES,
+    path: str | None = None,
+) -> GenerationQueue:
+    """Create generation queue, persistent if path to SQLite file is given.
+
+    Args:
+        workers: number of jobs run at the same time
+        max_size: max number of waiting jobs
+        max_merged_messages: max number of messages merged into one job
+        path: path to SQLite database file, None keeps jobs only in memory
+    """
+    store = SqliteJobStore(path) if path else None
+    return GenerationQueue(workers, max_size, max_merged_messages, store)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import tempfile
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+
+from telegram import Update
+
+from tg.constants import HISTORY_EMPTY, MAX_TEXT_LENGTH
+
+DOCUMENT_FILENAME = "history.txt"
+PREFETCH_CHUNKS = 2
+
+
+def format_message(message: dict) -> str:
+    """Return line of history export.
+
+    Args:
+        message: context message from chatbot API
+    """
+    return f"{message['role']} : {message['context']}"
+
+
+def split_text(text: str, max_length: int) -> Iterator[str]:
+    """Split text longer than max_length, preferring line breaks and spaces.
+
+    Args:
+        text: text to split
+        max_length: max length of part
+    """
+    while len(text) > max_length:
+        cut = text.rfind("\n", 0, max_length + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, max_length + 1)
+        if cut <= 0:
+            cut = max_length
+        yield text[:cut]
+        text = text[cut:].lstrip("\n ")
+    if text:
+        yield text
+
+
+async def iter_history_chunks(
+    messages: AsyncIterable[dict], max_length: int = MAX_TEXT_LENGTH
+) -> AsyncIterator[str]:
+    """Group history messages into texts not longer than max_length, split on message boundaries.
+
+    Args:
+        messages: context messages
+        max_length: max length of text
+    """
+    lines: list[str] = []
+    length = 0
+    async for message in messages:
+        for part in split_text(format_message(message), max_length):
+            added = len(part) + 1 if lines else len(part)
+            if lines and length + added > max_length:
+                yield "\n".join(lines)
+                lines, length, added = [], 0, len(part)
+            lines.append(part)
+            length += added
+    if lines:
+        yield "\n".join(lines)
+
+
+async def prefetch(items: AsyncIterable, size: int) -> AsyncIterator:
+    """Iterate items in background keeping at most size items ready.
+
+    Args:
+        items: async iterable to prefetch
+        size: max number of ready items
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+    end = object()
+
+    async def produce():
+        try:
+            async for item in items:
+                await queue.put((item, None))
+            await queue.put((end, None))
+        except Exception as error:  # pylint: disable=broad-except
+            await queue.put((end, error))
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        producer.cancel()
+
+
+async def send_history(
+    update: Update, messages: AsyncIterable[dict], max_length: int = MAX_TEXT_LENGTH
+) -> int:
+    """Send history as text messages while next pages are fetched, return number of messages.
+
+    Args:
+        update: bot update class
+        messages: context messages
+        max_length: max length of one telegram message
+    """
+    sent = 0
+    async for chunk in prefetch(iter_history_chunks(messages, max_length), PREFETCH_CHUNKS):
+        await update.message.reply_text(chunk)
+        sent += 1
+    if not sent:
+        await update.message.reply_text(HISTORY_EMPTY)
+    return sent
+
+
+async def send_history_document(update: Update, messages: AsyncIterable[dict]) -> int:
+    """Send history as text file written to disk page by page, return its size in bytes.
+
+    Args:
+        update: bot update class
+        messages: context messages
+    """
+    with tempfile.TemporaryFile() as file:
+        async for message in messages:
+            file.write(format_message(message).encode() + b"\n")
+        size = file.tell()
+        if not size:
+            await update.message.reply_text(HISTORY_EMPTY)
+            return 0
+        file.seek(0)
+        await update.message.reply_document(document=file, filename=DOCUMENT_FILENAME)
+    return size
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import signal
+from collections.abc import Mapping
+from string import Template
+from typing import TYPE_CHECKING, Protocol
+
+import httpx
+from telegram.request import BaseRequest, HTTPXRequest
+
+from api.AsyncChatBotAPI import DEFAULT_POOL_SIZE, create_client
+from metrics.registry import REGISTRY, LabeledRegistry, Registry, flatten
+from tg.bot import TELEGRAM_POOL_SIZE, TgBot
+from tg.telegram_request import SharedRequest
+from tg.update_processor import DEFAULT_MAX_CONCURRENT_UPDATES, FairSlots
+
+if TYPE_CHECKING:
+    from tg.metrics_server import MetricsServer
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_INTERVAL = 30.0
+# replaced with bot name in config values, e.g. "/data/{bot}/users.db"
+BOT_PLACEHOLDER = "{bot}"
+# settings naming local files, two bots writing one file would mix their users
+LOCAL_FILE_SETTINGS = (
+    "USER_REGISTRY_PATH",
+    "CALLBACK_STORE_PATH",
+    "GENERATION_QUEUE_PATH",
+    "FEEDBACK_LOG_PATH",
+)
+
+
+class BotFactory(Protocol):
+    """Create bot from its settings using resources shared by bots of host."""
+
+    def __call__(
+        self,
+        settings: Mapping[str, str],
+        metrics: Registry,
+        request: BaseRequest,
+        chat_api_client: httpx.AsyncClient,
+        shared_slots: FairSlots,
+    ) -> TgBot:
+        ...
+
+
+def load_config(path: str, environ: Mapping[str, str] | None = None) -> dict[str, dict[str, str]]:
+    """Read settings of bots from JSON config file and return them by bot name.
+
+    Settings of every bot are under "bots" and settings common to all of them under "defaults".
+    Names of settings are names of environment variables of single bot process, environment is
+    used for settings missing in file. Values may reference environment as $NAME, e.g. to keep
+    tokens out of file, {bot} in them is replaced with bot name.
+    Args:
+        path: path to config file
+        environ: environment variables, os.environ if None
+
+    Raises:
+        ValueError: config is invalid or two bots share token or local file
+    """
+    if environ is None:
+        environ = os.environ
+    with open(path, encoding="utf-8") as config_file:
+        config = json.load(config_file)
+    defaults = config.get("defaults", {})
+    bots: dict[str, dict[str, str]] = {}
+    owners: dict[tuple[str, str], str] = {}
+    for name, overrides in config.get("bots", {}).items():
+        settings = dict(environ)
+        for key, value in {**defaults, **overrides}.items():
+            value = str(value).replace(BOT_PLACEHOLDER, name)
+            settings[key] = Template(value).safe_substitute(environ)
+        if not settings.get("TG_BOT_TOKEN"):
+            raise ValueError(f"bot {name} has no TG_BOT_TOKEN")
+        for key in ("TG_BOT_TOKEN",) + LOCAL_FILE_SETTINGS:
+            if not settings.get(key):
+                continue
+            owner = owners.setdefault((key, settings[key]), name)
+            if owner != name:
+                raise ValueError(f"bots {owner} and {name} have the same {key}")
+        bots[name] = settings
+    return bots
+
+
+class BotHost:
+    """Run several bots read from config file in one process and event loop.
+
+    Bots share Bot API and chatbot API connection pools, metrics endpoint and slots of concurrently
+    processed updates, which are handed out to bots in turn. Caches, local stores, rate limits and
+    circuit breakers belong to one bot, its metrics are labeled with its name. Config is read again
+    on SIGHUP and when file changes: new bots are started, removed bots are stopped and bots with
+    changed settings are restarted, other bots keep running.
+    """
+
+    # shared resources, running bots and reload state exported as metrics
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        config_path: str,
+        create_bot: BotFactory,
+        metrics: Registry | None = None,
+        metrics_server: MetricsServer | None = None,
+        reload_interval: float = DEFAULT_RELOAD_INTERVAL,
+        telegram_pool_size: int = TELEGRAM_POOL_SIZE,
+        chat_api_pool_size: int = DEFAULT_POOL_SIZE,
+        max_concurrent_updates: int = DEFAULT_MAX_CONCURRENT_UPDATES,
+    ):
+        """
+        Args:
+            config_path: path to JSON config file with settings of bots
+            create_bot: function creating bot from its settings and shared resources
+            metrics: registry recording metrics of all bots, default one if None
+            metrics_server: server of /metrics started with host
+            reload_interval: seconds between checks of config file changes, 0 reloads it only
+                on SIGHUP
+            telegram_pool_size: connections to Bot API shared by all bots
+            chat_api_pool_size: connections to chatbot APIs shared by all bots
+            max_concurrent_updates: updates processed concurrently across all bots
+        """
+        self.config_path = config_path
+        self.create_bot = create_bot
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.metrics_server = metrics_server
+        self.reload_interval = reload_interval
+        self.request = HTTPXRequest(connection_pool_size=telegram_pool_size)
+        self.chat_api_pool_size = chat_api_pool_size
+        self.shared_slots = FairSlots(max_concurrent_updates)
+        self.bots: dict[str, TgBot] = {}
+        self.settings: dict[str, dict[str, str]] = {}
+        self._bot_metrics: dict[str, LabeledRegistry] = {}
+        self._chat_api_client: httpx.AsyncClient | None = None
+        self._config_mtime: float | None = None
+        self._reload_lock: asyncio.Lock | None = None
+        self._reload_requested: asyncio.Event | None = None
+        self.reloads = 0
+        self.failed_starts = 0
+        self.metrics.add_collector("bot_host", self.collect_metrics)
+
+    def collect_metrics(self):
+        """Yield number of running bots and usage of shared update slots."""
+        yield "bot_host_bots", {}, len(self.bots)
+        yield "bot_host_reloads", {}, self.reloads
+        yield "bot_host_failed_starts", {}, self.failed_starts
+        yield from flatten("bot_host_update_slots", self.shared_slots.metrics())
+
+    async def add_bot(self, name: str, settings: Mapping[str, str]) -> bool:
+        """Create and start bot, return False if it failed to start.
+
+        Args:
+            name: unique name of bot, label of its metrics
+            settings: bot settings
+        """
+        if self._chat_api_client is None:
+            self._chat_api_client = create_client(self.chat_api_pool_size)
+        metrics = self.metrics.labeled(bot=name)
+        bot = None
+        try:
+            bot = self.create_bot(
+                settings=settings,
+                metrics=metrics,
+                request=SharedRequest(self.request, metrics=metrics),
+                chat_api_client=self._chat_api_client,
+                shared_slots=self.shared_slots,
+            )
+            await bot.start()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Bot %s failed to start", name)
+            self.failed_starts += 1
+            if bot is not None:
+                await self._stop(name, bot)
+            metrics.close()
+            return False
+        self.bots[name] = bot
+        self.settings[name] = dict(settings)
+        self._bot_metrics[name] = metrics
+        _LOGGER.info("Bot %s started", name)
+        return True
+
+    async def remove_bot(self, name: str):
+        """Stop bot after it processes received updates.
+
+        Args:
+            name: name of bot
+        """
+        bot = self.bots.pop(name, None)
+        if bot is None:
+            return
+        del self.settings[name]
+        await self._stop(name, bot)
+        self._bot_metrics.pop(name).close()
+        _LOGGER.info("Bot %s stopped", name)
+
+    @staticmethod
+    async def _stop(name: str, bot: TgBot):
+        try:
+            await bot.stop()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Bot %s failed to stop", name)
+
+    async def reload(self):
+        """Read config file and start, stop or restart bots to match it.
+
+        Config which fails to load is reported and running bots are kept. Bots which failed to
+        start are started again on next reload.
+        """
+        async with self._reload_lock:
+            try:
+                self._config_mtime = os.stat(self.config_path).st_mtime
+                config = load_config(self.config_path)
+            except (OSError, ValueError) as error:
+                _LOGGER.error("Bot config %s is not loaded: %s", self.config_path, error)
+                return
+            self.reloads += 1
+            changed = [
+                name for name, settings in self.settings.items() if config.get(name) != settings
+            ]
+            await asyncio.gather(*(self.remove_bot(name) for name in changed))
+            await asyncio.gather(
+                *(
+                    self.add_bot(name, settings)
+                    for name, settings in config.items()
+                    if name not in self.bots
+                )
+            )
+
+    def request_reload(self):
+        """Reload config soon, used as SIGHUP handler."""
+        if self._reload_requested is not None:
+            self._reload_requested.set()
+
+    def _config_changed(self) -> bool:
+        try:
+            return os.stat(self.config_path).st_mtime != self._config_mtime
+        except OSError:
+            return False
+
+    async def _watch(self):
+        """Reload config when it is requested or config file changes."""
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._reload_requested.wait(), timeout=self.reload_interval or None
+                )
+            except asyncio.TimeoutError:
+                if not self._config_changed():
+                    continue
+            self._reload_requested.clear()
+            await self.reload()
+
+    async def serve(self, stop_event: asyncio.Event):
+        """Run bots until stop event, then stop all of them and close shared connection pools.
+
+        Args:
+            stop_event: event signaling shutdown
+        """
+        self._reload_lock = asyncio.Lock()
+        self._reload_requested = asyncio.Event()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        await self.reload()
+        watch = asyncio.create_task(self._watch())
+        try:
+            await stop_event.wait()
+        finally:
+            watch.cancel()
+            await asyncio.gather(watch, return_exceptions=True)
+            await asyncio.gather(*(self.remove_bot(name) for name in list(self.bots)))
+            await self.request.shutdown()
+            if self._chat_api_client is not None:
+                await self._chat_api_client.aclose()
+            if self.metrics_server is not None:
+                await self.metrics_server.stop()
+
+    def run(self):
+        """Run bots until SIGINT or SIGTERM, SIGHUP reloads config."""
+        loop = asyncio.get_event_loop()
+        stop_event = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop_event.set)
+        loop.add_signal_handler(signal.SIGHUP, self.request_reload)
+        loop.run_until_complete(self.serve(stop_event))
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+DEFAULT_IDLE_TIMEOUT = 60.0
+DEFAULT_DRAIN_TIMEOUT = 30.0
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+@dataclass
+class Request:
+    """Parsed http request."""
+
+    method: str
+    path: str
+    query: dict
+    headers: dict
+    body: bytes
+
+
+@dataclass
+class Response:
+    """Http response."""
+
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict = field(default_factory=dict)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    """Minimal asyncio HTTP/1.1 server with keep-alive and graceful drain.
+
+    Only requests with Content-Length body are supported, that is enough for telegram webhooks and
+    metrics scraping.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        """
+        Args:
+            host: address to listen on
+            port: port to listen on, 0 picks free port
+            max_body_size: max size of request body in bytes
+            idle_timeout: seconds idle keep-alive connection is kept open
+        """
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        self.idle_timeout = idle_timeout
+        self.routes: dict[tuple[str, str], Handler] = {}
+        self.in_flight = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: set[asyncio.Task] = set()
+        self._idle: set[asyncio.Task] = set()
+        self._draining = False
+        self._drained: asyncio.Event | None = None
+
+    def add_route(self, method: str, path: str, handler: Handler):
+        """Register handler of requests with given method and path.
+
+        Args:
+            method: http method
+            path: url path
+            handler: coroutine function returning response
+        """
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        """Start listening."""
+        self._draining = False
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Stop accepting connections, wait for requests in progress and close connections.
+
+        Args:
+            drain_timeout: max seconds to wait for requests in progress
+        """
+        if self._server is None:
+            return
+        self._draining = True
+        self._server.close()
+        await self._server.wait_closed()
+        for task in list(self._idle):
+            task.cancel()
+        try:
+            await asyncio.wait_for(self._drained.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            _LOGGER.warning("%d requests were not finished in time", self.in_flight)
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests of one connection."""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while not self._draining:
+                request = await self._next_request(reader, task)
+                if request is None:
+                    break
+                if not await self._respond(writer, request):
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _next_request(
+        self, reader: asyncio.StreamReader, task: asyncio.Task
+    ) -> Request | Response | None:
+        """Wait for next request of connection, None if connection is closed or idle too long."""
+        self._idle.add(task)
+        try:
+            return await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+        except (
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            ConnectionError,
+            asyncio.CancelledError,
+        ):
+            return None
+        except (asyncio.LimitOverrunError, ValueError):
+            # line longer than stream limit
+            return Response(400)
+        finally:
+            self._idle.discard(task)
+
+    async def _respond(self, writer: asyncio.StreamWriter, request: Request | Response) -> bool:
+        """Send response to request, return False if connection should be closed."""
+        if isinstance(request, Response):
+            await self._write(writer, request, keep_alive=False)
+            return False
+        keep_alive = request.headers.get("connection", "").lower() != "close"
+        response = await self._handle(request)
+        await self._write(writer, response, keep_alive=keep_alive and not self._draining)
+        return keep_alive
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """Return request, error response for malformed request or None on closed connection."""
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return Response(400)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in {b"\r\n", b"\n", b""}:
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            return Response(411)
+        content_length = headers.get("content-length") or "0"
+        if not (content_length.isascii() and content_length.isdigit()):
+            return Response(400)
+        length = int(content_length)
+        if length > self.max_body_size:
+            return Response(413)
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return Request(method.upper(), url.path, parse_qs(url.query), headers, body)
+
+    async def _handle(self, request: Request) -> Response:
+        """Call route handler counting request as in flight."""
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response(405)
+            return Response(404)
+
+        self.in_flight += 1
+        self._drained.clear()
+        try:
+            return await handler(request)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error while handling %s %s", request.method, request.path)
+            return Response(500)
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._drained.set()
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        """Send response."""
+        reason = REASONS.get(response.status, "")
+        head = [
+            f"HTTP/1.1 {response.status} {reason}",
+            f"Content-Type: {response.content_type}",
+            f"Content-Length: {len(response.body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head += [f"{name}: {value}" for name, value in response.headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body)
+        await writer.drain()
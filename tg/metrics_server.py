@@ -0,0 +1,104 @@
+import asyncio
+import io
+import logging
+import os
+
+from metrics.registry import Registry
+from tg.http_server import DEFAULT_DRAIN_TIMEOUT, HttpServer, Request, Response
+
+_LOGGER = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_METRICS_LISTEN = "127.0.0.1"
+DEFAULT_PROFILE_SECONDS = 10.0
+MAX_PROFILE_SECONDS = 300.0
+PROFILE_STATS_LINES = 60
+
+
+class MetricsServer:
+    """Serve /metrics in Prometheus text format and optional /debug/profile.
+
+    /debug/profile?seconds=10&sort=cumulative runs cProfile on the event loop thread for given
+    time and returns pstats report. It is disabled unless profiling is enabled, py-spy can be
+    attached to pid reported in bot_process_pid metric without it.
+    """
+
+    def __init__(
+        self,
+        registry: Registry,
+        port: int,
+        listen: str = DEFAULT_METRICS_LISTEN,
+        profiling: bool = False,
+    ):
+        """
+        Args:
+            registry: metrics to serve
+            port: port to listen on
+            listen: address to listen on, keep it local or behind auth
+            profiling: enable /debug/profile
+        """
+        self.registry = registry
+        self.server = HttpServer(listen, port)
+        self.server.add_route("GET", "/metrics", self.handle_metrics)
+        self.profiling = profiling
+        self._profile_running = False
+        if profiling:
+            self.server.add_route("GET", "/debug/profile", self.handle_profile)
+        registry.add_collector("process", lambda: [("bot_process_pid", {}, os.getpid())])
+
+    async def handle_metrics(self, request: Request) -> Response:
+        # pylint: disable=unused-argument
+        """Return rendered metrics.
+
+        Args:
+            request: http request
+        """
+        return Response(200, self.registry.render().encode(), PROMETHEUS_CONTENT_TYPE)
+
+    async def handle_profile(self, request: Request) -> Response:
+        """Profile event loop thread and return pstats report.
+
+        Args:
+            request: http request with optional seconds and sort query parameters
+        """
+        try:
+            seconds = float(request.query.get("seconds", [DEFAULT_PROFILE_SECONDS])[0])
+        except ValueError:
+            return Response(400)
+        seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+        sort = request.query.get("sort", ["cumulative"])[0]
+        if self._profile_running:
+            return Response(503, b"profiling is already running\n")
+
+        # profiler is imported only when used, most processes never need it
+        import cProfile  # pylint: disable=import-outside-toplevel
+        import pstats  # pylint: disable=import-outside-toplevel
+
+        self._profile_running = True
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            self._profile_running = False
+
+        report = io.StringIO()
+        try:
+            pstats.Stats(profile, stream=report).sort_stats(sort).print_stats(PROFILE_STATS_LINES)
+        except KeyError:
+            return Response(400, f"unknown sort key {sort}\n".encode())
+        return Response(200, report.getvalue().encode())
+
+    async def start(self):
+        """Start listening."""
+        await self.server.start()
+        _LOGGER.info("Metrics are served on %s:%s/metrics", self.server.host, self.server.port)
+
+    async def stop(self, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Stop listening.
+
+        Args:
+            drain_timeout: max seconds to wait for requests in progress
+        """
+        await self.server.stop(drain_timeout)
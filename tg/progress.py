@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from telegram import Bot
+from telegram.constants import ChatAction
+from telegram.error import TelegramError
+
+from tg.constants import WAITING_FOR_RESPONSE
+
+_LOGGER = logging.getLogger(__name__)
+
+# telegram shows chat action for 5 seconds or until bot sends message
+DEFAULT_TYPING_INTERVAL = 4.5
+DEFAULT_PLACEHOLDER_DELAY = 8.0
+
+
+class ProgressIndicator:
+    """Show that answer is being prepared while block is running.
+
+    Typing chat action is refreshed by background task, placeholder message is sent only if block
+    runs longer than placeholder_delay and is always deleted on exit.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int,
+        placeholder_delay: float | None = DEFAULT_PLACEHOLDER_DELAY,
+        typing_interval: float = DEFAULT_TYPING_INTERVAL,
+        placeholder_text: str = WAITING_FOR_RESPONSE,
+    ):
+        """
+        Args:
+            bot: telegram bot
+            chat_id: chat to show progress in
+            placeholder_delay: seconds before placeholder message is sent, None disables it
+            typing_interval: seconds between typing chat actions
+            placeholder_text: text of placeholder message
+        """
+        self.bot = bot
+        self.chat_id = chat_id
+        self.placeholder_delay = placeholder_delay
+        self.typing_interval = typing_interval
+        self.placeholder_text = placeholder_text
+        self._task: asyncio.Task | None = None
+        self._placeholder: asyncio.Future | None = None
+
+    async def __aenter__(self) -> ProgressIndicator:
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _run(self):
+        """Send typing actions and placeholder when it is due."""
+        placeholder_at = None
+        if self.placeholder_delay is not None:
+            placeholder_at = time.monotonic() + self.placeholder_delay
+        next_typing = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= next_typing:
+                await self._send_typing()
+                next_typing = time.monotonic() + self.typing_interval
+            if placeholder_at is not None and time.monotonic() >= placeholder_at:
+                placeholder_at = None
+                await self._send_placeholder()
+            wake_at = next_typing if placeholder_at is None else min(next_typing, placeholder_at)
+            await asyncio.sleep(max(0.0, wake_at - time.monotonic()))
+
+    async def _send_typing(self):
+        try:
+            await self.bot.send_chat_action(chat_id=self.chat_id, action=ChatAction.TYPING)
+        except TelegramError as error:
+            _LOGGER.debug("Typing action failed: %s", error)
+
+    async def _send_placeholder(self):
+        # sending is not cancelled together with typing task, stop deletes message which was sent
+        # while task was being cancelled
+        self._placeholder = asyncio.ensure_future(
+            self.bot.send_message(chat_id=self.chat_id, text=self.placeholder_text)
+        )
+        await asyncio.wait({self._placeholder})
+
+    @property
+    def placeholder_id(self) -> int | None:
+        """Id of sent placeholder message, None if it is not sent (yet)."""
+        placeholder = self._placeholder
+        if placeholder is None or not placeholder.done() or placeholder.exception() is not None:
+            return None
+        return placeholder.result().message_id
+
+    async def stop(self):
+        """Stop typing actions and delete placeholder, safe to call several times.
+
+        Cancellation of caller is not suppressed, placeholder is deleted before it is re-raised.
+        """
+        task, self._task = self._task, None
+        try:
+            if task is not None:
+                task.cancel()
+                # unlike awaiting task, wait raises CancelledError only if caller is cancelled
+                await asyncio.wait({task})
+                if not task.cancelled():
+                    task.result()
+        finally:
+            await self._delete_placeholder()
+
+    async def _delete_placeholder(self):
+        placeholder, self._placeholder = self._placeholder, None
+        if placeholder is None:
+            return
+        try:
+            placeholder_id = (await placeholder).message_id
+        except TelegramError as error:
+            _LOGGER.debug("Placeholder failed: %s", error)
+            return
+        try:
+            await self.bot.delete_message(chat_id=self.chat_id, message_id=placeholder_id)
+        except TelegramError as error:
+            _LOGGER.warning("Placeholder %s was not deleted: %s", placeholder_id, error)
@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Coroutine
+from typing import Any, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import Histogram
+
+# Telegram limits: ~30 messages per second overall, ~1 per second in one chat with short bursts
+# allowed, 20 per minute in groups
+DEFAULT_GLOBAL_RATE = 30.0
+DEFAULT_CHAT_RATE = 1.0
+DEFAULT_CHAT_BURST = 10
+DEFAULT_GROUP_RATE = 20 / 60
+DEFAULT_MAX_RETRIES = 2
+DELETED_HISTORY_SIZE = 10_000
+MAX_IDLE_CHAT_BUCKETS = 10_000
+
+JSONResult = Union[bool, dict[str, Any], list[dict[str, Any]]]
+
+
+class TokenBucket:
+    """Token bucket, waiters are served one by one in order of arrival."""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: tokens added per second
+            capacity: max number of tokens, size of allowed burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def is_idle(self) -> bool:
+        """Check bucket is full and nobody waits for it, so it can be forgotten."""
+        self._refill(time.monotonic())
+        return not self._lock.locked() and self.tokens >= self.capacity
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Stop giving tokens for given time, used when telegram asks to retry after.
+
+        Args:
+            seconds: pause duration
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class TelegramRateLimiter(BaseRateLimiter[int]):
+    """Outbound scheduler of bot API requests.
+
+    Requests wait for tokens of their chat bucket and of global bucket. While waiting, redundant
+    requests are dropped: repeated deletes of one message, edits of deleted messages and edits
+    replaced by newer edit of the same message. Concurrent deletes in one chat are merged into one
+    deleteMessages call. rate_limit_args overrides number of retries after RetryAfter error.
+    """
+
+    # counters and state of dropped and merged requests
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        global_rate: float = DEFAULT_GLOBAL_RATE,
+        chat_rate: float = DEFAULT_CHAT_RATE,
+        chat_burst: int = DEFAULT_CHAT_BURST,
+        group_rate: float = DEFAULT_GROUP_RATE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        bulk_delete: bool = True,
+    ):
+        """
+        Args:
+            global_rate: requests per second for whole bot
+            chat_rate: requests per second in private chat
+            chat_burst: requests allowed at once in one chat
+            group_rate: requests per second in group chat
+            max_retries: times request is repeated after RetryAfter error
+            bulk_delete: merge concurrent deletes of one chat into deleteMessages call
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.bulk_delete = bulk_delete
+        self.queue_latency = Histogram()
+        self.sent = 0
+        self.dropped = 0
+        self.merged = 0
+        self.retries = 0
+        self._global: TokenBucket | None = None
+        self._chats: dict[str, TokenBucket] = {}
+        self._edits: dict[tuple, int] = {}
+        self._deleting: dict[tuple, asyncio.Future] = {}
+        self._deleted: OrderedDict = OrderedDict()
+        self._delete_batches: dict[str, list] = {}
+        self._delete_tasks: set[asyncio.Task] = set()
+
+    async def initialize(self) -> None:
+        """Create global bucket inside running loop."""
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+
+    async def shutdown(self) -> None:
+        """Forget chat state."""
+        self._chats.clear()
+        self._edits.clear()
+        self._deleted.clear()
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_IDLE_CHAT_BUCKETS:
+                self._chats = {
+                    key: chat for key, chat in self._chats.items() if not chat.is_idle()
+                }
+            if chat_id.startswith("-"):
+                bucket = TokenBucket(self.group_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id: str | None):
+        """Wait for chat and global tokens."""
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+        await self._global.acquire()
+
+    def _remember_deleted(self, key: tuple):
+        self._deleted[key] = True
+        while len(self._deleted) > DELETED_HISTORY_SIZE:
+            self._deleted.popitem(last=False)
+
+    async def _call(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: dict[str, Any],
+        chat_id: str | None,
+        max_retries: int,
+    ) -> JSONResult:
+        """Send request, repeating it after pause if telegram asks to retry after."""
+        attempt = 0
+        while True:
+            try:
+                self.sent += 1
+                return await callback(*args, **kwargs)
+            except RetryAfter as error:
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else self._global
+                bucket.pause(error.retry_after)
+                await self._acquire(chat_id)
+
+    async def _delete(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        kwargs: dict[str, Any],
+        chat_id: str,
+        message_id: str,
+        max_retries: int,
+        started: float,
+    ) -> JSONResult:
+        """Delete message, merging it with other deletes waiting in the same chat."""
+        key = (chat_id, message_id)
+        if key in self._deleted:
+            self.dropped += 1
+            return True
+        if key in self._deleting:
+            self.dropped += 1
+            return await asyncio.shield(self._deleting[key])
+
+        self._deleting[key] = asyncio.get_running_loop().create_future()
+        if self.bulk_delete:
+            batch = self._delete_batches.setdefault(chat_id, [])
+            batch.append(message_id)
+            if len(batch) > 1:
+                return await asyncio.shield(self._deleting[key])
+
+        # first delete in chat leads the batch, others join it until tokens are acquired; batch
+        # is sent by its own task, so cancelled leader does not cancel deletes joined to it
+        task = asyncio.create_task(
+            self._send_deletes(callback, kwargs, chat_id, message_id, max_retries, started)
+        )
+        self._delete_tasks.add(task)
+        task.add_done_callback(self._delete_tasks.discard)
+        return await asyncio.shield(self._deleting[key])
+
+    async def _send_deletes(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        kwargs: dict[str, Any],
+        chat_id: str,
+        message_id: str,
+        max_retries: int,
+        started: float,
+    ):
+        """Send delete of batch leader and deletes joined to it, pass result to all of them."""
+        message_ids = [message_id]
+        batched = False
+        try:
+            await asyncio.sleep(0)
+            await self._acquire(chat_id)
+            if self.bulk_delete:
+                message_ids = self._delete_batches.pop(chat_id)
+                batched = True
+            self.queue_latency.observe(time.monotonic() - started)
+            result = await self._call(
+                callback, self._delete_request(chat_id, message_ids), kwargs, chat_id, max_retries
+            )
+        except BaseException as error:
+            if self.bulk_delete and not batched:
+                message_ids = self._delete_batches.pop(chat_id, message_ids)
+            self._resolve_deletes(chat_id, message_ids, error=error)
+            if not isinstance(error, Exception):
+                raise
+            return
+        self._resolve_deletes(chat_id, message_ids, result=result)
+
+    def _delete_request(self, chat_id: str, message_ids: list) -> tuple[str, dict[str, Any]]:
+        """Return Bot API method and data deleting messages, counting merged deletes."""
+        if len(message_ids) == 1:
+            return "deleteMessage", {"chat_id": chat_id, "message_id": message_ids[0]}
+        self.merged += len(message_ids) - 1
+        return "deleteMessages", {"chat_id": chat_id, "message_ids": [int(i) for i in message_ids]}
+
+    def _resolve_deletes(
+        self,
+        chat_id: str,
+        message_ids: list,
+        result: JSONResult = True,
+        error: BaseException | None = None,
+    ):
+        """Pass result of delete request to all deletes merged into it."""
+        for message_id in message_ids:
+            if error is None:
+                self._remember_deleted((chat_id, message_id))
+            waiter = self._deleting.pop((chat_id, message_id))
+            if error is None:
+                waiter.set_result(result)
+            elif isinstance(error, asyncio.CancelledError):
+                waiter.cancel()
+            else:
+                waiter.set_exception(error)
+                # mark error as retrieved, cancelled callers do not await their futures
+                waiter.exception()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> JSONResult:
+        """Schedule bot API request.
+
+        Args:
+            callback: coroutine function sending request
+            args: positional arguments of callback
+            kwargs: keyword arguments of callback
+            endpoint: bot API method
+            data: parameters of bot API method
+            rate_limit_args: number of retries after RetryAfter error
+        """
+        started = time.monotonic()
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        chat_id = str(data["chat_id"]) if data.get("chat_id") is not None else None
+        message_id = str(data["message_id"]) if data.get("message_id") is not None else None
+
+        if endpoint == "deleteMessage" and chat_id is not None and message_id is not None:
+            return await self._delete(callback, kwargs, chat_id, message_id, max_retries, started)
+
+        if endpoint == "editMessageText" and chat_id is not None and message_id is not None:
+            key = (chat_id, message_id)
+            if key in self._deleted or key in self._deleting:
+                self.dropped += 1
+                return True
+            version = self._edits.get(key, 0) + 1
+            self._edits[key] = version
+            try:
+                await self._acquire(chat_id)
+            finally:
+                # latest edit forgets its version also when it is cancelled while waiting
+                outdated = self._edits.get(key) != version
+                if not outdated:
+                    del self._edits[key]
+            if outdated or key in self._deleted or key in self._deleting:
+                self.dropped += 1
+                return True
+        else:
+            await self._acquire(chat_id)
+
+        self.queue_latency.observe(time.monotonic() - started)
+        return await self._call(callback, args, kwargs, chat_id, max_retries)
+
+    def metrics(self) -> dict:
+        """Return counters and send queue latency summary."""
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "merged": self.merged,
+            "retries": self.retries,
+            "queue_latency": self.queue_latency.snapshot(),
+        }
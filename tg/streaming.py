@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from telegram import Message, Update
+from telegram.error import BadRequest, TelegramError
+
+from api.AsyncChatBotAPI import GenerationChunk
+from tg.constants import NUMBERS, VARIANT_TEMPLATE
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_EDIT_INTERVAL = 1.0
+
+
+class StreamingReply:
+    """Variant messages progressively edited while answer is generated.
+
+    Edits are coalesced: chunks only update local buffers and one background task flushes
+    changed messages at most once per edit interval, so telegram rate limits are respected no
+    matter how fast tokens arrive.
+    """
+
+    def __init__(self, update: Update, edit_interval: float = DEFAULT_EDIT_INTERVAL):
+        """
+        Args:
+            update: bot update with user message
+            edit_interval: min seconds between edits of variant messages
+        """
+        self.update = update
+        self.edit_interval = edit_interval
+        self.buffers: list[str] = []
+        self.messages: list[Message] = []
+        self.sent_texts: list[str] = []
+        self._flush_task: asyncio.Task | None = None
+        self._last_flush = 0.0
+
+    @staticmethod
+    def format(answer: str, index: int) -> str:
+        """Return text of variant message.
+
+        Args:
+            answer: generated answer
+            index: index of variant
+        """
+        return VARIANT_TEMPLATE.format(number=NUMBERS[index], answer=answer)
+
+    @property
+    def message_ids(self) -> list[int]:
+        """Ids of variant messages in order of variants."""
+        return [message.message_id for message in self.messages]
+
+    async def _send_missing(self, index: int):
+        """Send messages of variants up to index, keeping message order equal to variants order."""
+        while len(self.messages) <= index:
+            text = self.format(self.buffers[len(self.messages)], len(self.messages))
+            message = await self.update.message.reply_text(text)
+            self.messages.append(message)
+            self.sent_texts.append(text)
+            self._last_flush = time.monotonic()
+
+    def _changed(self, index: int) -> bool:
+        """Check variant text differs from sent one, ignoring whitespace telegram strips."""
+        return self.format(self.buffers[index], index).strip() != self.sent_texts[index].strip()
+
+    async def _edit(self, index: int):
+        """Edit variant message if its text changed since last edit.
+
+        Failed edit is logged and retried with next flush, so one rejected edit does not stop
+        streaming of other variants.
+        """
+        if not self._changed(index):
+            return
+        text = self.format(self.buffers[index], index)
+        try:
+            await self.messages[index].edit_text(text)
+        except BadRequest as error:
+            if "not modified" not in error.message:
+                _LOGGER.warning("Variant message %s is not edited: %s", index, error)
+                return
+        except TelegramError as error:
+            _LOGGER.warning("Variant message %s is not edited: %s", index, error)
+            return
+        self.sent_texts[index] = text
+
+    async def _flush(self):
+        """Edit all changed messages."""
+        self._last_flush = time.monotonic()
+        for index in range(len(self.messages)):
+            await self._edit(index)
+
+    def _is_dirty(self) -> bool:
+        """Check some sent message is behind its buffer."""
+        return any(self._changed(index) for index in range(len(self.messages)))
+
+    async def _flush_loop(self):
+        """Flush changes at most once per edit interval until messages are up to date."""
+        try:
+            while True:
+                delay = self._last_flush + self.edit_interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._flush()
+                if not self._is_dirty():
+                    break
+        finally:
+            self._flush_task = None
+
+    async def add_chunk(self, chunk: GenerationChunk):
+        """Append generated text to variant.
+
+        Args:
+            chunk: generated part of answer
+        """
+        if chunk.index >= len(NUMBERS):
+            return
+        while len(self.buffers) <= chunk.index:
+            self.buffers.append("")
+        self.buffers[chunk.index] += chunk.text
+
+        if chunk.index >= len(self.messages):
+            await self._send_missing(chunk.index)
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def finish(self, answers: list[str]) -> list[int]:
+        """Replace streamed text with final answers and return ids of variant messages.
+
+        Args:
+            answers: whole generated answers
+        """
+        await self.cancel()
+        answers = answers[: len(NUMBERS)]
+        self.buffers = list(answers) + self.buffers[len(answers) :]
+        if answers:
+            await self._send_missing(len(answers) - 1)
+        for index in range(len(answers)):
+            await self._edit(index)
+        return self.message_ids[: len(answers)]
+
+    async def cancel(self):
+        """Stop pending edits."""
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            # edits are best effort, their failure must not fail the answer
+            (result,) = await asyncio.gather(task, return_exceptions=True)
+            if isinstance(result, Exception):
+                _LOGGER.warning("Streaming edits failed: %r", result)
+
+    async def delete(self):
+        """Stop pending edits and remove already sent variant messages."""
+        await self.cancel()
+        for message in self.messages:
+            await message.delete()
+        self.messages = []
+        self.sent_texts = []
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from collections.abc import Awaitable
+from typing import TYPE_CHECKING
+
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+from metrics.registry import REGISTRY, Registry
+
+if TYPE_CHECKING:
+    from telegram._utils.types import ODVInput
+
+
+async def _track(
+    metrics: Registry, url: str, request: Awaitable[tuple[int, bytes]]
+) -> tuple[int, bytes]:
+    """Await Bot API request recording it by method name."""
+    # url ends with Bot API method, token in the middle is never recorded
+    endpoint = url.rsplit("/", 1)[-1]
+    with metrics.track("telegram_request", method=endpoint):
+        code, payload = await request
+    if code >= 400:
+        metrics.inc("telegram_request_errors_total", method=endpoint)
+    return code, payload
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest measuring every Bot API call by method name.
+
+    Records telegram_request_seconds, telegram_request_in_flight and
+    telegram_request_errors_total, answers with status >= 400 count as errors.
+    """
+
+    def __init__(self, *args, metrics: Registry | None = None, **kwargs):
+        """
+        Args:
+            args: HTTPXRequest arguments
+            metrics: registry to record to, default one if None
+            kwargs: HTTPXRequest arguments
+        """
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics if metrics is not None else REGISTRY
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: ODVInput[float] = None,
+        write_timeout: ODVInput[float] = None,
+        connect_timeout: ODVInput[float] = None,
+        pool_timeout: ODVInput[float] = None,
+    ) -> tuple[int, bytes]:
+        request = super().do_request(
+            url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+        )
+        return await _track(self.metrics, url, request)
+
+
+class SharedRequest(BaseRequest):
+    """Bot API request of one bot sent through connection pool shared by several bots.
+
+    Pool is closed by its owner, bot shutting down leaves it open for other bots. Calls are
+    recorded like InstrumentedRequest does.
+    """
+
+    def __init__(self, pool: HTTPXRequest, metrics: Registry | None = None):
+        """
+        Args:
+            pool: request with shared connection pool
+            metrics: registry to record to, default one if None
+        """
+        self.pool = pool
+        self.metrics = metrics if metrics is not None else REGISTRY
+
+    async def initialize(self) -> None:
+        """Open shared pool unless it is open already."""
+        await self.pool.initialize()
+
+    async def shutdown(self) -> None:
+        """Keep shared pool open."""
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: ODVInput[float] = None,
+        write_timeout: ODVInput[float] = None,
+        connect_timeout: ODVInput[float] = None,
+        pool_timeout: ODVInput[float] = None,
+    ) -> tuple[int, bytes]:
+        request = self.pool.do_request(
+            url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+        )
+        return await _track(self.metrics, url, request)
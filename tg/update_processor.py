@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections import deque
+from collections.abc import Awaitable, Hashable
+from typing import Any
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+DEFAULT_MAX_CONCURRENT_UPDATES = 64
+DEFAULT_MAX_CONCURRENT_UPDATES_PER_USER = 1
+DEFAULT_MAX_PENDING_UPDATES = 1024
+
+
+class FairSlots:
+    """Slots shared by several owners, e.g. bots of one process, handed out in round robin.
+
+    When all slots are taken, released slot goes to next owner having waiters, so owner with long
+    queue does not delay owners with few updates.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: number of slots
+        """
+        if capacity < 1:
+            raise ValueError("`capacity` must be a positive integer!")
+        self.capacity = capacity
+        self.in_use = 0
+        # owners are kept in order they get next slot in
+        self._waiters: dict[Hashable, deque[asyncio.Future]] = {}
+
+    async def acquire(self, owner: Hashable):
+        """Wait for free slot.
+
+        Args:
+            owner: owner waiting for slot
+        """
+        if self.in_use < self.capacity:
+            self.in_use += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(owner, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # slot was handed over right before cancellation
+                self.release()
+            raise
+
+    def release(self):
+        """Hand slot over to next owner in line or free it."""
+        while self._waiters:
+            owner, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            del self._waiters[owner]
+            if waiters:
+                self._waiters[owner] = waiters
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+    def waiting(self, owner: Hashable) -> int:
+        """Return number of waiters of owner.
+
+        Args:
+            owner: owner of waiters
+        """
+        return sum(not waiter.done() for waiter in self._waiters.get(owner, ()))
+
+    def metrics(self) -> dict:
+        """Return slots usage."""
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": sum(self.waiting(owner) for owner in self._waiters),
+        }
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different users concurrently, keeping order of updates of one user.
+
+    Updates of one user wait for a per user slot first and only then take a global slot, so a
+    user sending many messages at once does not occupy global slots needed by other users.
+    Bots sharing one process also take one of shared slots, they are handed out fairly between
+    bots.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int = DEFAULT_MAX_CONCURRENT_UPDATES,
+        max_concurrent_updates_per_user: int = DEFAULT_MAX_CONCURRENT_UPDATES_PER_USER,
+        max_pending_updates: int = DEFAULT_MAX_PENDING_UPDATES,
+        shared_slots: FairSlots | None = None,
+    ):
+        """
+        Args:
+            max_concurrent_updates: number of updates processed at the same time
+            max_concurrent_updates_per_user: number of updates of one user processed at the same
+                time, 1 keeps strict ordering inside user conversation
+            max_pending_updates: number of updates accepted for processing (running + waiting)
+            shared_slots: slots shared with other bots of process, None if bot runs alone
+        """
+        if max_concurrent_updates_per_user < 1:
+            raise ValueError("`max_concurrent_updates_per_user` must be a positive integer!")
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_running_updates = max_concurrent_updates
+        self.max_concurrent_updates_per_user = max_concurrent_updates_per_user
+        self._running_semaphore = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.shared_slots = shared_slots
+        self._user_slots: dict[Hashable, asyncio.Lock | asyncio.Semaphore] = {}
+        self._user_pending: dict[Hashable, int] = {}
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+
+    @staticmethod
+    def get_update_key(update: object) -> Hashable | None:
+        """Return key of conversation the update belongs to, None if it has no owner.
+
+        Args:
+            update: telegram update
+        """
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    def _acquire_user_slot(self, key: Hashable) -> asyncio.Lock | asyncio.Semaphore:
+        """Return slot of user and count update as pending."""
+        slot = self._user_slots.get(key)
+        if slot is None:
+            # Lock is FIFO fair, so it keeps strict ordering of user updates
+            if self.max_concurrent_updates_per_user == 1:
+                slot = asyncio.Lock()
+            else:
+                slot = asyncio.Semaphore(self.max_concurrent_updates_per_user)
+            self._user_slots[key] = slot
+        self._user_pending[key] = self._user_pending.get(key, 0) + 1
+        return slot
+
+    def _release_user_slot(self, key: Hashable):
+        """Count update as done and forget user when nothing is pending."""
+        self._user_pending[key] -= 1
+        if not self._user_pending[key]:
+            del self._user_pending[key]
+            del self._user_slots[key]
+
+    async def _enter_slots(self, slots: contextlib.AsyncExitStack, key: Hashable | None):
+        """Wait for user slot, global slot and shared slot, they are released by exit stack."""
+        if key is not None:
+            user_slot = self._acquire_user_slot(key)
+            slots.callback(self._release_user_slot, key)
+            await slots.enter_async_context(user_slot)
+        await slots.enter_async_context(self._running_semaphore)
+        if self.shared_slots is not None:
+            await self.shared_slots.acquire(self)
+            slots.callback(self.shared_slots.release)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Process update after previous updates of the same user.
+
+        Update is counted as queued until it holds user slot and global slot, also when it is
+        cancelled while waiting for them.
+        Args:
+            update: telegram update
+            coroutine: handlers coroutine
+        """
+        key = self.get_update_key(update)
+        async with contextlib.AsyncExitStack() as slots:
+            self.waiting += 1
+            try:
+                await self._enter_slots(slots, key)
+            finally:
+                self.waiting -= 1
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
+
+    def metrics(self) -> dict:
+        """Return queue depth metrics."""
+        return {
+            "running": self.running,
+            "queued": self.waiting,
+            "users": len(self._user_pending),
+            "max_user_queue_depth": max(self._user_pending.values(), default=0),
+            "processed": self.processed,
+        }
+
+    async def initialize(self) -> None:
+        """Nothing to initialize."""
+
+    async def shutdown(self) -> None:
+        """Nothing to free."""
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+DEFAULT_REGISTRY_SIZE = 10_000
+DEFAULT_MEMORY_TTL = 60 * 60 * 24
+DEFAULT_DISK_TTL = 60 * 60 * 24 * 30
+
+
+class UserRegistry(ABC):
+    """Cache of users already created in chatbot API."""
+
+    @abstractmethod
+    def contains(self, telegram_user_id: str) -> bool:
+        """Check user is known.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+
+    @abstractmethod
+    def add(self, telegram_user_id: str):
+        """Remember user.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+
+    @abstractmethod
+    def discard(self, telegram_user_id: str):
+        """Forget user.
+
+        Args:
+            telegram_user_id: id of user in telegram
+        """
+
+    def close(self):
+        """Free resources."""
+
+    def __contains__(self, telegram_user_id: str) -> bool:
+        return self.contains(telegram_user_id)
+
+
+class MemoryUserRegistry(UserRegistry):
+    """In-memory registry with LRU eviction and TTL expiry."""
+
+    def __init__(self, max_size: int = DEFAULT_REGISTRY_SIZE, ttl: float = DEFAULT_MEMORY_TTL):
+        """
+        Args:
+            max_size: max number of remembered users
+            ttl: seconds after which user is checked again
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users: OrderedDict[str, float] = OrderedDict()
+
+    def contains(self, telegram_user_id: str) -> bool:
+        expire_at = self._users.get(telegram_user_id)
+        if expire_at is None:
+            return False
+        if expire_at < time.monotonic():
+            del self._users[telegram_user_id]
+            return False
+        self._users.move_to_end(telegram_user_id)
+        return True
+
+    def add(self, telegram_user_id: str):
+        self._users[telegram_user_id] = time.monotonic() + self.ttl
+        self._users.move_to_end(telegram_user_id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def discard(self, telegram_user_id: str):
+        self._users.pop(telegram_user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+class SqliteUserRegistry(UserRegistry):
+    """Registry stored in local SQLite file, survives bot restarts."""
+
+    def __init__(self, path: str, ttl: float = DEFAULT_DISK_TTL):
+        """
+        Args:
+            path: path to SQLite database file
+            ttl: seconds after which user is checked again
+        """
+        self.path = path
+        self.ttl = ttl
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, added_at REAL NOT NULL)"
+        )
+        self._connection.execute("DELETE FROM users WHERE added_at < ?", (self._expired_before(),))
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl
+
+    def contains(self, telegram_user_id: str) -> bool:
+        row = self._connection.execute(
+            "SELECT 1 FROM users WHERE user_id = ? AND added_at >= ?",
+            (telegram_user_id, self._expired_before()),
+        ).fetchone()
+        return row is not None
+
+    def add(self, telegram_user_id: str):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO users (user_id, added_at) VALUES (?, ?)",
+            (telegram_user_id, time.time()),
+        )
+
+    def discard(self, telegram_user_id: str):
+        self._connection.execute("DELETE FROM users WHERE user_id = ?", (telegram_user_id,))
+
+    def close(self):
+        self._connection.close()
+
+
+class TieredUserRegistry(UserRegistry):
+    """Memory registry in front of optional disk registry."""
+
+    def __init__(self, memory: MemoryUserRegistry, disk: UserRegistry | None = None):
+        """
+        Args:
+            memory: fast in-memory tier
+            disk: persistent tier, checked on memory miss
+        """
+        self.memory = memory
+        self.disk = disk
+
+    def contains(self, telegram_user_id: str) -> bool:
+        if self.memory.contains(telegram_user_id):
+            return True
+        if self.disk is not None and self.disk.contains(telegram_user_id):
+            self.memory.add(telegram_user_id)
+            return True
+        return False
+
+    def add(self, telegram_user_id: str):
+        self.memory.add(telegram_user_id)
+        if self.disk is not None:
+            self.disk.add(telegram_user_id)
+
+    def discard(self, telegram_user_id: str):
+        self.memory.discard(telegram_user_id)
+        if self.disk is not None:
+            self.disk.discard(telegram_user_id)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+def create_user_registry(
+    path: str | None = None,
+    max_size: int = DEFAULT_REGISTRY_SIZE,
+    memory_ttl: float = DEFAULT_MEMORY_TTL,
+    disk_ttl: float = DEFAULT_DISK_TTL,
+) -> TieredUserRegistry:
+    """Create user registry, persistent if path to SQLite file is given.
+
+    Args:
+        path: path to SQLite database file, None keeps users only in memory
+        max_size: max number of users kept in memory
+        memory_ttl: seconds user is trusted in memory
+        disk_ttl: seconds user is trusted on disk
+    """
+    disk = SqliteUserRegistry(path, ttl=disk_ttl) if path else None
+    return TieredUserRegistry(MemoryUserRegistry(max_size=max_size, ttl=memory_ttl), disk)
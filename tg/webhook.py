@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+
+from telegram import Update
+from telegram.ext import Application
+
+from tg.http_server import DEFAULT_DRAIN_TIMEOUT, HttpServer, Request, Response
+
+_LOGGER = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+DEFAULT_WEBHOOK_PATH = "/telegram"
+DEFAULT_MAX_CONNECTIONS = 40
+
+
+class WebhookServer:
+    """Receive updates from telegram webhook and pass them to application update queue.
+
+    Updates are acknowledged as soon as they are queued, handlers run later in update processor.
+    """
+
+    def __init__(
+        self,
+        app: Application,
+        listen: str,
+        port: int,
+        url_path: str = DEFAULT_WEBHOOK_PATH,
+        secret_token: str | None = None,
+    ):
+        """
+        Args:
+            app: bot application
+            listen: address to listen on
+            port: port to listen on
+            url_path: path telegram posts updates to
+            secret_token: value of secret token header telegram must send
+        """
+        self.app = app
+        self.url_path = url_path
+        self.secret_token = secret_token
+        self.received = 0
+        self.rejected = 0
+        self.server = HttpServer(listen, port)
+        self.server.add_route("POST", url_path, self.handle_update)
+
+    async def handle_update(self, request: Request) -> Response:
+        """Validate secret token and queue update.
+
+        Args:
+            request: http request from telegram
+        """
+        if self.secret_token is not None:
+            token = request.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+                self.rejected += 1
+                return Response(403)
+        try:
+            update = Update.de_json(json.loads(request.body), self.app.bot)
+        except (ValueError, KeyError, TypeError):
+            self.rejected += 1
+            return Response(400)
+        if update is None:
+            self.rejected += 1
+            return Response(400)
+        self.received += 1
+        await self.app.update_queue.put(update)
+        return Response(200)
+
+    async def start(
+        self,
+        webhook_url: str | None = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        drop_pending_updates: bool = False,
+    ):
+        """Start http server and register webhook in telegram if url is given.
+
+        Args:
+            webhook_url: public url of url_path, None keeps webhook registered by other replica
+            max_connections: max number of connections telegram opens to webhook
+            drop_pending_updates: drop updates telegram stored while bot was down
+        """
+        await self.server.start()
+        _LOGGER.info(
+            "Webhook is listening on %s:%s%s", self.server.host, self.server.port, self.url_path
+        )
+        if webhook_url:
+            await self.app.bot.set_webhook(
+                url=webhook_url,
+                secret_token=self.secret_token,
+                max_connections=max_connections,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending_updates,
+            )
+
+    async def stop(self, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Stop accepting updates and wait for requests in progress.
+
+        Args:
+            drain_timeout: max seconds to wait for requests in progress
+        """
+        await self.server.stop(drain_timeout)
+
+    def metrics(self) -> dict:
+        """Return counters of received updates."""
+        return {"received": self.received, "rejected": self.rejected}